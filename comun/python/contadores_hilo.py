@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contadores por hilo, sin contención, compartidos por los servidores
+'contador += 1' sobre un atributo compartido pierde incrementos entre hilos,
+y protegido con un lock hace que todas las peticiones compitan por él. Aquí
+cada hilo suma en su propio fragmento (nadie más lo escribe, no hace falta
+lock) y la lectura, que es rara, agrega los de todos los hilos. Los
+fragmentos de hilos terminados se pliegan en uno solo al leer y, para que un
+servidor con un hilo por conexión que nadie lee no los acumule, también cuando
+la lista duplica su tamaño: registrar un hilo cuesta O(1) amortizado
+"""
+
+import threading
+
+PLEGADO_MINIMO = 64  # fragmentos registrados antes del primer plegado fuera de una lectura
+
+
+class FragmentosPorHilo:
+    """
+    Un fragmento por hilo creado con crear(); sumar(destino, origen) pliega un
+    fragmento en otro y debe tolerar que el dueño de 'origen' siga escribiendo
+    """
+
+    def __init__(self, crear, sumar):
+        self.crear = crear
+        self.sumar = sumar
+        self._local = threading.local()
+        self._fragmentos = []  # (hilo, fragmento) de cada hilo vivo que escribió algo
+        self._retirado = crear()  # suma de los fragmentos de hilos terminados
+        self._proximo_plegado = PLEGADO_MINIMO  # tamaño de la lista que dispara el siguiente plegado
+        self._lock = threading.Lock()  # solo para registrar fragmentos y leer
+
+    def propio(self):
+        """El fragmento del hilo actual; solo la primera vez toma el lock"""
+        try:
+            return self._local.fragmento
+        except AttributeError:
+            fragmento = self._local.fragmento = self.crear()
+            with self._lock:
+                self._fragmentos.append((threading.current_thread(), fragmento))
+                if len(self._fragmentos) >= self._proximo_plegado:
+                    self._plegar_terminados()
+            return fragmento
+
+    def _plegar_terminados(self):
+        vivos = []
+        for hilo, fragmento in self._fragmentos:
+            if hilo.is_alive():
+                vivos.append((hilo, fragmento))
+            else:
+                self.sumar(self._retirado, fragmento)
+        self._fragmentos = vivos
+        self._proximo_plegado = max(PLEGADO_MINIMO, 2 * len(vivos))
+
+    def consolidar(self):
+        """Un fragmento nuevo con la suma de todos; puede no incluir los incrementos en curso"""
+        total = self.crear()
+        with self._lock:
+            self._plegar_terminados()
+            self.sumar(total, self._retirado)
+            for _, fragmento in self._fragmentos:
+                self.sumar(total, fragmento)
+        return total
+
+
+def _sumar_cuentas(destino, origen):
+    # dict() copia de una vez: el dueño puede seguir sumando mientras tanto
+    for clave, cuenta in dict(origen).items():
+        destino[clave] = destino.get(clave, 0) + cuenta
+
+
+class ContadoresOperaciones:
+    """Cuenta las llamadas por método; incrementar no toma ningún lock compartido"""
+
+    def __init__(self):
+        self._fragmentos = FragmentosPorHilo(dict, _sumar_cuentas)
+
+    def incrementar(self, metodo, cantidad=1):
+        fragmento = self._fragmentos.propio()
+        fragmento[metodo] = fragmento.get(metodo, 0) + cantidad
+
+    def por_metodo(self):
+        """{método: llamadas} sumando todos los hilos"""
+        return dict(sorted(self._fragmentos.consolidar().items()))
+
+    def total(self):
+        return sum(self.por_metodo().values())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro (log) asíncrono compartido por los servidores de chat y RPC
+Quien registra solo agrega una tupla a una cola; un hilo de fondo da formato
+a los registros y los escribe por lotes, con una sola escritura por lote.
+Así un terminal lento o una tubería llena nunca frenan a quien atiende
+peticiones. Se puede filtrar por nivel y muestrear los registros frecuentes
+(por ejemplo, 1 de cada 1000 llamadas exitosas)
+"""
+
+import atexit
+import collections
+import itertools
+import sys
+import threading
+import time
+
+# Niveles
+DEPURACION = 10
+INFO = 20
+AVISO = 30
+ERROR = 40
+NIVELES = {"depuracion": DEPURACION, "info": INFO, "aviso": AVISO, "error": ERROR}
+_ETIQUETAS = {DEPURACION: "DEPURACIÓN", AVISO: "AVISO", ERROR: "ERROR"}
+
+CAPACIDAD_POR_DEFECTO = 100000  # registros pendientes antes de descartar
+INTERVALO_ESCRITURA = 0.05  # segundos entre lotes
+
+
+class RegistroAsincrono:
+    """Cola de registros vaciada por un hilo escritor; registrar nunca bloquea"""
+
+    def __init__(self, nivel=INFO, muestreo=1, salida=None,
+                 capacidad=CAPACIDAD_POR_DEFECTO, intervalo=INTERVALO_ESCRITURA):
+        self.nivel = nivel
+        self.muestreo = max(1, muestreo)
+        self.salida = salida
+        self.capacidad = capacidad
+        self.intervalo = intervalo
+        self.descartados = 0
+        self._pendientes = collections.deque()
+        self._contadores_muestreo = {}  # formato -> contador, para muestrear cada tipo por separado
+        self._hilo = None
+        self._lock_inicio = threading.Lock()
+        self._vaciado = threading.Lock()  # un solo vaciado a la vez (hilo escritor o cierre)
+
+    def configurar(self, nivel=None, muestreo=None):
+        if nivel is not None:
+            self.nivel = nivel
+        if muestreo is not None:
+            self.muestreo = max(1, muestreo)
+
+    def registrar(self, nivel, formato, *argumentos):
+        """Encola un registro; el formato (formato % argumentos) se aplica en el hilo escritor"""
+        if nivel < self.nivel:
+            return
+        if len(self._pendientes) >= self.capacidad:
+            # Mejor perder registros que frenar al servidor
+            self.descartados += 1
+            return
+        self._pendientes.append((time.time(), nivel, formato, argumentos))
+        if self._hilo is None:
+            self._iniciar()
+
+    def depuracion(self, formato, *argumentos):
+        self.registrar(DEPURACION, formato, *argumentos)
+
+    def info(self, formato, *argumentos):
+        self.registrar(INFO, formato, *argumentos)
+
+    def info_muestreado(self, formato, *argumentos):
+        """Registro frecuente (p. ej. una llamada exitosa): solo se guarda 1 de cada 'muestreo'"""
+        if self.muestreo > 1:
+            contador = self._contadores_muestreo.get(formato)
+            if contador is None:
+                contador = self._contadores_muestreo.setdefault(formato, itertools.count())
+            if next(contador) % self.muestreo:
+                return
+        self.registrar(INFO, formato, *argumentos)
+
+    def aviso(self, formato, *argumentos):
+        self.registrar(AVISO, formato, *argumentos)
+
+    def error(self, formato, *argumentos):
+        self.registrar(ERROR, formato, *argumentos)
+
+    def _iniciar(self):
+        with self._lock_inicio:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._escribir_continuamente, daemon=True)
+                self._hilo.start()
+                atexit.register(self.vaciar)
+
+    def _escribir_continuamente(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.vaciar()
+            except Exception as e:
+                # El hilo escritor no debe morir: sin él nadie vuelve a escribir un registro
+                print(f"Registro asíncrono: error al escribir un lote: {e!r}", file=sys.__stderr__, flush=True)
+
+    def vaciar(self):
+        """Da formato a todo lo pendiente y lo escribe de una vez"""
+        with self._vaciado:
+            lineas = []
+            while self._pendientes:
+                marca, nivel, formato, argumentos = self._pendientes.popleft()
+                try:
+                    lineas.append(self._formatear(marca, nivel, formato, argumentos))
+                except Exception as e:
+                    # Un registro que no se puede formatear se informa y el resto del lote sigue
+                    lineas.append(self._formatear(marca, ERROR, "Registro no representable (%s): %r",
+                                                  (type(e).__name__, str(formato))))
+            if self.descartados:
+                descartados, self.descartados = self.descartados, 0
+                lineas.append(self._formatear(time.time(), AVISO, "%d registros descartados (cola llena)",
+                                              (descartados,)))
+            if not lineas:
+                return
+            salida = self.salida or sys.stdout
+            try:
+                salida.write("\n".join(lineas) + "\n")
+                salida.flush()
+            except (OSError, ValueError):
+                pass  # salida cerrada: no hay dónde informar
+
+    @staticmethod
+    def _formatear(marca, nivel, formato, argumentos):
+        hora = time.strftime("%H:%M:%S", time.localtime(marca))
+        try:
+            texto = formato % argumentos if argumentos else formato
+        except (TypeError, ValueError):
+            try:
+                texto = f"{formato} {argumentos}"
+            except ValueError:
+                # p. ej. un entero con más dígitos de los que str() acepta convertir
+                texto = f"{formato} (argumentos no representables)"
+        etiqueta = _ETIQUETAS.get(nivel)
+        return f"[{hora}] {etiqueta}: {texto}" if etiqueta else f"[{hora}] {texto}"
+
+
+# Registro del proceso; cada servidor lo configura al arrancar
+registro = RegistroAsincrono()
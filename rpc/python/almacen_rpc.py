@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Almacenes para los resultados guardados por guardar_resultado
+AlmacenMemoria es el diccionario de siempre. AlmacenWAL lo hace persistente
+sin tocar las lecturas, que siguen saliendo del diccionario en memoria. Cada
+escritura se agrega a un log (write-ahead log) que un hilo escritor vuelca en
+lotes con un solo fsync por lote (group commit): las llamadas concurrentes
+comparten la espera del disco. Cada tanto se escribe una instantánea con todo
+el contenido y se borran los segmentos del log que ya cubre; al arrancar se
+carga la última instantánea y se reaplica solo lo que vino después, cortando
+la cola incompleta que haya dejado una caída a mitad de escritura
+"""
+
+import atexit
+import bisect
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+from registro_asincrono import registro
+
+REGISTROS_INSTANTANEA = 10_000  # escrituras en el log entre instantáneas
+LONGITUD_MAXIMA_CLAVE = 0xFFFF  # bytes UTF-8; la longitud va en 16 bits
+SUFIJO_LOG = ".wal"
+SUFIJO_INSTANTANEA = ".snap"
+SUFIJO_TEMPORAL = ".tmp"
+
+# crc32, longitud de la clave, valor; sigue la clave en UTF-8. El crc cubre todo lo que sigue
+_CABECERA = struct.Struct("<IHd")
+
+try:
+    _sincronizar = os.fdatasync
+except AttributeError:
+    _sincronizar = os.fsync
+
+
+def codificar_registro(clave, valor):
+    clave = clave.encode("utf-8")
+    if len(clave) > LONGITUD_MAXIMA_CLAVE:
+        raise ValueError(f"Clave demasiado larga ({len(clave)} bytes; máximo {LONGITUD_MAXIMA_CLAVE})")
+    resto = _CABECERA.pack(0, len(clave), valor)[4:] + clave
+    return struct.pack("<I", zlib.crc32(resto)) + resto
+
+
+def leer_registros(datos):
+    """Genera (fin, clave, valor) de cada registro; se detiene en el primero incompleto o dañado"""
+    posicion = 0
+    total = len(datos)
+    while posicion + _CABECERA.size <= total:
+        crc, longitud_clave, valor = _CABECERA.unpack_from(datos, posicion)
+        fin = posicion + _CABECERA.size + longitud_clave
+        if fin > total or zlib.crc32(datos[posicion + 4:fin]) != crc:
+            return
+        yield fin, datos[posicion + _CABECERA.size:fin].decode("utf-8"), valor
+        posicion = fin
+
+
+class AlmacenMemoria:
+    """
+    Diccionario {clave: valor} protegido por un lock (el pool de hilos corre
+    métodos a la vez) y la lista ordenada de las claves, para listar por
+    prefijo y por páginas con bisect sin copiar todas las claves
+    """
+
+    def __init__(self):
+        self._datos = {}
+        self._ordenadas = []  # las claves nunca se borran: solo hace falta insertar
+        self._lock = threading.Lock()
+
+    def _poner(self, clave, valor):
+        """Con el lock tomado"""
+        if clave not in self._datos:
+            bisect.insort(self._ordenadas, clave)
+        self._datos[clave] = valor
+
+    def sembrar(self, valores):
+        """Agrega los valores iniciales que falten, sin pisar los guardados"""
+        with self._lock:
+            for clave, valor in valores.items():
+                if clave not in self._datos:
+                    self._poner(clave, valor)
+
+    def guardar(self, clave, valor):
+        with self._lock:
+            self._poner(clave, valor)
+
+    def guardar_varios(self, valores):
+        """Guarda todos los pares {clave: valor} de una vez"""
+        with self._lock:
+            for clave, valor in valores.items():
+                self._poner(clave, valor)
+
+    def obtener(self, clave):
+        """El valor de la clave, o None"""
+        with self._lock:
+            return self._datos.get(clave)
+
+    def obtener_varios(self, claves):
+        """{clave: valor} de las claves que existen"""
+        with self._lock:
+            return {clave: self._datos[clave] for clave in claves if clave in self._datos}
+
+    def claves(self, prefijo="", cursor="", limite=0):
+        """
+        Claves en orden que empiezan con 'prefijo' y son mayores que 'cursor'
+        (la última de la página anterior); como mucho 'limite' (0 = todas)
+        """
+        with self._lock:
+            inicio = bisect.bisect_left(self._ordenadas, prefijo)
+            if cursor:
+                inicio = max(inicio, bisect.bisect_right(self._ordenadas, cursor))
+            if not prefijo:
+                return self._ordenadas[inicio:inicio + limite] if limite else self._ordenadas[inicio:]
+            # Las claves con el prefijo son contiguas en el orden
+            fin = min(inicio + limite, len(self._ordenadas)) if limite else len(self._ordenadas)
+            pagina = []
+            for indice in range(inicio, fin):
+                clave = self._ordenadas[indice]
+                if not clave.startswith(prefijo):
+                    break
+                pagina.append(clave)
+            return pagina
+
+    def __len__(self):
+        return len(self._datos)
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenWAL(AlmacenMemoria):
+    """
+    Segmentos NNNNNNNNNN.wal e instantáneas NNNNNNNNNN.snap en un directorio; la
+    instantánea N contiene todo lo escrito en los segmentos anteriores a N.
+    Con esperar_disco=False guardar no espera el fsync: más rápido, pero una
+    caída puede perder las últimas escrituras confirmadas
+    """
+
+    def __init__(self, directorio, esperar_disco=True, registros_instantanea=REGISTROS_INSTANTANEA):
+        super().__init__()
+        self.directorio = directorio
+        self.esperar_disco = esperar_disco
+        self.registros_instantanea = registros_instantanea
+        self._cola = queue.SimpleQueue()
+        self._descriptor = None
+        self._segmento = 0
+        self._desde_instantanea = 0  # registros escritos desde la última instantánea
+        os.makedirs(directorio, exist_ok=True)
+        self._recuperar()
+        self._hilo = threading.Thread(target=self._escribir_continuamente, name="almacen-wal", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    def guardar(self, clave, valor):
+        self.guardar_varios({clave: valor})
+
+    def guardar_varios(self, valores):
+        """Todos los registros van juntos en una escritura; se espera un solo fsync"""
+        datos = b"".join(codificar_registro(clave, valor) for clave, valor in valores.items())
+        # [registros, aviso de escritura, error, cantidad de registros]
+        pendiente = [datos, threading.Event() if self.esperar_disco else None, None, len(valores)]
+        with self._lock:
+            # Se encola bajo el mismo lock: el log queda en el orden en que cambió la memoria
+            for clave, valor in valores.items():
+                self._poner(clave, valor)
+            self._cola.put(pendiente)
+        if pendiente[1] is not None:
+            pendiente[1].wait()
+            if pendiente[2] is not None:
+                raise pendiente[2]
+
+    def cerrar(self):
+        """Escribe lo pendiente, deja una instantánea y cierra; lo llama atexit"""
+        if self._hilo is None:
+            return
+        self._cola.put(None)
+        self._hilo.join()
+        self._hilo = None
+        os.close(self._descriptor)
+
+    # --- Archivos ---
+
+    def _ruta(self, numero, sufijo):
+        return os.path.join(self.directorio, f"{numero:010d}{sufijo}")
+
+    def _archivos(self, sufijo):
+        nombres = os.listdir(self.directorio)
+        return sorted(int(nombre[:-len(sufijo)]) for nombre in nombres
+                      if nombre.endswith(sufijo) and nombre[:-len(sufijo)].isdigit())
+
+    def _sincronizar_directorio(self):
+        """Las entradas nuevas, renombradas o borradas del directorio también tienen que llegar al disco"""
+        descriptor = os.open(self.directorio, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def _recuperar(self):
+        """Carga la última instantánea, reaplica los segmentos posteriores y corta la cola incompleta"""
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(SUFIJO_TEMPORAL):
+                os.remove(os.path.join(self.directorio, nombre))  # instantánea que no llegó a terminarse
+        instantaneas = self._archivos(SUFIJO_INSTANTANEA)
+        base = instantaneas[-1] if instantaneas else 0
+        if instantaneas:
+            with open(self._ruta(base, SUFIJO_INSTANTANEA), "rb") as archivo:
+                for _, clave, valor in leer_registros(archivo.read()):
+                    self._datos[clave] = valor
+        reaplicados = 0
+        segmentos = [numero for numero in self._archivos(SUFIJO_LOG) if numero >= base]
+        for numero in segmentos:
+            with open(self._ruta(numero, SUFIJO_LOG), "rb") as archivo:
+                datos = archivo.read()
+            valido = 0
+            for valido, clave, valor in leer_registros(datos):
+                self._datos[clave] = valor
+                reaplicados += 1
+            if valido < len(datos):
+                registro.aviso("Almacén: se descartan %d bytes incompletos al final de %s",
+                               len(datos) - valido, self._ruta(numero, SUFIJO_LOG))
+                with open(self._ruta(numero, SUFIJO_LOG), "r+b") as archivo:
+                    archivo.truncate(valido)
+                    _sincronizar(archivo.fileno())
+        self._segmento = segmentos[-1] if segmentos else base
+        self._descriptor = os.open(self._ruta(self._segmento, SUFIJO_LOG),
+                                   os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._sincronizar_directorio()
+        self._ordenadas = sorted(self._datos)
+        self._desde_instantanea = reaplicados
+        self._borrar_anteriores(base)
+        registro.info("Almacén: %d resultados recuperados de %s (%d escrituras del log reaplicadas)",
+                      len(self._datos), self.directorio, reaplicados)
+
+    def _borrar_anteriores(self, base):
+        """Segmentos e instantáneas que ya cubre la instantánea 'base'"""
+        for numero in self._archivos(SUFIJO_LOG):
+            if numero < base:
+                os.remove(self._ruta(numero, SUFIJO_LOG))
+        for numero in self._archivos(SUFIJO_INSTANTANEA):
+            if numero < base:
+                os.remove(self._ruta(numero, SUFIJO_INSTANTANEA))
+
+    # --- Hilo escritor ---
+
+    def _escribir_continuamente(self):
+        while True:
+            lote = [self._cola.get()]
+            while True:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            terminar = None in lote
+            pendientes = [pendiente for pendiente in lote if pendiente is not None]
+            try:
+                self._escribir_lote(pendientes)
+                if terminar or self._desde_instantanea >= self.registros_instantanea:
+                    self._escribir_instantanea()
+            except OSError as e:
+                registro.error("No se pudo escribir el almacén de resultados: %s", e)
+                for pendiente in pendientes:
+                    pendiente[2] = e
+            finally:
+                for pendiente in pendientes:
+                    if pendiente[1] is not None:
+                        pendiente[1].set()
+            if terminar:
+                return
+
+    def _escribir_lote(self, pendientes):
+        """Una escritura y un fsync para todo lo que se juntó mientras se sincronizaba el lote anterior"""
+        if not pendientes:
+            return
+        datos = memoryview(b"".join(pendiente[0] for pendiente in pendientes))
+        while datos:
+            datos = datos[os.write(self._descriptor, datos):]
+        _sincronizar(self._descriptor)
+        self._desde_instantanea += sum(pendiente[3] for pendiente in pendientes)
+
+    def _escribir_instantanea(self):
+        """
+        Pasa a un segmento nuevo N y escribe la instantánea N con el contenido en
+        memoria. Puede incluir escrituras que también van al segmento N; como
+        reaplicarlas da el mismo resultado, no importa
+        """
+        nuevo = self._segmento + 1
+        os.close(self._descriptor)
+        self._descriptor = os.open(self._ruta(nuevo, SUFIJO_LOG), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._segmento = nuevo
+        with self._lock:
+            contenido = list(self._datos.items())
+        temporal = self._ruta(nuevo, SUFIJO_INSTANTANEA + SUFIJO_TEMPORAL)
+        with open(temporal, "wb") as archivo:
+            archivo.write(b"".join(codificar_registro(clave, valor) for clave, valor in contenido))
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(temporal, self._ruta(nuevo, SUFIJO_INSTANTANEA))
+        self._sincronizar_directorio()
+        self._borrar_anteriores(nuevo)
+        self._desde_instantanea = 0
+        registro.depuracion("Almacén: instantánea %d con %d resultados", nuevo, len(contenido))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Arreglos de números empaquetados para las llamadas RPC
+En XML-RPC cada número de una lista viaja como su propio elemento <double>:
+un millón de números son cientos de MB de XML y otro tanto de trabajo al
+interpretarlo. Aquí un arreglo viaja como un único bloque binario de float64
+little-endian, ya sea xmlrpc.client.Binary o su texto en base64, y se opera
+sobre el arreglo entero: con NumPy si está instalado y con el módulo array si no
+"""
+
+import array
+import base64
+import binascii
+import math
+import sys
+import xmlrpc.client
+
+try:
+    import numpy
+except ImportError:  # NumPy es opcional
+    numpy = None
+
+from estadisticas_rpc import AcumuladorEstadisticas
+
+OPERACIONES = ("cuadrado", "doble", "negativo", "raiz")
+TAMANO_ELEMENTO = 8  # bytes de un float64
+
+
+def desempaquetar(datos):
+    """
+    Convierte un Binary, bytes o texto base64 de float64 little-endian en un
+    arreglo (numpy.ndarray o array.array('d'))
+    """
+    if isinstance(datos, xmlrpc.client.Binary):
+        datos = datos.data
+    elif isinstance(datos, str):
+        try:
+            datos = base64.b64decode(datos, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"Base64 inválido: {e}") from None
+    if len(datos) % TAMANO_ELEMENTO:
+        raise ValueError(f"El bloque tiene {len(datos)} bytes; debe ser múltiplo de {TAMANO_ELEMENTO} (float64)")
+    if numpy is not None:
+        return numpy.frombuffer(datos, dtype="<f8")
+    arreglo = array.array("d")
+    arreglo.frombytes(datos)
+    if sys.byteorder == "big":
+        arreglo.byteswap()
+    return arreglo
+
+
+def empaquetar(arreglo, como):
+    """
+    Empaqueta un arreglo o lista de números igual que vino la entrada 'como':
+    texto base64 si era texto, Binary en cualquier otro caso
+    """
+    if numpy is not None:
+        datos = numpy.asarray(arreglo, dtype="<f8").tobytes()
+    else:
+        if not isinstance(arreglo, array.array) or sys.byteorder == "big":
+            arreglo = array.array("d", arreglo)  # también acepta una lista de números
+        if sys.byteorder == "big":
+            arreglo.byteswap()
+        datos = arreglo.tobytes()
+    if isinstance(como, str):
+        return base64.b64encode(datos).decode("ascii")
+    return xmlrpc.client.Binary(datos)
+
+
+def aplicar(arreglo, operacion):
+    """Aplica la operación elemento a elemento (misma semántica que operacion_lista)"""
+    if operacion not in OPERACIONES:
+        raise ValueError(f"Operación '{operacion}' no soportada")
+    if numpy is not None:
+        if operacion == "cuadrado":
+            return numpy.square(arreglo)
+        if operacion == "doble":
+            return arreglo * 2
+        if operacion == "negativo":
+            return numpy.negative(arreglo)
+        # Los negativos dan 0, como en la versión con listas
+        return numpy.sqrt(numpy.where(arreglo >= 0, arreglo, 0.0))
+    if operacion == "cuadrado":
+        return array.array("d", [x * x for x in arreglo])
+    if operacion == "doble":
+        return array.array("d", [x * 2 for x in arreglo])
+    if operacion == "negativo":
+        return array.array("d", [-x for x in arreglo])
+    return array.array("d", [math.sqrt(x) if x >= 0 else 0.0 for x in arreglo])
+
+
+def estadisticas(arreglo, percentiles=None):
+    """Las mismas estadísticas que estadisticas_lista (ver estadisticas_rpc.py)"""
+    cantidad = len(arreglo)
+    if not cantidad:
+        raise ValueError("Arreglo vacío")
+    if numpy is None:
+        acumulador = AcumuladorEstadisticas()
+        acumulador.agregar(arreglo)
+        return acumulador.resumen(percentiles)
+    suma = float(numpy.sum(arreglo))
+    varianza = float(numpy.var(arreglo, ddof=1)) if cantidad > 1 else 0.0
+    resultado = {
+        "cantidad": cantidad,
+        "suma": suma,
+        "promedio": suma / cantidad,
+        "minimo": float(numpy.min(arreglo)),
+        "maximo": float(numpy.max(arreglo)),
+        "mediana": float(numpy.median(arreglo)),
+        "varianza": varianza,
+        "desviacion_estandar": math.sqrt(varianza),
+    }
+    if percentiles:
+        for p in percentiles:
+            if not 0 <= float(p) <= 100:
+                raise ValueError(f"Percentil {float(p):g} fuera de rango (0-100)")
+        resultado["percentiles"] = {f"{float(p):g}": float(numpy.percentile(arreglo, float(p)))
+                                    for p in percentiles}
+    return resultado
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compara operacion_lista (un <double> por número) con operacion_arreglo
+(un bloque binario de float64) contra un servidor_rpc.py en ejecución:
+tiempo por llamada y tamaño de la petición XML para varios tamaños de lista
+"""
+
+import argparse
+import math
+import random
+import time
+import xmlrpc.client
+
+import arreglos_rpc
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de listas contra arreglos empaquetados")
+    parser.add_argument("--url", default="http://localhost:8888")
+    parser.add_argument("--tamanos", default="1000,10000,100000,1000000",
+                        help="cantidades de números, separadas por comas")
+    parser.add_argument("--operacion", default="cuadrado", choices=arreglos_rpc.OPERACIONES)
+    args = parser.parse_args()
+
+    servidor = xmlrpc.client.ServerProxy(args.url)
+    print("=== BENCHMARK DE ARREGLOS RPC ===")
+    print(f"Cálculo local con {'NumPy' if arreglos_rpc.numpy is not None else 'el módulo array'}\n")
+    print(f"{'números':>9} {'lista XML':>11} {'arreglo XML':>12} {'lista s':>9} {'arreglo s':>10} {'aceleración':>12}")
+    for cantidad in (int(tamano) for tamano in args.tamanos.split(",")):
+        numeros = [random.uniform(-1000, 1000) for _ in range(cantidad)]
+        empaquetado = arreglos_rpc.empaquetar(numeros, None)
+        repeticiones = max(1, 100000 // cantidad)
+
+        bytes_lista = len(xmlrpc.client.dumps((numeros, args.operacion), "operacion_lista"))
+        bytes_arreglo = len(xmlrpc.client.dumps((empaquetado, args.operacion), "operacion_arreglo"))
+        segundos_lista, por_lista = medir(lambda: servidor.operacion_lista(numeros, args.operacion), repeticiones)
+        segundos_arreglo, por_arreglo = medir(
+            lambda: arreglos_rpc.desempaquetar(servidor.operacion_arreglo(empaquetado, args.operacion)),
+            repeticiones
+        )
+        # x*x y x**2 pueden diferir en el último bit: se compara con tolerancia
+        if not all(math.isclose(x, y, rel_tol=1e-15) for x, y in zip(por_arreglo, por_lista)):
+            raise SystemExit(f"Los resultados no coinciden para {cantidad} números")
+        print(f"{cantidad:>9} {bytes_lista / 1e6:>9.2f}MB {bytes_arreglo / 1e6:>10.2f}MB "
+              f"{segundos_lista:>9.4f} {segundos_arreglo:>10.4f} {segundos_lista / segundos_arreglo:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compara XML-RPC, JSON compacto y la codificación binaria con los métodos de
+CalculadoraRPC contra un servidor_rpc.py en ejecución (mejor con --hilos N,
+así la conexión se reutiliza): tiempo por llamada, bytes de petición más
+respuesta y el costo local de codificar y decodificar ambos mensajes
+"""
+
+import argparse
+import random
+import time
+import xmlrpc.client
+
+import codificaciones_rpc
+from cliente_rpc import ProxyCodificado, TransportePersistente
+
+CODIFICACIONES = ["xml", *codificaciones_rpc.CODIFICACIONES]
+NUMEROS = [random.uniform(-1000, 1000) for _ in range(1000)]
+LLAMADAS = [
+    ("ping", ("hola",)),
+    ("sumar", (3, 4.5)),
+    ("factorial", (20,)),
+    ("fibonacci", (90,)),
+    ("operacion_lista", (NUMEROS[:100], "cuadrado")),
+    ("estadisticas_lista", (NUMEROS,)),
+    ("obtener_info_servidor", ()),
+    ("listar_claves", ()),
+    ("system.multicall", ([{"methodName": "sumar", "params": [i, i]} for i in range(50)],)),
+]
+
+
+def bytes_y_costo(nombre, metodo, parametros, resultado, repeticiones):
+    """Bytes de petición y respuesta, y segundos por ida y vuelta de codificación local"""
+    if nombre == "xml":
+        def ida_y_vuelta():
+            peticion = xmlrpc.client.dumps(parametros, metodo, allow_none=True).encode("utf-8")
+            xmlrpc.client.loads(peticion)
+            respuesta = xmlrpc.client.dumps((resultado,), methodresponse=True, allow_none=True).encode("utf-8")
+            xmlrpc.client.loads(respuesta)
+            return len(peticion) + len(respuesta)
+    else:
+        codificacion = codificaciones_rpc.CODIFICACIONES[nombre]
+
+        def ida_y_vuelta():
+            peticion = codificacion.peticion(metodo, parametros)
+            codificacion.leer_peticion(peticion)
+            respuesta = codificacion.respuesta(resultado)
+            codificacion.leer_respuesta(respuesta)
+            return len(peticion) + len(respuesta)
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        tamano = ida_y_vuelta()
+    return tamano, (time.perf_counter() - inicio) / repeticiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de codificaciones XML, JSON y binaria")
+    parser.add_argument("--url", default="http://localhost:8888")
+    parser.add_argument("--repeticiones", type=int, default=300, help="llamadas por método y codificación")
+    args = parser.parse_args()
+
+    transporte = TransportePersistente.para_url(args.url)
+    servidores = {"xml": xmlrpc.client.ServerProxy(args.url, transport=transporte, allow_none=True)}
+    for nombre, codificacion in codificaciones_rpc.CODIFICACIONES.items():
+        servidores[nombre] = ProxyCodificado(args.url, codificacion, TransportePersistente.para_url(args.url))
+
+    print("=== BENCHMARK DE CODIFICACIONES RPC ===\n")
+    encabezado = f"{'método':<22}" + "".join(f"{nombre + ' ms':>11}{'bytes':>9}{'cpu µs':>9}" for nombre in CODIFICACIONES)
+    print(encabezado)
+    totales = {nombre: 0.0 for nombre in CODIFICACIONES}
+    for metodo, parametros in LLAMADAS:
+        fila = f"{metodo:<22}"
+        resultados = {}
+        for nombre, servidor in servidores.items():
+            llamar = servidor
+            for parte in metodo.split("."):
+                llamar = getattr(llamar, parte)
+            llamar(*parametros)  # calienta cachés y conexión
+            inicio = time.perf_counter()
+            for _ in range(args.repeticiones):
+                resultado = llamar(*parametros)
+            segundos = (time.perf_counter() - inicio) / args.repeticiones
+            totales[nombre] += segundos
+            resultados[nombre] = resultado
+            tamano, costo = bytes_y_costo(nombre, metodo, parametros, resultado, args.repeticiones)
+            fila += f"{segundos * 1e3:>11.3f}{tamano:>9}{costo * 1e6:>9.1f}"
+        # La información del servidor cambia entre llamadas (contadores, hora)
+        if metodo != "obtener_info_servidor" and any(r != resultados["xml"] for r in resultados.values()):
+            raise SystemExit(f"Las codificaciones no coinciden en {metodo}")
+        print(fila)
+    print(f"\n{'total por ronda':<22}" + "".join(f"{totales[nombre] * 1e3:>11.3f}{'':>18}" for nombre in CODIFICACIONES))
+
+
+if __name__ == "__main__":
+    main()
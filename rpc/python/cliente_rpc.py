@@ -3,28 +3,318 @@
 """
 Cliente RPC usando XML-RPC de la biblioteca estándar de Python
 Conecta al servidor RPC y consume sus servicios remotos
+Con ClienteRPC.lote() varias llamadas viajan en una sola petición (system.multicall)
+Las conexiones TCP se reutilizan entre llamadas (TransportePersistente)
+Con --codificacion json o binario las llamadas viajan en JSON compacto o en
+la codificación binaria en lugar de XML (ver codificaciones_rpc.py)
 """
 
+import argparse
+import decimal
+import http.client
+import threading
+import urllib.parse
 import xmlrpc.client
 import time
 import json
 from datetime import datetime
 
+import arreglos_rpc
+import enteros_rpc
+import codificaciones_rpc
+
+CONEXIONES_POR_DEFECTO = 4  # conexiones inactivas que guarda el pool por servidor
+TIEMPO_CONEXION = 30.0  # segundos de espera de red por llamada
+TAMANO_PAGINA = 500  # claves por página al recorrer los resultados
+
+class TransportePersistente(xmlrpc.client.Transport):
+    """
+    Transporte de ServerProxy que guarda las conexiones HTTP/1.1 para reutilizarlas
+    Cada llamada toma una conexión libre del pool (o abre una) y la devuelve al
+    terminar, así varios hilos pueden compartir el mismo ServerProxy. Si el
+    servidor ya cerró una conexión guardada, se descartan todas las guardadas
+    para ese servidor (tras un reinicio lo están todas) y la llamada se repite
+    en una nueva. ServerProxy no le pasa el esquema de la URL: para https://
+    hay que crearlo con seguro=True (ver para_url)
+    """
+    
+    def __init__(self, conexiones=CONEXIONES_POR_DEFECTO, tiempo_espera=TIEMPO_CONEXION, seguro=False,
+                 contexto=None, **opciones):
+        super().__init__(**opciones)
+        self.conexiones = conexiones
+        self.tiempo_espera = tiempo_espera
+        self.seguro = seguro
+        self.contexto = contexto  # ssl.SSLContext para https; None = el de por defecto
+        self.conexiones_abiertas = 0
+        self._libres = {}  # host -> [HTTPConnection]
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def para_url(cls, url, **opciones):
+        """Transporte para la URL: HTTPS si es https://; otros esquemas son un error"""
+        esquema = urllib.parse.urlsplit(url).scheme
+        if esquema not in ("http", "https"):
+            raise ValueError(f"Esquema no soportado: {esquema!r} (use http o https)")
+        return cls(seguro=esquema == "https", **opciones)
+    
+    def _tomar(self, host, nueva=False):
+        """Devuelve (conexión, reutilizada)"""
+        with self._lock:
+            libres = self._libres.get(host)
+            if libres and not nueva:
+                return libres.pop(), True
+            self.conexiones_abiertas += 1
+        chost, _, _ = self.get_host_info(host)
+        if self.seguro:
+            return http.client.HTTPSConnection(chost, timeout=self.tiempo_espera, context=self.contexto), False
+        return http.client.HTTPConnection(chost, timeout=self.tiempo_espera), False
+    
+    def _descartar_libres(self, host):
+        with self._lock:
+            libres = self._libres.pop(host, [])
+        for conexion in libres:
+            conexion.close()
+    
+    def _devolver(self, host, conexion, respuesta):
+        if not respuesta.will_close:
+            with self._lock:
+                libres = self._libres.setdefault(host, [])
+                if len(libres) < self.conexiones:
+                    libres.append(conexion)
+                    return
+        conexion.close()
+    
+    def request(self, host, handler, request_body, verbose=False):
+        self.verbose = verbose
+        return self._enviar(host, handler, request_body, codificaciones_rpc.TIPO_XML, self.parse_response)
+    
+    def enviar(self, host, handler, cuerpo, tipo):
+        """POST de un cuerpo de otro Content-Type (JSON, binario); devuelve el cuerpo de la respuesta"""
+        return self._enviar(host, handler, cuerpo, tipo, lambda respuesta: respuesta.read())
+    
+    def _enviar(self, host, handler, cuerpo, tipo, leer):
+        _, cabeceras_extra, _ = self.get_host_info(host)
+        cabeceras = dict(cabeceras_extra or ())
+        cabeceras.update(self._headers)
+        cabeceras.update({"Content-Type": tipo, "User-Agent": self.user_agent})
+        for intento in (0, 1):
+            conexion, reutilizada = self._tomar(host, nueva=bool(intento))
+            try:
+                conexion.request("POST", handler, cuerpo, cabeceras)
+                respuesta = conexion.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError,
+                    ConnectionAbortedError, BrokenPipeError):
+                conexion.close()
+                # Una conexión guardada que el servidor cerró (inactividad, reinicio): las demás
+                # guardadas probablemente también, así que se reintenta una vez en una nueva
+                if reutilizada and not intento:
+                    self._descartar_libres(host)
+                    continue
+                raise
+            except Exception:
+                conexion.close()
+                raise
+            if respuesta.status == 200:
+                resultado = leer(respuesta)
+                self._devolver(host, conexion, respuesta)
+                return resultado
+            respuesta.read()
+            conexion.close()
+            raise xmlrpc.client.ProtocolError(host + handler, respuesta.status, respuesta.reason,
+                                              dict(respuesta.getheaders()))
+    
+    def close(self):
+        with self._lock:
+            libres, self._libres = self._libres, {}
+        for conexiones in libres.values():
+            for conexion in conexiones:
+                conexion.close()
+
+class _MetodoRemoto:
+    """Permite escribir proxy.sumar(1, 2) o proxy.system.listMethods()"""
+    
+    def __init__(self, proxy, nombre):
+        self._proxy = proxy
+        self._nombre = nombre
+    
+    def __getattr__(self, nombre):
+        return _MetodoRemoto(self._proxy, f"{self._nombre}.{nombre}")
+    
+    def __call__(self, *parametros):
+        return self._proxy.llamar(self._nombre, parametros)
+
+class ProxyCodificado:
+    """
+    Como xmlrpc.client.ServerProxy, pero en JSON o binario: mismos métodos, mismos
+    resultados y los errores del servidor llegan como xmlrpc.client.Fault
+    """
+    
+    def __init__(self, url, codificacion, transporte):
+        partes = urllib.parse.urlsplit(url)
+        if (partes.scheme == "https") != bool(getattr(transporte, "seguro", False)):
+            raise ValueError(f"El transporte no corresponde al esquema de {url} (use TransportePersistente.para_url)")
+        self._host = partes.netloc
+        self._ruta = partes.path or "/RPC2"
+        self._codificacion = codificacion
+        self._transporte = transporte
+    
+    def __getattr__(self, nombre):
+        return _MetodoRemoto(self, nombre)
+    
+    def llamar(self, metodo, parametros):
+        peticion = self._codificacion.peticion(metodo, parametros)
+        respuesta = self._transporte.enviar(self._host, self._ruta, peticion, self._codificacion.tipo)
+        return self._codificacion.leer_respuesta(respuesta)
+
+class ResultadoLote:
+    """Resultado de una llamada encolada en un lote; se conoce cuando el lote se envía"""
+    
+    def __init__(self, metodo, parametros):
+        self.metodo = metodo
+        self.parametros = parametros
+        self.listo = False
+        self.fallo = None  # xmlrpc.client.Fault si la llamada falló en el servidor
+        self._valor = None
+    
+    def resolver(self, respuesta):
+        """respuesta es [valor] o {'faultCode': ..., 'faultString': ...}, como en system.multicall"""
+        if isinstance(respuesta, dict):
+            self.fallo = xmlrpc.client.Fault(respuesta["faultCode"], respuesta["faultString"])
+        else:
+            self._valor = respuesta[0]
+        self.listo = True
+    
+    @property
+    def valor(self):
+        """El valor devuelto; relanza el Fault de esta llamada si falló"""
+        if not self.listo:
+            raise RuntimeError(f"El lote con {self.metodo} todavía no se envió")
+        if self.fallo is not None:
+            raise self.fallo
+        return self._valor
+
+class _MetodoLote:
+    """Permite escribir lote.sumar(1, 2) o lote.system.listMethods()"""
+    
+    def __init__(self, lote, nombre):
+        self._lote = lote
+        self._nombre = nombre
+    
+    def __getattr__(self, nombre):
+        return _MetodoLote(self._lote, f"{self._nombre}.{nombre}")
+    
+    def __call__(self, *parametros):
+        return self._lote.encolar(self._nombre, *parametros)
+
+class LoteRPC:
+    """
+    Junta llamadas y las envía como system.multicall al salir del bloque 'with'
+    (o al llamar a enviar()). Cada llamada devuelve un ResultadoLote; un fallo
+    en una llamada no afecta a las demás
+    """
+    
+    def __init__(self, servidor, tamano_maximo=None):
+        self.servidor = servidor
+        self.tamano_maximo = tamano_maximo  # llamadas por petición (None = todas juntas)
+        self.peticiones = 0
+        self._pendientes = []
+    
+    def __getattr__(self, nombre):
+        return _MetodoLote(self, nombre)
+    
+    def __len__(self):
+        return len(self._pendientes)
+    
+    def encolar(self, metodo, *parametros):
+        resultado = ResultadoLote(metodo, parametros)
+        self._pendientes.append(resultado)
+        return resultado
+    
+    def enviar(self):
+        """Envía lo pendiente (en trozos de tamano_maximo) y resuelve cada resultado"""
+        pendientes, self._pendientes = self._pendientes, []
+        tamano = self.tamano_maximo or len(pendientes) or 1
+        for inicio in range(0, len(pendientes), tamano):
+            trozo = pendientes[inicio:inicio + tamano]
+            respuestas = self.servidor.system.multicall([
+                {"methodName": resultado.metodo, "params": list(resultado.parametros)} for resultado in trozo
+            ])
+            self.peticiones += 1
+            for resultado, respuesta in zip(trozo, respuestas):
+                resultado.resolver(respuesta)
+        return pendientes
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, tipo, valor, traza):
+        # Si el bloque falló no se envía nada: las llamadas quedan sin resolver
+        if tipo is None:
+            self.enviar()
+        return False
+
 class ClienteRPC:
     """Cliente para consumir servicios RPC"""
     
-    def __init__(self, url="http://localhost:8888"):
+    def __init__(self, url="http://localhost:8888", codificacion="xml"):
         self.url = url
+        self.codificacion = codificacion  # "xml", "json" o "binario"
         self.servidor = None
+        self.transporte = None
+    
+    def operacion_arreglo(self, numeros, operacion):
+        """operacion_lista con los números empaquetados en binario (una sola pieza de XML)"""
+        resultado = self.servidor.operacion_arreglo(arreglos_rpc.empaquetar(numeros, None), operacion)
+        return arreglos_rpc.desempaquetar(resultado)
+    
+    def estadisticas_arreglo(self, numeros, percentiles=None):
+        return self.servidor.estadisticas_arreglo(arreglos_rpc.empaquetar(numeros, None), percentiles)
+    
+    def estadisticas_por_bloques(self, numeros, tamano_bloque=100_000, percentiles=None):
+        """Estadísticas de una lista de cualquier tamaño, enviada en bloques empaquetados"""
+        sesion = self.servidor.abrir_sesion_estadisticas()
+        for inicio in range(0, len(numeros), tamano_bloque):
+            bloque = arreglos_rpc.empaquetar(numeros[inicio:inicio + tamano_bloque], None)
+            self.servidor.agregar_bloque_estadisticas(sesion, bloque)
+        return self.servidor.finalizar_sesion_estadisticas(sesion, percentiles)
+    
+    def factorial(self, n):
+        """n! como int de Python, sin el límite de 32 bits de XML-RPC"""
+        return enteros_rpc.decodificar(self.servidor.factorial(n, "binario"))
+    
+    def fibonacci(self, n):
+        return enteros_rpc.decodificar(self.servidor.fibonacci(n, "binario"))
+    
+    def recorrer_resultados(self, prefijo="", tamano_pagina=TAMANO_PAGINA):
+        """Genera (clave, valor) de los resultados con el prefijo: dos llamadas por página"""
+        cursor = ""
+        while True:
+            claves = self.servidor.listar_claves(prefijo, cursor, tamano_pagina)
+            valores = self.servidor.obtener_resultados(claves) if claves else {}
+            for clave in claves:
+                if clave in valores:
+                    yield clave, valores[clave]
+            if len(claves) < tamano_pagina:
+                return
+            cursor = claves[-1]
+    
+    def lote(self, tamano_maximo=None):
+        """Contexto que junta las llamadas y las envía en una sola petición (system.multicall)"""
+        return LoteRPC(self.servidor, tamano_maximo)
     
     def conectar(self):
         """Conecta al servidor RPC"""
         try:
             print("=== CLIENTE XML-RPC ===")
-            print(f"Conectando a {self.url}...")
+            print(f"Conectando a {self.url} (codificación: {self.codificacion})...")
             
-            # Crear proxy del servidor RPC
-            self.servidor = xmlrpc.client.ServerProxy(self.url)
+            # Crear proxy del servidor RPC; las conexiones se reutilizan entre llamadas
+            self.transporte = TransportePersistente.para_url(self.url)
+            if self.codificacion == "xml":
+                self.servidor = xmlrpc.client.ServerProxy(self.url, transport=self.transporte)
+            else:
+                self.servidor = ProxyCodificado(self.url, codificaciones_rpc.CODIFICACIONES[self.codificacion],
+                                                self.transporte)
             
             # Probar conexión
             respuesta_ping = self.servidor.ping("test de conexión")
@@ -94,13 +384,20 @@ class ClienteRPC:
             a = float(input("Primer número: "))
             b = float(input("Segundo número: "))
             
-            print("\nResultados (RPC):")
-            print(f"{a} + {b} = {self.servidor.sumar(a, b)}")
-            print(f"{a} - {b} = {self.servidor.restar(a, b)}")
-            print(f"{a} * {b} = {self.servidor.multiplicar(a, b)}")
+            # Las cuatro operaciones en una sola petición
+            with self.lote() as lote:
+                suma = lote.sumar(a, b)
+                resta = lote.restar(a, b)
+                producto = lote.multiplicar(a, b)
+                cociente = lote.dividir(a, b)
+            
+            print("\nResultados (RPC, una sola petición):")
+            print(f"{a} + {b} = {suma.valor}")
+            print(f"{a} - {b} = {resta.valor}")
+            print(f"{a} * {b} = {producto.valor}")
             
             try:
-                print(f"{a} / {b} = {self.servidor.dividir(a, b)}")
+                print(f"{a} / {b} = {cociente.valor}")
             except xmlrpc.client.Fault as e:
                 print(f"Error en división: {e.faultString}")
                 
@@ -137,16 +434,16 @@ class ClienteRPC:
             elif opcion == "3":
                 n = int(input("Número para factorial: "))
                 try:
-                    resultado = self.servidor.factorial(n)
-                    print(f"{n}! = {resultado}")
+                    resultado = self.servidor.factorial(n, "auto")
+                    print(f"{n}! = {self._abreviar_entero(resultado)}")
                 except xmlrpc.client.Fault as e:
                     print(f"Error: {e.faultString}")
                     
             elif opcion == "4":
                 n = int(input("Posición en Fibonacci: "))
                 try:
-                    resultado = self.servidor.fibonacci(n)
-                    print(f"F({n}) = {resultado}")
+                    resultado = self.servidor.fibonacci(n, "auto")
+                    print(f"F({n}) = {self._abreviar_entero(resultado)}")
                 except xmlrpc.client.Fault as e:
                     print(f"Error: {e.faultString}")
                     
@@ -155,6 +452,27 @@ class ClienteRPC:
         except Exception as e:
             print(f"Error RPC: {e}")
     
+    @staticmethod
+    def _abreviar_entero(resultado):
+        """
+        Los enteros de miles de dígitos se muestran por sus extremos. Los grandes
+        llegan como Binary y no se pasan enteros a decimal (tiempo cuadrático):
+        los primeros dígitos salen del logaritmo y los últimos del resto
+        """
+        valor = enteros_rpc.decodificar(resultado)
+        if valor.bit_length() <= enteros_rpc.BITS_MAXIMOS_TEXTO:
+            texto = str(valor)
+            if len(texto) <= 80:
+                return texto
+            return f"{texto[:30]}...{texto[-30:]} ({len(texto)} dígitos)"
+        desplazamiento = valor.bit_length() - 256
+        with decimal.localcontext() as contexto:
+            contexto.prec = 80
+            logaritmo = decimal.Decimal(valor >> desplazamiento).log10() + desplazamiento * decimal.Decimal(2).log10()
+            digitos = int(logaritmo) + 1
+            primeros = int(decimal.Decimal(10) ** (logaritmo - digitos + 30))
+        return f"{primeros}...{valor % 10**30:030d} ({digitos} dígitos)"
+    
     def operaciones_listas(self):
         """Operaciones con listas de números"""
         try:
@@ -199,7 +517,7 @@ class ClienteRPC:
             numeros_str = input("Ingresa números separados por comas: ")
             numeros = [float(x.strip()) for x in numeros_str.split(",")]
             
-            estadisticas = self.servidor.estadisticas_lista(numeros)
+            estadisticas = self.servidor.estadisticas_lista(numeros, [25, 75, 90])
             
             print("\nEstadísticas calculadas remotamente:")
             print(f"  Cantidad: {estadisticas['cantidad']}")
@@ -208,6 +526,9 @@ class ClienteRPC:
             print(f"  Mínimo: {estadisticas['minimo']:.2f}")
             print(f"  Máximo: {estadisticas['maximo']:.2f}")
             print(f"  Mediana: {estadisticas['mediana']:.2f}")
+            print(f"  Desviación estándar: {estadisticas['desviacion_estandar']:.2f}")
+            for percentil, valor in estadisticas["percentiles"].items():
+                print(f"  Percentil {percentil}: {valor:.2f}")
             
         except ValueError:
             print("Error: Formato de números inválido")
@@ -221,7 +542,8 @@ class ClienteRPC:
         print("\n--- GESTIÓN DE RESULTADOS ---")
         print("1. Guardar resultado")
         print("2. Recuperar resultado")
-        print("3. Listar todas las claves")
+        print("3. Listar claves (con prefijo opcional)")
+        print("4. Guardar varios resultados")
         
         try:
             opcion = input("Opción: ").strip()
@@ -242,16 +564,23 @@ class ClienteRPC:
                     print(f"Error: {e.faultString}")
                     
             elif opcion == "3":
-                claves = self.servidor.listar_claves()
-                print(f"\nClaves disponibles ({len(claves)}):")
+                prefijo = input("Prefijo (vacío = todas): ")
+                cantidad = 0
+                print("\nClaves disponibles:")
+                for clave, valor in self.recorrer_resultados(prefijo):
+                    print(f"  '{clave}' = {valor}")
+                    cantidad += 1
+                print(f"({cantidad} claves)")
+                
+            elif opcion == "4":
+                pares = input("Pares clave=valor separados por comas: ")
+                resultados = {}
+                for par in pares.split(","):
+                    clave, _, valor = par.partition("=")
+                    resultados[clave.strip()] = float(valor)
+                guardados = self.servidor.guardar_resultados(resultados)
+                print(f"¡{guardados} resultados guardados exitosamente!")
                 
-                for clave in claves:
-                    try:
-                        valor = self.servidor.obtener_resultado(clave)
-                        print(f"  '{clave}' = {valor}")
-                    except:
-                        print(f"  '{clave}' = [error al obtener valor]")
-                        
         except ValueError:
             print("Error: Valor numérico inválido")
         except xmlrpc.client.Fault as e:
@@ -269,6 +598,8 @@ class ClienteRPC:
             print(f"Nombre: {info['nombre']}")
             print(f"Tiempo de inicio: {info['tiempo_inicio']}")
             print(f"Operaciones realizadas: {info['operaciones_realizadas']}")
+            for metodo, cuenta in info.get('operaciones_por_metodo', {}).items():
+                print(f"  {metodo}: {cuenta}")
             print(f"Resultados almacenados: {info['resultados_almacenados']}")
             print(f"Hilos activos: {info['hilos_activos']}")
             print(f"Tiempo actual servidor: {info['tiempo_actual']}")
@@ -291,30 +622,48 @@ class ClienteRPC:
         try:
             print("\n--- PRUEBAS DE RENDIMIENTO ---")
             operaciones = int(input("¿Cuántas operaciones? "))
+            respuesta = input("Tamaños de lote a comparar, separados por comas (1 = sin lote) [1]: ").strip()
+            tamanos = [int(tamano) for tamano in respuesta.split(",")] if respuesta else [1]
             
-            print(f"Realizando {operaciones} sumas remotas...")
-            
-            inicio = time.time()
+            for tamano in tamanos:
+                self.medir_rendimiento(operaciones, max(tamano, 1))
             
+        except ValueError:
+            print("Error: Ingresa un número válido")
+        except Exception as e:
+            print(f"Error en prueba de rendimiento: {e}")
+    
+    def medir_rendimiento(self, operaciones, tamano_lote):
+        """N sumas remotas, de a una o en lotes de system.multicall"""
+        print(f"\nRealizando {operaciones} sumas remotas (lote: {tamano_lote})...")
+        
+        conexiones_previas = self.transporte.conexiones_abiertas
+        inicio = time.time()
+        
+        if tamano_lote == 1:
+            peticiones = operaciones
             for i in range(operaciones):
                 self.servidor.sumar(i, i + 1)
                 
                 if i > 0 and i % 50 == 0:
                     print(".", end="", flush=True)
-            
-            fin = time.time()
-            tiempo_total = fin - inicio
-            
-            print("\n\n--- RESULTADOS RENDIMIENTO ---")
-            print(f"Operaciones completadas: {operaciones}")
-            print(f"Tiempo total: {tiempo_total:.2f} segundos")
-            print(f"Tiempo promedio por operación: {(tiempo_total/operaciones)*1000:.2f} ms")
-            print(f"Operaciones por segundo: {operaciones/tiempo_total:.2f}")
-            
-        except ValueError:
-            print("Error: Ingresa un número válido")
-        except Exception as e:
-            print(f"Error en prueba de rendimiento: {e}")
+        else:
+            with self.lote(tamano_lote) as lote:
+                resultados = [lote.sumar(i, i + 1) for i in range(operaciones)]
+            peticiones = lote.peticiones
+            for i, resultado in enumerate(resultados):
+                if resultado.valor != 2 * i + 1:
+                    raise ValueError(f"Resultado inesperado para la suma {i}: {resultado.valor}")
+        
+        fin = time.time()
+        tiempo_total = fin - inicio
+        
+        print("\n--- RESULTADOS RENDIMIENTO ---")
+        print(f"Operaciones completadas: {operaciones} en {peticiones} peticiones HTTP "
+              f"({self.transporte.conexiones_abiertas - conexiones_previas} conexiones TCP nuevas)")
+        print(f"Tiempo total: {tiempo_total:.2f} segundos")
+        print(f"Tiempo promedio por operación: {(tiempo_total/operaciones)*1000:.2f} ms")
+        print(f"Operaciones por segundo: {operaciones/tiempo_total:.2f}")
     
     def introspection(self):
         """Muestra métodos disponibles usando introspection"""
@@ -346,7 +695,12 @@ class ClienteRPC:
             print(f"Error en introspection: {e}")
 
 def main():
-    cliente = ClienteRPC()
+    parser = argparse.ArgumentParser(description="Cliente XML-RPC")
+    parser.add_argument("--url", default="http://localhost:8888")
+    parser.add_argument("--codificacion", choices=["xml", *codificaciones_rpc.CODIFICACIONES], default="xml",
+                        help="codificación de las llamadas (json y binario son más compactas que XML)")
+    args = parser.parse_args()
+    cliente = ClienteRPC(args.url, args.codificacion)
     
     if cliente.conectar():
         print("\n¡Listo para realizar llamadas RPC!")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Codificaciones alternativas a XML para las llamadas a CalculadoraRPC
+El servidor elige la codificación por el Content-Type de cada petición:
+  - text/xml (o cualquier otro): XML-RPC de siempre
+  - application/json: JSON compacto
+  - application/x-rpc-binario: valores con etiqueta de tipo y longitud
+Las tres terminan en el mismo _dispatch del servidor (instancia, funciones
+registradas, introspección y system.multicall). La petición es [método,
+[parámetros]] y la respuesta [valor] o {"faultCode", "faultString"}, como
+cada resultado de system.multicall
+"""
+
+import base64
+import json
+import struct
+import sys
+import xmlrpc.client
+
+TIPO_XML = "text/xml"
+TIPO_JSON = "application/json"
+TIPO_BINARIO = "application/x-rpc-binario"
+PROFUNDIDAD_MAXIMA = 100  # listas y diccionarios anidados; más allá la petición es inválida
+
+
+class _Codificacion:
+    """Lo común: cada codificación solo sabe volcar y cargar un valor"""
+
+    def peticion(self, metodo, parametros):
+        return self.volcar([metodo, list(parametros)])
+
+    def leer_peticion(self, datos):
+        peticion = self.cargar(datos)
+        if (not isinstance(peticion, list) or len(peticion) != 2 or not isinstance(peticion[0], str)
+                or not isinstance(peticion[1], list)):
+            raise ValueError("La petición debe ser [método, [parámetros]]")
+        return peticion[0], tuple(peticion[1])
+
+    def respuesta(self, resultado):
+        return self.volcar([resultado])
+
+    def fallo(self, codigo, mensaje):
+        return self.volcar({"faultCode": codigo, "faultString": mensaje})
+
+    def leer_respuesta(self, datos):
+        """El valor devuelto; lanza xmlrpc.client.Fault si la llamada falló, igual que ServerProxy"""
+        respuesta = self.cargar(datos)
+        if isinstance(respuesta, dict):
+            raise xmlrpc.client.Fault(respuesta["faultCode"], respuesta["faultString"])
+        return respuesta[0]
+
+
+class CodificacionJSON(_Codificacion):
+    """JSON sin espacios; los Binary viajan como {"$binario": base64}"""
+
+    nombre = "json"
+    tipo = TIPO_JSON
+
+    @staticmethod
+    def _a_json(valor):
+        if isinstance(valor, xmlrpc.client.Binary):
+            return {"$binario": base64.b64encode(valor.data).decode("ascii")}
+        raise TypeError(f"Tipo no soportado en JSON: {type(valor).__name__}")
+
+    @staticmethod
+    def _de_json(objeto):
+        if len(objeto) == 1 and "$binario" in objeto:
+            return xmlrpc.client.Binary(base64.b64decode(objeto["$binario"]))
+        return objeto
+
+    def volcar(self, valor):
+        return json.dumps(valor, separators=(",", ":"), ensure_ascii=False, default=self._a_json).encode("utf-8")
+
+    def cargar(self, datos):
+        try:
+            return json.loads(datos, object_hook=self._de_json)
+        except RecursionError:
+            raise ValueError("Anidamiento demasiado profundo en el mensaje JSON") from None
+
+
+# Etiquetas de la codificación binaria; los largos y cantidades van en 32 bits little-endian
+_NULO, _VERDADERO, _FALSO = b"N", b"T", b"F"
+_ENTERO, _ENTERO_GRANDE, _REAL = b"i", b"I", b"d"
+_TEXTO, _BYTES, _LISTA, _DICCIONARIO = b"s", b"b", b"l", b"m"
+_CON_ENTERO = struct.Struct("<cq")
+_CON_REAL = struct.Struct("<cd")
+_CON_LARGO = struct.Struct("<cI")
+_LARGO = struct.Struct("<I")
+_ENTERO_64 = struct.Struct("<q")
+_REAL_64 = struct.Struct("<d")
+
+
+class CodificacionBinaria(_Codificacion):
+    """
+    Cada valor es una etiqueta de un byte seguida de su contenido: int de 64
+    bits, float64, o largo y bytes (texto UTF-8, Binary, enteros mayores).
+    Listas y diccionarios llevan la cantidad de elementos y luego los elementos,
+    anidados hasta PROFUNDIDAD_MAXIMA niveles
+    """
+
+    nombre = "binario"
+    tipo = TIPO_BINARIO
+
+    def volcar(self, valor):
+        partes = []
+        self._volcar(valor, partes)
+        return b"".join(partes)
+
+    def _volcar(self, valor, partes):
+        if valor is None:
+            partes.append(_NULO)
+        elif valor is True:
+            partes.append(_VERDADERO)
+        elif valor is False:
+            partes.append(_FALSO)
+        elif isinstance(valor, int):
+            if -2**63 <= valor < 2**63:
+                partes.append(_CON_ENTERO.pack(_ENTERO, valor))
+            else:
+                datos = valor.to_bytes((valor.bit_length() + 8) // 8, "little", signed=True)
+                partes += (_CON_LARGO.pack(_ENTERO_GRANDE, len(datos)), datos)
+        elif isinstance(valor, float):
+            partes.append(_CON_REAL.pack(_REAL, valor))
+        elif isinstance(valor, str):
+            datos = valor.encode("utf-8")
+            partes += (_CON_LARGO.pack(_TEXTO, len(datos)), datos)
+        elif isinstance(valor, (xmlrpc.client.Binary, bytes, bytearray)):
+            datos = valor.data if isinstance(valor, xmlrpc.client.Binary) else bytes(valor)
+            partes += (_CON_LARGO.pack(_BYTES, len(datos)), datos)
+        elif isinstance(valor, (list, tuple)):
+            partes.append(_CON_LARGO.pack(_LISTA, len(valor)))
+            for elemento in valor:
+                self._volcar(elemento, partes)
+        elif isinstance(valor, dict):
+            partes.append(_CON_LARGO.pack(_DICCIONARIO, len(valor)))
+            for clave, elemento in valor.items():
+                self._volcar(str(clave), partes)
+                self._volcar(elemento, partes)
+        else:
+            raise TypeError(f"Tipo no soportado en la codificación binaria: {type(valor).__name__}")
+
+    def cargar(self, datos):
+        datos = memoryview(datos)
+        valor, posicion = self._cargar(datos, 0)
+        if posicion != len(datos):
+            raise ValueError(f"Sobran {len(datos) - posicion} bytes en el mensaje binario")
+        return valor
+
+    def _cargar(self, datos, posicion, profundidad=0):
+        """Devuelve (valor, posición siguiente)"""
+        try:
+            etiqueta = bytes(datos[posicion:posicion + 1])
+            posicion += 1
+            if etiqueta == _ENTERO:
+                return _ENTERO_64.unpack_from(datos, posicion)[0], posicion + 8
+            if etiqueta == _REAL:
+                return _REAL_64.unpack_from(datos, posicion)[0], posicion + 8
+            if etiqueta == _NULO:
+                return None, posicion
+            if etiqueta == _VERDADERO:
+                return True, posicion
+            if etiqueta == _FALSO:
+                return False, posicion
+            largo = _LARGO.unpack_from(datos, posicion)[0]
+            posicion += 4
+        except struct.error:
+            raise ValueError("Mensaje binario truncado") from None
+        if etiqueta in (_LISTA, _DICCIONARIO):
+            profundidad += 1
+            if profundidad > PROFUNDIDAD_MAXIMA:
+                raise ValueError(f"Más de {PROFUNDIDAD_MAXIMA} niveles de anidamiento en el mensaje binario")
+        if etiqueta == _LISTA:
+            lista = []
+            for _ in range(largo):
+                elemento, posicion = self._cargar(datos, posicion, profundidad)
+                lista.append(elemento)
+            return lista, posicion
+        if etiqueta == _DICCIONARIO:
+            diccionario = {}
+            for _ in range(largo):
+                clave, posicion = self._cargar(datos, posicion, profundidad)
+                diccionario[clave], posicion = self._cargar(datos, posicion, profundidad)
+            return diccionario, posicion
+        fin = posicion + largo
+        if fin > len(datos):
+            raise ValueError("Mensaje binario truncado")
+        contenido = datos[posicion:fin]
+        if etiqueta == _TEXTO:
+            return str(contenido, "utf-8"), fin
+        if etiqueta == _BYTES:
+            return xmlrpc.client.Binary(bytes(contenido)), fin
+        if etiqueta == _ENTERO_GRANDE:
+            return int.from_bytes(contenido, "little", signed=True), fin
+        raise ValueError(f"Etiqueta desconocida en el mensaje binario: {etiqueta!r}")
+
+
+CODIFICACIONES = {codificacion.nombre: codificacion for codificacion in (CodificacionJSON(), CodificacionBinaria())}
+POR_TIPO = {codificacion.tipo: codificacion for codificacion in CODIFICACIONES.values()}
+
+
+class NegociacionMixIn:
+    """
+    Para manejadores SimpleXMLRPCRequestHandler: las peticiones JSON o binarias
+    se atienden aquí y el resto pasa al do_POST de XML-RPC
+    """
+
+    def do_POST(self):
+        tipo = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        codificacion = POR_TIPO.get(tipo)
+        if codificacion is None:
+            return super().do_POST()
+        if not self.is_rpc_path_valid():
+            self.report_404()
+            return
+        try:
+            metodo, parametros = codificacion.leer_peticion(self.rfile.read(int(self.headers["Content-Length"])))
+        except (TypeError, ValueError, UnicodeDecodeError, RecursionError) as e:
+            self.send_error(400, f"Petición {codificacion.nombre} inválida: {e}")
+            return
+        try:
+            respuesta = codificacion.respuesta(self.server._dispatch(metodo, parametros))
+        except xmlrpc.client.Fault as fallo:
+            respuesta = codificacion.fallo(fallo.faultCode, fallo.faultString)
+        except BaseException:
+            # Mismo texto que SimpleXMLRPCDispatcher para un error dentro del método
+            tipo_error, valor, _ = sys.exc_info()
+            respuesta = codificacion.fallo(1, f"{tipo_error}:{valor}")
+        self.send_response(200)
+        self.send_header("Content-Type", codificacion.tipo)
+        self.send_header("Content-Length", str(len(respuesta)))
+        self.end_headers()
+        self.wfile.write(respuesta)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Factorial y Fibonacci rápidos, con caché, y transporte de enteros grandes
+El <int> de XML-RPC es de 32 bits: factorial(13) ya no se puede enviar. Aquí
+los resultados grandes viajan como texto decimal o como Binary (bytes big-endian
+sin signo), y los cálculos se memorizan:
+  - Fibonacci por duplicación rápida, O(log n) multiplicaciones
+  - factorial desde una tabla de puntos de control cada PASO_FACTORIAL números
+  - una caché LRU acotada con los enteros ya calculados
+Pasar un entero a decimal y de vuelta cuesta tiempo cuadrático en sus dígitos
+(100000! son 456574 dígitos: segundos en cada extremo, contra 0,2 s de
+calcularlo), así que el texto se reserva a los enteros de hasta BITS_MAXIMOS_TEXTO
+bits; por encima 'auto' envía Binary y 'texto' se rechaza
+"""
+
+import functools
+import math
+import threading
+import xmlrpc.client
+
+FORMATOS = ("auto", "texto", "binario")
+MAXIMO_INT_XMLRPC = 2**31 - 1
+BITS_MAXIMOS_TEXTO = 14_000  # unos 4200 dígitos, bajo el límite de 4300 de str(int)
+LIMITE_FACTORIAL = 100_000
+LIMITE_FIBONACCI = 1_000_000
+PASO_FACTORIAL = 1024
+EXTENSION_MAXIMA = 4 * PASO_FACTORIAL  # hasta dónde se extiende un punto de control ya calculado
+TAMANO_CACHE = 128
+
+_puntos_control = {0: 1}  # {k * PASO_FACTORIAL: (k * PASO_FACTORIAL)!}
+_lock_puntos_control = threading.Lock()
+
+
+def fibonacci(n):
+    """F(n) por duplicación rápida: F(2k) = F(k)(2F(k+1) - F(k)), F(2k+1) = F(k)² + F(k+1)²"""
+    a, b = 0, 1  # F(k), F(k+1) para el prefijo de bits de n ya recorrido
+    for bit in bin(n)[2:]:
+        c = a * (2 * b - a)
+        d = a * a + b * b
+        a, b = (d, c + d) if bit == "1" else (c, d)
+    return a
+
+
+def factorial(n):
+    """n! desde el punto de control más cercano por debajo"""
+    base = n - n % PASO_FACTORIAL
+    if not base:
+        return math.factorial(n)
+    return _punto_control(base) * math.prod(range(base + 1, n + 1))
+
+
+def _punto_control(base):
+    valor = _puntos_control.get(base)
+    if valor is not None:
+        return valor
+    with _lock_puntos_control:
+        anterior = max(k for k in _puntos_control if k <= base)
+        if base - anterior <= EXTENSION_MAXIMA:
+            valor = _puntos_control[anterior] * math.prod(range(anterior + 1, base + 1))
+        else:
+            # Lejos de todo punto conocido math.factorial (división binaria, en C) es más rápido
+            valor = math.factorial(base)
+        _puntos_control[base] = valor
+    return valor
+
+
+def codificar(valor, formato="auto"):
+    """
+    'auto': int si cabe en el <int> de XML-RPC, texto decimal hasta
+    BITS_MAXIMOS_TEXTO bits y Binary por encima; 'texto': siempre texto decimal
+    (ValueError si es más grande); 'binario': Binary big-endian sin signo
+    """
+    if formato == "auto" and -MAXIMO_INT_XMLRPC - 1 <= valor <= MAXIMO_INT_XMLRPC:
+        return valor
+    if valor.bit_length() > BITS_MAXIMOS_TEXTO:
+        if formato == "texto":
+            raise ValueError(f"Resultado de {valor.bit_length()} bits: demasiado grande para 'texto', use 'binario'")
+        formato = "binario"
+    if formato == "binario":
+        return xmlrpc.client.Binary(valor.to_bytes((valor.bit_length() + 7) // 8 or 1, "big"))
+    return str(valor)
+
+
+def decodificar(valor):
+    """Inversa de codificar, para el cliente"""
+    if isinstance(valor, xmlrpc.client.Binary):
+        return int.from_bytes(valor.data, "big")
+    if isinstance(valor, str):
+        return int(valor)
+    return valor
+
+
+def _validar(n, limite, nombre):
+    n = int(n)
+    if n < 0:
+        raise ValueError(f"{nombre} no definido para números negativos")
+    if n > limite:
+        raise ValueError(f"{nombre} limitado a n <= {limite}")
+    return n
+
+
+def _validar_formato(formato):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato '{formato}' no soportado (use {', '.join(FORMATOS)})")
+
+
+# La caché guarda el entero (el más compacto: 100000! ocupa 190 KB) y no cada
+# codificación; codificar en binario es una copia de bytes
+_factorial_en_cache = functools.lru_cache(maxsize=TAMANO_CACHE)(factorial)
+_fibonacci_en_cache = functools.lru_cache(maxsize=TAMANO_CACHE)(fibonacci)
+
+
+def factorial_codificado(n, formato="auto"):
+    n = _validar(n, LIMITE_FACTORIAL, "Factorial")
+    _validar_formato(formato)
+    return codificar(_factorial_en_cache(n), formato)
+
+
+def fibonacci_codificado(n, formato="auto"):
+    n = _validar(n, LIMITE_FIBONACCI, "Fibonacci")
+    _validar_formato(formato)
+    return codificar(_fibonacci_en_cache(n), formato)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Estadísticas de listas en una pasada y sesiones de carga por bloques
+Cada número se recorre una sola vez al llegar y actualiza cantidad, suma,
+media, suma de cuadrados de las desviaciones, mínimo y máximo con el método
+de Welford, estable numéricamente: así una lista y una carga en muchos
+bloques dan lo mismo sin volver a recorrer lo anterior. La
+mediana y los percentiles se obtienen por selección (quickselect, tiempo lineal
+esperado) sobre los valores guardados sin ordenar en un array de float64
+"""
+
+import array
+import math
+import random
+import threading
+import time
+import uuid
+
+MAXIMO_SESIONES = 64
+INACTIVIDAD_SESION = 300  # segundos sin bloques antes de descartar una sesión
+MAXIMO_VALORES_SESION = 10_000_000  # 80 MB de float64 por sesión
+TAMANO_ORDENAR = 32  # por debajo de esto se ordena directamente
+TAMANO_MUESTREO = 4096  # desde aquí la selección empieza acotando con una muestra
+
+
+def _como_arreglo(numeros):
+    """array('d') con los números; acepta también textos numéricos, como float()"""
+    try:
+        return array.array("d", numeros)
+    except TypeError:
+        return array.array("d", map(float, numeros))
+
+
+def _acotar(valores, k):
+    """
+    Como Floyd-Rivest: dos cotas tomadas de una muestra encierran casi seguro a
+    los valores k y k + 1. Devuelve (banda entre las cotas, k dentro de la banda)
+    o None si esta vez no los encierran
+    """
+    n = len(valores)
+    m = int(n ** (2 / 3))
+    muestra = sorted(random.choices(valores, k=m))
+    centro = (k + 1) * m // n
+    margen = 3 * math.isqrt(m) + 1
+    bajo = muestra[max(centro - margen, 0)]
+    alto = muestra[min(centro + margen, m - 1)]
+    debajo = sum(map(bajo.__gt__, valores))  # cuántos x < bajo, sin un bucle en Python
+    if debajo > k:
+        return None
+    banda = array.array("d", (x for x in valores if bajo <= x <= alto))
+    if k + 1 >= debajo + len(banda):
+        return None
+    return banda, k - debajo
+
+
+def seleccionar(valores, k):
+    """
+    El k-ésimo menor de 'valores' (desde 0) y el siguiente en orden, sin ordenar
+    la secuencia ni modificarla. Con muchos valores se acota primero a una banda
+    chica (_acotar); luego partición en tres con pivote aleatorio. Las partes son
+    array('d') (8 bytes por valor, no un float por elemento), así la memoria
+    extra nunca pasa del tamaño de 'valores'
+    """
+    if len(valores) > TAMANO_MUESTREO and k + 1 < len(valores):
+        acotado = _acotar(valores, k)
+        if acotado is not None:
+            valores, k = acotado
+    superior = None  # menor valor descartado por ser mayor que todo lo que queda
+    while len(valores) > TAMANO_ORDENAR:
+        pivote = valores[random.randrange(len(valores))]
+        menores = array.array("d", (x for x in valores if x < pivote))
+        if k < len(menores):
+            valores, superior = menores, pivote
+            continue
+        mayores = array.array("d", (x for x in valores if x > pivote))
+        hasta_pivote = len(valores) - len(mayores)
+        if k < hasta_pivote:
+            if k + 1 < hasta_pivote:
+                return pivote, pivote
+            return pivote, (min(mayores) if mayores else superior if superior is not None else pivote)
+        k -= hasta_pivote
+        valores = mayores
+    ordenados = sorted(valores)
+    if k + 1 < len(ordenados):
+        return ordenados[k], ordenados[k + 1]
+    return ordenados[k], (superior if superior is not None else ordenados[k])
+
+
+class AcumuladorEstadisticas:
+    """Resume números bloque a bloque; con guardar_valores=False no hay mediana ni percentiles"""
+
+    def __init__(self, guardar_valores=True):
+        self.valores = array.array("d") if guardar_valores else None
+        self.cantidad = 0
+        self.suma = 0.0
+        self.media = 0.0
+        self.m2 = 0.0  # suma de los cuadrados de las desviaciones respecto de la media
+        self.minimo = math.inf
+        self.maximo = -math.inf
+
+    def agregar(self, numeros):
+        bloque = _como_arreglo(numeros)
+        if not len(bloque):
+            return
+        # Un solo bucle de Welford con el estado en variables locales
+        cantidad, suma, media, m2 = self.cantidad, self.suma, self.media, self.m2
+        minimo, maximo = self.minimo, self.maximo
+        for x in bloque:
+            cantidad += 1
+            suma += x
+            delta = x - media
+            media += delta / cantidad
+            m2 += delta * (x - media)
+            if x < minimo:
+                minimo = x
+            if x > maximo:
+                maximo = x
+        self.cantidad, self.suma, self.media, self.m2 = cantidad, suma, media, m2
+        self.minimo, self.maximo = minimo, maximo
+        if self.valores is not None:
+            if self.valores:
+                self.valores.extend(bloque)
+            else:
+                self.valores = bloque  # el bloque ya es una copia propia
+
+    def varianza(self):
+        """Varianza muestral (n - 1); 0 con un solo valor"""
+        return self.m2 / (self.cantidad - 1) if self.cantidad > 1 else 0.0
+
+    def mediana(self):
+        n = self._valores_guardados()
+        menor, siguiente = seleccionar(self.valores, (n - 1) // 2)
+        return menor if n % 2 else (menor + siguiente) / 2
+
+    def percentil(self, p):
+        """Percentil p (0-100) con interpolación lineal entre vecinos, como numpy.percentile"""
+        p = float(p)
+        if not 0 <= p <= 100:
+            raise ValueError(f"Percentil {p:g} fuera de rango (0-100)")
+        n = self._valores_guardados()
+        posicion = p / 100 * (n - 1)
+        k = int(posicion)
+        menor, siguiente = seleccionar(self.valores, k)
+        return menor + (siguiente - menor) * (posicion - k)
+
+    def _valores_guardados(self):
+        if not self.cantidad:
+            raise ValueError("Lista vacía")
+        if self.valores is None:
+            raise ValueError("No se guardaron los valores: no hay mediana ni percentiles")
+        return len(self.valores)
+
+    def resumen(self, percentiles=None):
+        if not self.cantidad:
+            raise ValueError("Lista vacía")
+        varianza = self.varianza()
+        resultado = {
+            "cantidad": self.cantidad,
+            "suma": self.suma,
+            "promedio": self.suma / self.cantidad,
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "mediana": self.mediana(),
+            "varianza": varianza,
+            "desviacion_estandar": math.sqrt(varianza),
+        }
+        if percentiles:
+            # Las claves de un struct XML-RPC tienen que ser texto
+            resultado["percentiles"] = {f"{float(p):g}": self.percentil(p) for p in percentiles}
+        return resultado
+
+
+class _Sesion:
+    def __init__(self):
+        self.acumulador = AcumuladorEstadisticas()
+        self.lock = threading.Lock()  # con el pool de hilos pueden llegar bloques a la vez
+        self.ultimo_uso = time.monotonic()
+
+
+class SesionesEstadisticas:
+    """
+    Cargas por bloques (abrir, agregar bloques, finalizar) para listas que no
+    caben en un solo mensaje. Las sesiones abandonadas se descartan tras
+    'inactividad' segundos
+    """
+
+    def __init__(self, maximo=MAXIMO_SESIONES, inactividad=INACTIVIDAD_SESION,
+                 maximo_valores=MAXIMO_VALORES_SESION):
+        self.maximo = maximo
+        self.inactividad = inactividad
+        self.maximo_valores = maximo_valores
+        self._sesiones = {}
+        self._lock = threading.Lock()
+
+    def abrir(self):
+        with self._lock:
+            self._descartar_inactivas()
+            if len(self._sesiones) >= self.maximo:
+                raise ValueError(f"Demasiadas sesiones abiertas ({self.maximo}); finalice alguna")
+            identificador = uuid.uuid4().hex
+            self._sesiones[identificador] = _Sesion()
+        return identificador
+
+    def agregar(self, identificador, numeros):
+        """Agrega un bloque y devuelve cuántos números lleva la sesión"""
+        sesion = self._buscar(identificador)
+        with sesion.lock:
+            if sesion.acumulador.cantidad + len(numeros) > self.maximo_valores:
+                raise ValueError(f"La sesión superaría {self.maximo_valores} números")
+            sesion.acumulador.agregar(numeros)
+            sesion.ultimo_uso = time.monotonic()
+            return sesion.acumulador.cantidad
+
+    def finalizar(self, identificador, percentiles=None):
+        """Devuelve las estadísticas de todo lo cargado y cierra la sesión"""
+        with self._lock:
+            sesion = self._sesiones.pop(str(identificador), None)
+        if sesion is None:
+            raise ValueError(f"Sesión '{identificador}' no encontrada o expirada")
+        with sesion.lock:
+            return sesion.acumulador.resumen(percentiles)
+
+    def _buscar(self, identificador):
+        with self._lock:
+            self._descartar_inactivas()
+            sesion = self._sesiones.get(str(identificador))
+        if sesion is None:
+            raise ValueError(f"Sesión '{identificador}' no encontrada o expirada")
+        return sesion
+
+    def _descartar_inactivas(self):
+        limite = time.monotonic() - self.inactividad
+        for identificador in [i for i, s in self._sesiones.items() if s.ultimo_uso < limite]:
+            del self._sesiones[identificador]
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool de hilos acotado para los servidores HTTP de RPC
+SimpleXMLRPCServer atiende una petición a la vez: una llamada lenta deja
+esperando a todas las demás. ThreadingMixIn lo evita con un hilo por
+petición, pero sin límite: una ráfaga crea miles de hilos. Aquí un número
+fijo de hilos trabajadores toma las conexiones de una cola acotada; si la
+cola está llena el servidor contesta 503 enseguida en vez de acumular trabajo.
+Los 503 los escribe un hilo aparte: el que acepta nunca espera a un cliente
+"""
+
+import os
+import queue
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+from registro_asincrono import registro
+
+HILOS_POR_DEFECTO = 8
+CAPACIDAD_COLA = 64  # conexiones esperando un hilo libre antes de rechazar
+ESPERA_REINTENTO = 1  # segundos sugeridos al cliente en Retry-After
+TIEMPO_LECTURA_RECHAZO = 1.0  # segundos para leer la petición que se va a rechazar
+TIEMPO_CIERRE = 5.0  # segundos esperando a cada trabajador al cerrar
+CAPACIDAD_RECHAZOS = 64  # conexiones esperando su 503; más allá se responde sin leer la petición
+CUERPO_SATURADO = "Servidor saturado; reintente en unos instantes\n".encode("utf-8")
+RESPUESTA_SATURADO = (
+    "HTTP/1.1 503 Service Unavailable\r\n"
+    "Content-Type: text/plain; charset=utf-8\r\n"
+    f"Content-Length: {len(CUERPO_SATURADO)}\r\n"
+    f"Retry-After: {ESPERA_REINTENTO}\r\n"
+    "Connection: close\r\n\r\n"
+).encode("ascii") + CUERPO_SATURADO
+
+
+class ManejadorSaturado(BaseHTTPRequestHandler):
+    """
+    Contesta 503 sin ejecutar nada. Lee la petición completa antes de cerrar:
+    si quedaran bytes sin leer el núcleo enviaría un RST y el cliente perdería
+    la respuesta
+    """
+
+    timeout = TIEMPO_LECTURA_RECHAZO
+
+    def do_POST(self):
+        try:
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        except (ValueError, OSError):
+            pass
+        self.rechazar()
+
+    def do_GET(self):
+        self.rechazar()
+
+    def rechazar(self):
+        self.send_response(503)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(CUERPO_SATURADO)))
+        self.send_header("Retry-After", str(ESPERA_REINTENTO))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(CUERPO_SATURADO)
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass  # se registra el rechazo, no la respuesta
+
+
+class PoolHilosMixIn:
+    """
+    Reemplaza al ThreadingMixIn de socketserver: el hilo que acepta solo encola
+    la conexión y 'hilos' trabajadores la atienden
+    """
+
+    def __init__(self, *args, hilos=HILOS_POR_DEFECTO, capacidad_cola=CAPACIDAD_COLA, **kwargs):
+        self.hilos = hilos
+        # queue.Queue(0) no tiene límite: al menos un lugar
+        self._pendientes = queue.Queue(max(capacidad_cola, 1))
+        self._rechazos = queue.Queue(CAPACIDAD_RECHAZOS)
+        self.rechazadas = 0
+        super().__init__(*args, **kwargs)
+        self._trabajadores = [
+            threading.Thread(target=self._atender_pendientes, name=f"rpc-trabajador-{i}", daemon=True)
+            for i in range(hilos)
+        ]
+        self._trabajadores.append(threading.Thread(target=self._atender_rechazos, name="rpc-rechazos", daemon=True))
+        for trabajador in self._trabajadores:
+            trabajador.start()
+
+    def hay_espera(self):
+        """True si hay conexiones esperando un hilo libre"""
+        return not self._pendientes.empty()
+
+    def process_request(self, request, client_address):
+        try:
+            self._pendientes.put_nowait((request, client_address))
+        except queue.Full:
+            self.rechazadas += 1
+            registro.aviso("Servidor saturado (%d hilos ocupados, %d en cola): 503 a %s (%d rechazadas)",
+                           self.hilos, self._pendientes.maxsize, client_address[0], self.rechazadas)
+            try:
+                self._rechazos.put_nowait((request, client_address))
+            except queue.Full:
+                self._rechazar_sin_leer(request)
+
+    def _rechazar_sin_leer(self, request):
+        """Último recurso con el hilo de rechazos también saturado: 503 sin bloquear y cierre"""
+        try:
+            request.setblocking(False)
+            request.send(RESPUESTA_SATURADO)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _atender_rechazos(self):
+        while True:
+            rechazo = self._rechazos.get()
+            if rechazo is None:
+                return
+            request, client_address = rechazo
+            try:
+                ManejadorSaturado(request, client_address, self)
+            except OSError:
+                pass
+            finally:
+                self.shutdown_request(request)
+
+    def _atender_pendientes(self):
+        while True:
+            pendiente = self._pendientes.get()
+            if pendiente is None:
+                return
+            request, client_address = pendiente
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Los trabajadores terminan tras atender lo que ya estaba en cola
+        for _ in self._trabajadores[:-1]:
+            self._pendientes.put(None)
+        self._rechazos.put(None)
+        for trabajador in self._trabajadores:
+            trabajador.join(TIEMPO_CIERRE)
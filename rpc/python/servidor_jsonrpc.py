@@ -6,43 +6,57 @@ Demuestra RPC sin dependencias externas complejas
 """
 
 from http.server import HTTPServer, BaseHTTPRequestHandler
+import argparse
 import json
+import os
+import sys
 from datetime import datetime
 import threading
 
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+from registro_asincrono import registro, NIVELES
+from contadores_hilo import ContadoresOperaciones
+
 class CalculadoraJSONRPC:
     """Calculadora que expone métodos vía JSON-RPC"""
     
     def __init__(self):
-        self.contador = 0
+        self.operaciones = ContadoresOperaciones()
         self.resultados = {}
     
+    @property
+    def contador(self):
+        return self.operaciones.total()
+    
     def sumar(self, a, b):
-        self.contador += 1
+        self.operaciones.incrementar("sumar")
         return float(a) + float(b)
     
     def restar(self, a, b):
-        self.contador += 1
+        self.operaciones.incrementar("restar")
         return float(a) - float(b)
     
     def multiplicar(self, a, b):
-        self.contador += 1
+        self.operaciones.incrementar("multiplicar")
         return float(a) * float(b)
     
     def dividir(self, a, b):
-        self.contador += 1
+        self.operaciones.incrementar("dividir")
         if float(b) == 0:
             raise ValueError("División por cero")
         return float(a) / float(b)
     
     def potencia(self, base, exp):
-        self.contador += 1
+        self.operaciones.incrementar("potencia")
         return pow(float(base), float(exp))
     
     def info_servidor(self):
+        por_metodo = self.operaciones.por_metodo()
         return {
             "nombre": "JSON-RPC Calculadora",
-            "operaciones": self.contador,
+            "operaciones": sum(por_metodo.values()),
+            "operaciones_por_metodo": por_metodo,
             "timestamp": datetime.now().isoformat(),
             "hilos": threading.active_count()
         }
@@ -215,8 +229,11 @@ class JSONRPCHandler(BaseHTTPRequestHandler):
         '''
     
     def log_message(self, format, *args):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] JSON-RPC: {format % args}")
+        # Asíncrono y muestreado: la petición no espera a la consola
+        registro.info_muestreado("JSON-RPC: " + format, *args)
+    
+    def log_error(self, format, *args):
+        registro.error("JSON-RPC: " + format, *args)
 
 def crear_handler_con_calculadora(calculadora):
     """Factory para crear handler con calculadora inyectada"""
@@ -225,6 +242,14 @@ def crear_handler_con_calculadora(calculadora):
     return handler
 
 def main():
+    parser = argparse.ArgumentParser(description="Servidor JSON-RPC 2.0")
+    parser.add_argument("--nivel-log", choices=NIVELES, default="info",
+                        help="nivel mínimo de los registros del servidor")
+    parser.add_argument("--muestreo-log", type=int, default=1, metavar="N",
+                        help="registrar solo 1 de cada N peticiones exitosas")
+    args = parser.parse_args()
+    registro.configurar(nivel=NIVELES[args.nivel_log], muestreo=args.muestreo_log)
+    
     print("=== SERVIDOR JSON-RPC 2.0 ===")
     
     calculadora = CalculadoraJSONRPC()
@@ -3,79 +3,113 @@
 """
 Servidor RPC usando XML-RPC de la biblioteca estándar de Python
 Demuestra Remote Procedure Calls sin dependencias externas
+Con --hilos N las peticiones se atienden en un pool acotado (ver pool_rpc.py)
+Además de XML acepta JSON compacto y una codificación binaria según el
+Content-Type de cada petición (ver codificaciones_rpc.py)
 """
 
 from xmlrpc.server import SimpleXMLRPCServer
 from xmlrpc.server import SimpleXMLRPCRequestHandler
+import argparse
+import os
+import select
+import sys
 import threading
 import time
 from datetime import datetime
 import math
 import json
 
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+from registro_asincrono import registro, NIVELES
+import arreglos_rpc
+from almacen_rpc import AlmacenMemoria, AlmacenWAL
+from codificaciones_rpc import NegociacionMixIn, TIPO_XML, TIPO_JSON, TIPO_BINARIO
+import enteros_rpc
+from contadores_hilo import ContadoresOperaciones
+from estadisticas_rpc import AcumuladorEstadisticas, SesionesEstadisticas
+from pool_rpc import PoolHilosMixIn, CAPACIDAD_COLA
+
+# Claves como máximo por llamada de obtener_resultados y guardar_resultados
+MAXIMO_CLAVES_LOTE = 10_000
+
+# Segundos que una conexión persistente puede quedar sin peticiones antes de cerrarse
+TIEMPO_KEEPALIVE = 5.0
+# Cada cuánto una conexión persistente inactiva mira si otra espera su hilo
+INTERVALO_SONDEO_KEEPALIVE = 0.05
+
 class CalculadoraRPC:
     """Clase que expone métodos como servicios RPC"""
     
-    def __init__(self):
+    def __init__(self, almacen=None):
         self.nombre_servidor = f"CalculadoraXMLRPC-{int(time.time())}"
         self.tiempo_inicio = datetime.now()
-        self.contador_operaciones = 0
-        self.resultados = {
+        # Con el pool de hilos varios métodos corren a la vez
+        self.operaciones = ContadoresOperaciones()
+        self.sesiones_estadisticas = SesionesEstadisticas()
+        # Los resultados guardados; AlmacenWAL los conserva entre reinicios (ver almacen_rpc.py)
+        self.resultados = almacen if almacen is not None else AlmacenMemoria()
+        self.resultados.sembrar({
             "PI": math.pi,
             "E": math.e,
             "SQRT2": math.sqrt(2)
-        }
+        })
         print(f"Servidor RPC inicializado: {self.nombre_servidor}")
     
+    @property
+    def contador_operaciones(self):
+        return self.operaciones.total()
+    
     def sumar(self, a, b):
         """Suma dos números"""
-        self.contador_operaciones += 1
+        self.operaciones.incrementar("sumar")
         resultado = float(a) + float(b)
-        self._log_operacion("SUMA", f"{a} + {b} = {resultado}")
+        self._log_operacion("SUMA", "%s + %s = %s", a, b, resultado)
         return resultado
     
     def restar(self, a, b):
         """Resta dos números"""
-        self.contador_operaciones += 1
+        self.operaciones.incrementar("restar")
         resultado = float(a) - float(b)
-        self._log_operacion("RESTA", f"{a} - {b} = {resultado}")
+        self._log_operacion("RESTA", "%s - %s = %s", a, b, resultado)
         return resultado
     
     def multiplicar(self, a, b):
         """Multiplica dos números"""
-        self.contador_operaciones += 1
+        self.operaciones.incrementar("multiplicar")
         resultado = float(a) * float(b)
-        self._log_operacion("MULTIPLICACIÓN", f"{a} * {b} = {resultado}")
+        self._log_operacion("MULTIPLICACIÓN", "%s * %s = %s", a, b, resultado)
         return resultado
     
     def dividir(self, a, b):
         """Divide dos números"""
-        self.contador_operaciones += 1
+        self.operaciones.incrementar("dividir")
         if float(b) == 0:
             raise ValueError("División por cero no permitida")
         resultado = float(a) / float(b)
-        self._log_operacion("DIVISIÓN", f"{a} / {b} = {resultado}")
+        self._log_operacion("DIVISIÓN", "%s / %s = %s", a, b, resultado)
         return resultado
     
     def potencia(self, base, exponente):
         """Calcula base elevado a exponente"""
-        self.contador_operaciones += 1
+        self.operaciones.incrementar("potencia")
         resultado = math.pow(float(base), float(exponente))
-        self._log_operacion("POTENCIA", f"{base} ^ {exponente} = {resultado}")
+        self._log_operacion("POTENCIA", "%s ^ %s = %s", base, exponente, resultado)
         return resultado
     
     def raiz_cuadrada(self, numero):
         """Calcula la raíz cuadrada"""
-        self.contador_operaciones += 1
+        self.operaciones.incrementar("raiz_cuadrada")
         if float(numero) < 0:
             raise ValueError("Raíz cuadrada de número negativo no está definida")
         resultado = math.sqrt(float(numero))
-        self._log_operacion("RAÍZ", f"sqrt({numero}) = {resultado}")
+        self._log_operacion("RAÍZ", "sqrt(%s) = %s", numero, resultado)
         return resultado
     
     def operacion_lista(self, numeros, operacion):
         """Aplica una operación a una lista de números"""
-        self.contador_operaciones += 1
+        self.operaciones.incrementar("operacion_lista")
         if not numeros:
             raise ValueError("Lista vacía")
         
@@ -97,73 +131,130 @@ class CalculadoraRPC:
             else:
                 raise ValueError(f"Operación '{operacion}' no soportada")
         
-        self._log_operacion("VECTOR", f"{operacion.upper()}: {len(numeros)} elementos")
+        self._log_operacion("VECTOR", "%s: %s elementos", operacion.upper(), len(numeros))
         return resultado
     
-    def estadisticas_lista(self, numeros):
-        """Calcula estadísticas básicas de una lista"""
-        self.contador_operaciones += 1
+    def estadisticas_lista(self, numeros, percentiles=None):
+        """
+        Calcula estadísticas de una lista en una pasada (ver estadisticas_rpc.py);
+        percentiles es una lista opcional de valores entre 0 y 100
+        """
+        self.operaciones.incrementar("estadisticas_lista")
         if not numeros:
             raise ValueError("Lista vacía")
         
-        numeros_float = [float(x) for x in numeros]
-        
-        estadisticas = {
-            "cantidad": len(numeros_float),
-            "suma": sum(numeros_float),
-            "promedio": sum(numeros_float) / len(numeros_float),
-            "minimo": min(numeros_float),
-            "maximo": max(numeros_float),
-            "mediana": self._calcular_mediana(numeros_float)
-        }
+        acumulador = AcumuladorEstadisticas()
+        acumulador.agregar(numeros)
+        estadisticas = acumulador.resumen(percentiles)
         
-        self._log_operacion("ESTADÍSTICAS", f"{len(numeros)} elementos analizados")
+        self._log_operacion("ESTADÍSTICAS", "%s elementos analizados", len(numeros))
         return estadisticas
     
-    def _calcular_mediana(self, numeros):
-        """Calcula la mediana de una lista"""
-        sorted_nums = sorted(numeros)
-        n = len(sorted_nums)
-        
-        if n % 2 == 0:
-            return (sorted_nums[n//2 - 1] + sorted_nums[n//2]) / 2
-        else:
-            return sorted_nums[n//2]
+    def abrir_sesion_estadisticas(self):
+        """Abre una carga por bloques para listas que no caben en un mensaje; devuelve su identificador"""
+        self.operaciones.incrementar("abrir_sesion_estadisticas")
+        sesion = self.sesiones_estadisticas.abrir()
+        self._log_operacion("SESIÓN", "%s abierta", sesion)
+        return sesion
+    
+    def agregar_bloque_estadisticas(self, sesion, numeros):
+        """Agrega un bloque (lista, Binary o base64 de float64) a la sesión; devuelve el total cargado"""
+        self.operaciones.incrementar("agregar_bloque_estadisticas")
+        if not isinstance(numeros, (list, tuple)):
+            numeros = arreglos_rpc.desempaquetar(numeros)
+        return self.sesiones_estadisticas.agregar(sesion, numeros)
+    
+    def finalizar_sesion_estadisticas(self, sesion, percentiles=None):
+        """Devuelve las estadísticas de todos los bloques de la sesión y la cierra"""
+        self.operaciones.incrementar("finalizar_sesion_estadisticas")
+        estadisticas = self.sesiones_estadisticas.finalizar(sesion, percentiles)
+        self._log_operacion("ESTADÍSTICAS", "%s elementos analizados (sesión %s)",
+                            estadisticas["cantidad"], sesion)
+        return estadisticas
+    
+    def operacion_arreglo(self, datos, operacion):
+        """
+        Como operacion_lista, pero con los números empaquetados: Binary o base64
+        de float64 little-endian. Devuelve el resultado empaquetado igual
+        """
+        self.operaciones.incrementar("operacion_arreglo")
+        arreglo = arreglos_rpc.desempaquetar(datos)
+        if not len(arreglo):
+            raise ValueError("Arreglo vacío")
+        operacion = operacion.lower()
+        resultado = arreglos_rpc.aplicar(arreglo, operacion)
+        self._log_operacion("ARREGLO", "%s: %s elementos", operacion.upper(), len(arreglo))
+        return arreglos_rpc.empaquetar(resultado, datos)
+    
+    def estadisticas_arreglo(self, datos, percentiles=None):
+        """Como estadisticas_lista, con los números empaquetados (Binary o base64 de float64)"""
+        self.operaciones.incrementar("estadisticas_arreglo")
+        estadisticas = arreglos_rpc.estadisticas(arreglos_rpc.desempaquetar(datos), percentiles)
+        self._log_operacion("ESTADÍSTICAS", "%s elementos analizados (arreglo)", estadisticas["cantidad"])
+        return estadisticas
     
     def guardar_resultado(self, clave, valor):
         """Guarda un resultado con una clave"""
         if not clave or not clave.strip():
             raise ValueError("Clave no puede estar vacía")
         
-        self.resultados[str(clave).strip()] = float(valor)
-        self._log_operacion("GUARDADO", f"'{clave}' = {valor}")
+        self.resultados.guardar(str(clave).strip(), float(valor))
+        self._log_operacion("GUARDADO", "'%s' = %s", clave, valor)
         return True
     
+    def guardar_resultados(self, resultados):
+        """Guarda varios resultados {clave: valor} de una vez; devuelve cuántos"""
+        if len(resultados) > MAXIMO_CLAVES_LOTE:
+            raise ValueError(f"Demasiados resultados ({len(resultados)}; máximo {MAXIMO_CLAVES_LOTE})")
+        # Se valida todo antes de guardar nada
+        valores = {}
+        for clave, valor in resultados.items():
+            if not clave or not clave.strip():
+                raise ValueError("Clave no puede estar vacía")
+            valores[clave.strip()] = float(valor)
+        self.resultados.guardar_varios(valores)
+        self._log_operacion("GUARDADO", "%s resultados", len(valores))
+        return len(valores)
+    
+    def obtener_resultados(self, claves):
+        """{clave: valor} de las claves pedidas; las que no existen no aparecen"""
+        if len(claves) > MAXIMO_CLAVES_LOTE:
+            raise ValueError(f"Demasiadas claves ({len(claves)}; máximo {MAXIMO_CLAVES_LOTE})")
+        valores = self.resultados.obtener_varios(str(clave).strip() for clave in claves)
+        self._log_operacion("RECUPERADO", "%s de %s claves", len(valores), len(claves))
+        return valores
+    
     def obtener_resultado(self, clave):
         """Recupera un resultado por su clave"""
         if not clave or not clave.strip():
             raise ValueError("Clave no puede estar vacía")
         
         clave = str(clave).strip()
-        if clave not in self.resultados:
+        valor = self.resultados.obtener(clave)
+        if valor is None:
             raise ValueError(f"Clave '{clave}' no encontrada")
         
-        valor = self.resultados[clave]
-        self._log_operacion("RECUPERADO", f"'{clave}' = {valor}")
+        self._log_operacion("RECUPERADO", "'%s' = %s", clave, valor)
         return valor
     
-    def listar_claves(self):
-        """Lista todas las claves disponibles"""
-        claves = list(self.resultados.keys())
-        self._log_operacion("LISTADO", f"{len(claves)} claves disponibles")
+    def listar_claves(self, prefijo="", cursor="", limite=0):
+        """
+        Lista en orden las claves que empiezan con 'prefijo'. Por páginas: como
+        mucho 'limite' claves (0 = todas) posteriores a 'cursor', que es la
+        última clave de la página anterior
+        """
+        claves = self.resultados.claves(str(prefijo), str(cursor), max(int(limite), 0))
+        self._log_operacion("LISTADO", "%s claves disponibles", len(claves))
         return claves
     
     def obtener_info_servidor(self):
         """Retorna información del servidor"""
+        por_metodo = self.operaciones.por_metodo()
         info = {
             "nombre": self.nombre_servidor,
             "tiempo_inicio": self.tiempo_inicio.isoformat(),
-            "operaciones_realizadas": self.contador_operaciones,
+            "operaciones_realizadas": sum(por_metodo.values()),
+            "operaciones_por_metodo": por_metodo,
             "resultados_almacenados": len(self.resultados),
             "hilos_activos": threading.active_count(),
             "tiempo_actual": datetime.now().isoformat()
@@ -179,62 +270,147 @@ class CalculadoraRPC:
         """Método simple para probar conectividad"""
         return f"pong: {mensaje} (servidor: {self.nombre_servidor})"
     
-    def factorial(self, n):
-        """Calcula el factorial de un número"""
-        self.contador_operaciones += 1
-        n = int(n)
-        if n < 0:
-            raise ValueError("Factorial no definido para números negativos")
-        
-        resultado = math.factorial(n)
-        self._log_operacion("FACTORIAL", f"{n}! = {resultado}")
+    def factorial(self, n, formato="auto"):
+        """
+        Calcula el factorial de un número. Lo que no cabe en 32 bits viaja como
+        texto decimal ('auto' o 'texto') o como Binary ('binario'); ver enteros_rpc.py
+        """
+        self.operaciones.incrementar("factorial")
+        resultado = enteros_rpc.factorial_codificado(n, formato)
+        self._log_operacion("FACTORIAL", "%s! (%s)", n, formato)
         return resultado
     
-    def fibonacci(self, n):
-        """Calcula el n-ésimo número de Fibonacci"""
-        self.contador_operaciones += 1
-        n = int(n)
-        if n < 0:
-            raise ValueError("Fibonacci no definido para números negativos")
-        
-        if n <= 1:
-            resultado = n
-        else:
-            a, b = 0, 1
-            for _ in range(2, n + 1):
-                a, b = b, a + b
-            resultado = b
-        
-        self._log_operacion("FIBONACCI", f"F({n}) = {resultado}")
+    def fibonacci(self, n, formato="auto"):
+        """Calcula el n-ésimo número de Fibonacci; mismos formatos que factorial"""
+        self.operaciones.incrementar("fibonacci")
+        resultado = enteros_rpc.fibonacci_codificado(n, formato)
+        self._log_operacion("FIBONACCI", "F(%s) (%s)", n, formato)
         return resultado
     
-    def _log_operacion(self, tipo, detalle):
-        """Log interno de operaciones"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] {tipo}: {detalle}")
+    def _log_operacion(self, tipo, formato, *argumentos):
+        """Log interno de operaciones (asíncrono y muestreado; el formato se aplica fuera de la petición)"""
+        registro.info_muestreado(f"{tipo}: {formato}", *argumentos)
 
-class CustomRequestHandler(SimpleXMLRPCRequestHandler):
-    """Handler personalizado para mostrar información de peticiones"""
+class ServidorXMLRPCConPool(PoolHilosMixIn, SimpleXMLRPCServer):
+    """SimpleXMLRPCServer con un pool de hilos acotado; responde 503 si se satura"""
+
+class CustomRequestHandler(NegociacionMixIn, SimpleXMLRPCRequestHandler):
+    """Handler personalizado para mostrar información de peticiones; XML, JSON o binario"""
     
     def log_message(self, format, *args):
         """Override para personalizar el logging"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] Petición RPC: {format % args}")
+        registro.info_muestreado("Petición RPC: " + format, *args)
+    
+    def log_error(self, format, *args):
+        """Los errores no se muestrean"""
+        registro.error("Petición RPC: " + format, *args)
+
+class ManejadorPersistente(CustomRequestHandler):
+    """
+    HTTP/1.1 con conexiones persistentes: el cliente reutiliza la conexión TCP
+    entre llamadas. Solo con el pool de hilos: cada conexión abierta ocupa un
+    hilo, y en el modo de un hilo un cliente inactivo dejaría fuera a todos
+    """
+    
+    protocol_version = "HTTP/1.1"
+    timeout = TIEMPO_KEEPALIVE
+    
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._esperar_peticion():
+            self.handle_one_request()
+    
+    def _esperar_peticion(self):
+        """
+        Espera la siguiente petición de la conexión; False si vence TIEMPO_KEEPALIVE
+        o si hay conexiones en cola: un cliente inactivo no retiene el hilo
+        """
+        limite = time.monotonic() + self.timeout
+        while not self._hay_datos_leidos():
+            restante = limite - time.monotonic()
+            if restante <= 0 or self.server.hay_espera():
+                registro.depuracion("Petición RPC: conexión inactiva cerrada")
+                return False
+            if select.select([self.connection], [], [], min(restante, INTERVALO_SONDEO_KEEPALIVE))[0]:
+                return True  # datos o cierre: handle_one_request se ocupa
+        return True
+    
+    def _hay_datos_leidos(self):
+        """Si rfile ya tiene bytes de otra petición (select no ve el buffer de rfile)"""
+        self.connection.settimeout(0.0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+    
+    def end_headers(self):
+        # Si hay conexiones esperando un hilo, esta se cierra tras la respuesta para liberarlo
+        if not self.close_connection and self.server.hay_espera():
+            self.send_header("Connection", "close")
+        super().end_headers()
+    
+    def log_error(self, format, *args):
+        if format.startswith("Request timed out"):
+            # Una conexión persistente que quedó inactiva: es lo normal
+            registro.depuracion("Petición RPC: conexión inactiva cerrada")
+            return
+        super().log_error(format, *args)
 
 def main():
+    parser = argparse.ArgumentParser(description="Servidor XML-RPC")
+    parser.add_argument("--nivel-log", choices=NIVELES, default="info",
+                        help="nivel mínimo de los registros del servidor")
+    parser.add_argument("--muestreo-log", type=int, default=1, metavar="N",
+                        help="registrar solo 1 de cada N llamadas exitosas")
+    parser.add_argument("--hilos", type=int, default=0, metavar="N",
+                        help="atiende hasta N peticiones a la vez con un pool de hilos "
+                             "(0 = una petición a la vez, como el original)")
+    parser.add_argument("--datos", metavar="DIR",
+                        help="conserva los resultados guardados en DIR (log con fsync por lotes e instantáneas)")
+    parser.add_argument("--sin-esperar-disco", action="store_true",
+                        help="con --datos, guardar_resultado responde sin esperar el fsync "
+                             "(una caída puede perder las últimas escrituras)")
+    parser.add_argument("--cola", type=int, default=CAPACIDAD_COLA, metavar="N",
+                        help="con --hilos, peticiones que pueden esperar un hilo libre antes de responder 503")
+    args = parser.parse_args()
+    registro.configurar(nivel=NIVELES[args.nivel_log], muestreo=args.muestreo_log)
+    
     print("=== SERVIDOR XML-RPC ===\n")
     
     # Crear el servidor XML-RPC
-    servidor = SimpleXMLRPCServer(
-        ("localhost", 8888),
-        requestHandler=CustomRequestHandler,
-        allow_none=True
-    )
+    if args.hilos > 0:
+        servidor = ServidorXMLRPCConPool(
+            ("localhost", 8888),
+            requestHandler=ManejadorPersistente,
+            allow_none=True,
+            hilos=args.hilos,
+            capacidad_cola=args.cola
+        )
+    else:
+        servidor = SimpleXMLRPCServer(
+            ("localhost", 8888),
+            requestHandler=CustomRequestHandler,
+            allow_none=True
+        )
     
     print("Servidor XML-RPC iniciado en http://localhost:8888")
+    if args.hilos > 0:
+        print(f"Pool de {args.hilos} hilos, hasta {args.cola} peticiones en cola (luego 503)")
+        print(f"Conexiones persistentes HTTP/1.1 (se cierran tras {TIEMPO_KEEPALIVE:g} s sin peticiones, "
+              "o antes si hay conexiones en cola)")
+    else:
+        print("Una petición a la vez (usa --hilos N para atender varias en paralelo)")
     
     # Crear instancia de la calculadora
-    calculadora = CalculadoraRPC()
+    if args.datos:
+        almacen = AlmacenWAL(args.datos, esperar_disco=not args.sin_esperar_disco)
+        print(f"Resultados persistentes en {args.datos} ({len(almacen)} recuperados)")
+    else:
+        almacen = AlmacenMemoria()
+    calculadora = CalculadoraRPC(almacen)
     
     # Registrar la instancia completa
     servidor.register_instance(calculadora)
@@ -246,13 +422,22 @@ def main():
     # Registrar introspection functions
     servidor.register_introspection_functions()
     
+    # system.multicall: varias llamadas en una sola petición HTTP
+    servidor.register_multicall_functions()
+    
     print("\nMétodos RPC disponibles:")
     print("  - Operaciones básicas: sumar, restar, multiplicar, dividir")
     print("  - Operaciones avanzadas: potencia, raiz_cuadrada, factorial, fibonacci")
     print("  - Operaciones con listas: operacion_lista, estadisticas_lista")
-    print("  - Gestión: guardar_resultado, obtener_resultado, listar_claves")
+    print("  - Estadísticas por bloques: abrir_sesion_estadisticas, agregar_bloque_estadisticas, "
+          "finalizar_sesion_estadisticas")
+    print("  - Arreglos empaquetados (float64): operacion_arreglo, estadisticas_arreglo "
+          f"({'NumPy' if arreglos_rpc.numpy is not None else 'módulo array'})")
+    print("  - Gestión: guardar_resultado(s), obtener_resultado(s), listar_claves (por prefijo y páginas)")
     print("  - Información: obtener_info_servidor, obtener_tiempo_servidor, ping")
     print("  - Utilidades: suma_simple, test_servidor")
+    print("  - Lotes: system.multicall")
+    print(f"\nCodificaciones (por Content-Type): {TIPO_XML}, {TIPO_JSON}, {TIPO_BINARIO}")
     
     print("\nEl servidor está listo para recibir llamadas RPC...")
     print("Los clientes pueden conectarse a: http://localhost:8888")
@@ -264,6 +449,7 @@ def main():
         print("\n\nDeteniendo servidor RPC...")
         servidor.shutdown()
         servidor.server_close()
+        almacen.cerrar()
         print("Servidor detenido")
 
 if __name__ == "__main__":
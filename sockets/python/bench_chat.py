@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generador de carga para el servidor de chat
+Abre miles de clientes simulados desde un solo proceso (asyncio) con el
+protocolo real, hace que algunos envíen a una tasa fija y mide en los demás
+la latencia de difusión de punta a punta. El resultado se imprime en JSON
+para comparar motores (hilos, async, multiproceso) entre sí
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import shlex
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+from protocolo_chat import Reensamblador, codificar, tamano_lectura, PROTOCOLOS, CRUDO
+from servidor_chat_async import ajustar_limite_descriptores
+
+HOST = 'localhost'
+PUERTO = 8082
+CONEXIONES_SIMULTANEAS = 200  # conexiones en curso a la vez durante el arranque
+TIEMPO_REGISTRO = 10.0  # segundos máximos para conectar y recibir la bienvenida
+FIN_BIENVENIDA = "=========================="
+
+
+def informar(texto):
+    """El progreso va a stderr; stdout queda solo para el JSON"""
+    print(texto, file=sys.stderr, flush=True)
+
+
+def percentil(ordenados, fraccion):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, max(0, int(round(fraccion * len(ordenados))) - 1))
+    return ordenados[indice]
+
+
+def en_ms(segundos):
+    return None if segundos is None else round(segundos * 1000, 3)
+
+
+def rss_kb(pid):
+    """Memoria residente (KiB) del proceso y sus descendientes, según /proc"""
+    total = 0
+    pendientes = [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with open(f"/proc/{actual}/status") as estado:
+                for linea in estado:
+                    if linea.startswith("VmRSS:"):
+                        total += int(linea.split()[1])
+                        break
+            for tarea in os.listdir(f"/proc/{actual}/task"):
+                with open(f"/proc/{actual}/task/{tarea}/children") as hijos:
+                    pendientes.extend(int(hijo) for hijo in hijos.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total
+
+
+class ClienteSimulado:
+    """Un usuario del chat: se registra y cuenta las difusiones que le llegan"""
+
+    def __init__(self, indice, protocolo, patron, latencias):
+        self.nombre = f"bench_{indice}"
+        self.protocolo = protocolo
+        self.patron = patron
+        self.latencias = latencias
+        self.reader = None
+        self.writer = None
+        self.tarea_lectora = None
+
+    async def conectar(self, host, puerto):
+        """Conecta, envía el nombre y espera la bienvenida; devuelve los segundos que tardó"""
+        inicio = time.perf_counter()
+        self.reader, self.writer = await asyncio.open_connection(host, puerto)
+        reensamblador = Reensamblador(self.protocolo)
+        await self.reader.read(tamano_lectura(self.protocolo))  # "Ingresa tu nombre: "
+        self.writer.write(codificar(self.nombre, self.protocolo))
+        recibido = ""
+        while FIN_BIENVENIDA not in recibido:
+            datos = await self.reader.read(tamano_lectura(self.protocolo))
+            if not datos:
+                raise ConnectionError("el servidor cerró la conexión durante el registro")
+            recibido += "".join(reensamblador.alimentar(datos))
+        self.tarea_lectora = asyncio.ensure_future(self._leer(reensamblador))
+        return time.perf_counter() - inicio
+
+    async def _leer(self, reensamblador):
+        """Registra la latencia de cada mensaje del benchmark que llega"""
+        while True:
+            datos = await self.reader.read(64 * 1024)
+            if not datos:
+                return
+            ahora = time.perf_counter()
+            for mensaje in reensamblador.alimentar(datos):
+                if "/ping" in mensaje.split("\n"):
+                    # Los oyentes callados deben contestar para no ser desconectados
+                    self.writer.write(codificar("/pong", self.protocolo))
+                for enviado in self.patron.findall(mensaje):
+                    self.latencias.append(ahora - float(enviado))
+
+    async def emitir(self, intervalo, fin, ejecucion):
+        """Envía un mensaje cada 'intervalo' segundos hasta 'fin'; devuelve cuántos envió"""
+        enviados = 0
+        proximo = time.perf_counter()
+        while proximo < fin:
+            texto = f"bench {ejecucion} {time.perf_counter():.6f}"
+            self.writer.write(codificar(texto, self.protocolo))
+            enviados += 1
+            proximo += intervalo
+            await asyncio.sleep(max(0.0, proximo - time.perf_counter()))
+        return enviados
+
+    def cerrar(self):
+        if self.tarea_lectora:
+            self.tarea_lectora.cancel()
+        if self.writer:
+            self.writer.close()
+
+
+async def conectar_todos(clientes, host, puerto):
+    """Conecta a todos los clientes con un límite de conexiones simultáneas"""
+    limite = asyncio.Semaphore(CONEXIONES_SIMULTANEAS)
+    tiempos = []
+    errores = 0
+
+    async def conectar(cliente):
+        nonlocal errores
+        async with limite:
+            try:
+                tiempos.append(await asyncio.wait_for(cliente.conectar(host, puerto), TIEMPO_REGISTRO))
+            except (OSError, ConnectionError, asyncio.TimeoutError):
+                cliente.cerrar()
+                errores += 1
+
+    await asyncio.gather(*(conectar(cliente) for cliente in clientes))
+    return tiempos, errores
+
+
+async def muestrear_rss(pid, muestras, intervalo=0.5):
+    while True:
+        muestras.append(rss_kb(pid))
+        await asyncio.sleep(intervalo)
+
+
+async def ejecutar(args, pid_servidor):
+    ejecucion = uuid.uuid4().hex[:8]
+    patron = re.compile(rf"bench {ejecucion} (\d+\.\d+)")
+    latencias = []
+    clientes = [ClienteSimulado(i, args.protocolo, patron, latencias) for i in range(args.clientes)]
+
+    informar(f"Conectando {args.clientes} clientes a {args.host}:{args.puerto}...")
+    inicio = time.perf_counter()
+    tiempos_conexion, errores_conexion = await conectar_todos(clientes, args.host, args.puerto)
+    duracion_conexion = time.perf_counter() - inicio
+    conectados = [cliente for cliente in clientes if cliente.tarea_lectora is not None]
+    informar(f"{len(conectados)} conectados en {duracion_conexion:.2f} s ({errores_conexion} errores)")
+    if len(conectados) < 2:
+        raise SystemExit("Se necesitan al menos dos clientes conectados")
+
+    rss_conectados = rss_kb(pid_servidor) if pid_servidor else None
+    muestras_rss = []
+    muestreo = asyncio.ensure_future(muestrear_rss(pid_servidor, muestras_rss)) if pid_servidor else None
+
+    emisores = conectados[:max(1, min(args.emisores, len(conectados)))]
+    intervalo = len(emisores) / args.tasa
+    informar(f"Enviando {args.tasa} mensajes/seg desde {len(emisores)} emisores durante {args.duracion} s...")
+    inicio_envio = time.perf_counter()
+    fin = inicio_envio + args.duracion
+    enviados = sum(await asyncio.gather(*(emisor.emitir(intervalo, fin, ejecucion) for emisor in emisores)))
+    duracion_envio = time.perf_counter() - inicio_envio
+
+    # Cada mensaje llega a todos los de la sala menos al que lo envió
+    esperadas = enviados * (len(conectados) - 1)
+    limite_drenado = time.perf_counter() + args.drenado
+    while len(latencias) < esperadas and time.perf_counter() < limite_drenado:
+        await asyncio.sleep(0.05)
+    duracion_total = time.perf_counter() - inicio_envio
+
+    if muestreo:
+        muestreo.cancel()
+    for cliente in clientes:
+        cliente.cerrar()
+
+    ordenadas = sorted(latencias)
+    tiempos_conexion.sort()
+    return {
+        "etiqueta": args.etiqueta,
+        "configuracion": {
+            "clientes": args.clientes,
+            "emisores": len(emisores),
+            "tasa_objetivo": args.tasa,
+            "duracion": args.duracion,
+            "protocolo": args.protocolo,
+        },
+        "conexion": {
+            "conectados": len(conectados),
+            "errores": errores_conexion,
+            "segundos": round(duracion_conexion, 3),
+            "conexiones_por_seg": round(len(conectados) / duracion_conexion, 1),
+            "registro_p50_ms": en_ms(percentil(tiempos_conexion, 0.50)),
+            "registro_p99_ms": en_ms(percentil(tiempos_conexion, 0.99)),
+        },
+        "mensajes": {
+            "enviados": enviados,
+            "tasa_real": round(enviados / duracion_envio, 1),
+            "entregas_esperadas": esperadas,
+            "entregados": len(latencias),
+            "perdidos": max(0, esperadas - len(latencias)),
+            "entregados_por_seg": round(len(latencias) / duracion_total, 1),
+        },
+        "latencia_ms": {
+            "p50": en_ms(percentil(ordenadas, 0.50)),
+            "p95": en_ms(percentil(ordenadas, 0.95)),
+            "p99": en_ms(percentil(ordenadas, 0.99)),
+            "max": en_ms(ordenadas[-1] if ordenadas else None),
+        },
+        "rss_servidor_kb": {
+            "pid": pid_servidor,
+            "con_clientes": rss_conectados,
+            "maximo": max(muestras_rss) if muestras_rss else rss_conectados,
+        },
+    }
+
+
+def lanzar_servidor(argumentos, host, puerto):
+    """Arranca servidor_chat.py con los argumentos dados y espera a que acepte conexiones"""
+    ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servidor_chat.py")
+    proceso = subprocess.Popen(
+        [sys.executable, ruta] + shlex.split(argumentos),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    limite = time.time() + 10
+    while time.time() < limite:
+        try:
+            socket.create_connection((host, puerto), timeout=1).close()
+            return proceso
+        except OSError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise SystemExit("El servidor no empezó a aceptar conexiones")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga del servidor de chat (salida JSON)")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--clientes", type=int, default=1000, help="clientes simulados")
+    parser.add_argument("--emisores", type=int, default=10, help="clientes que envían mensajes")
+    parser.add_argument("--tasa", type=float, default=50, help="mensajes/seg en total entre todos los emisores")
+    parser.add_argument("--duracion", type=float, default=10, help="segundos enviando mensajes")
+    parser.add_argument("--drenado", type=float, default=5, help="segundos máximos esperando entregas pendientes")
+    parser.add_argument("--protocolo", choices=PROTOCOLOS, default=CRUDO,
+                        help="entramado de mensajes; debe coincidir con el del servidor")
+    parser.add_argument("--pid", type=int, help="PID del servidor para medir su memoria (RSS)")
+    parser.add_argument("--lanzar", metavar="ARGS",
+                        help="arranca servidor_chat.py con estos argumentos (p. ej. \"--modo async\") y lo mide")
+    parser.add_argument("--etiqueta", help="nombre de la ejecución en el JSON (por defecto, los argumentos de --lanzar)")
+    parser.add_argument("--salida", help="archivo donde guardar el JSON además de imprimirlo")
+    args = parser.parse_args()
+    if args.etiqueta is None:
+        args.etiqueta = args.lanzar
+    with contextlib.redirect_stdout(sys.stderr):
+        ajustar_limite_descriptores()
+
+    servidor = None
+    pid_servidor = args.pid
+    if args.lanzar is not None:
+        servidor = lanzar_servidor(args.lanzar, args.host, args.puerto)
+        pid_servidor = servidor.pid
+
+    try:
+        resultado = asyncio.run(ejecutar(args, pid_servidor))
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait()
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark de la compresión por conexión del chat
+Reproduce el flujo que recibe un cliente (avisos y mensajes de chat con el
+formato del servidor) y lo pasa por CompresionSalida, lote por lote, como lo
+haría su escritor. Informa cuántos bytes se ahorran y cuánta CPU cuesta,
+según el nivel de zlib, el diccionario y el tamaño de los lotes
+"""
+
+import argparse
+import random
+import time
+
+from compresion_chat import CompresionSalida, DescompresionEntrada, respuesta_capacidades, DICCIONARIO, ZLIB
+from protocolo_chat import codificar, PROTOCOLOS, LINEAS
+
+ARRANQUE = 10  # lotes iniciales, donde el diccionario es lo único que se puede referenciar
+
+PALABRAS = (
+    "hola", "qué", "tal", "todo", "bien", "alguien", "vio", "el", "partido", "de", "ayer", "sí",
+    "no", "creo", "que", "mañana", "llueve", "reunión", "a", "las", "diez", "nos", "vemos", "en",
+    "la", "sala", "dev", "revisé", "tu", "cambio", "gracias", "jaja", "ok", "perfecto", "listo",
+)
+
+
+def generar_trafico(mensajes, usuarios, protocolo, semilla=1):
+    """Tramas como las que el servidor encola para un cliente: chat numerado y algunos avisos"""
+    azar = random.Random(semilla)
+    nombres = [f"usuario_{i}" for i in range(usuarios)]
+    tramas = []
+    for secuencia in range(1, mensajes + 1):
+        hora = f"{12 + secuencia // 3600 % 12:02d}:{secuencia // 60 % 60:02d}:{secuencia % 60:02d}"
+        if secuencia % 50 == 0:
+            texto = f"*** {azar.choice(nombres)} se unió al chat ({usuarios} usuarios conectados) ***\n"
+        else:
+            palabras = " ".join(azar.choice(PALABRAS) for _ in range(azar.randint(2, 12)))
+            texto = f"[{hora} #{secuencia}] {azar.choice(nombres)}: {palabras}\n"
+        tramas.append(codificar(texto, protocolo))
+    return tramas
+
+
+def medir(tramas, lote, nivel, diccionario, protocolo):
+    """
+    Comprime el flujo en lotes de 'lote' tramas
+    Devuelve (bytes totales, bytes de los primeros ARRANQUE lotes, segundos de CPU)
+    """
+    marca = respuesta_capacidades(ZLIB, protocolo)
+    salida = CompresionSalida(marca, nivel, diccionario)
+    salida.preparar([marca])
+    lotes = [tramas[i:i + lote] for i in range(0, len(tramas), lote)]
+    inicio = time.process_time()
+    comprimidos = [salida.preparar(buffers)[0] for buffers in lotes]
+    cpu = time.process_time() - inicio
+
+    # Comprobación: el cliente recupera exactamente lo enviado
+    entrada = DescompresionEntrada(protocolo, diccionario)
+    recuperado = entrada.alimentar(marca) + b"".join(entrada.alimentar(datos) for datos in comprimidos)
+    assert recuperado == b"".join(tramas), "el flujo descomprimido no coincide"
+    return sum(len(datos) for datos in comprimidos), sum(len(datos) for datos in comprimidos[:ARRANQUE]), cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de compresión por conexión del chat")
+    parser.add_argument("--mensajes", type=int, default=20000)
+    parser.add_argument("--usuarios", type=int, default=50, help="nombres distintos en el tráfico")
+    parser.add_argument("--protocolo", choices=PROTOCOLOS, default=LINEAS)
+    args = parser.parse_args()
+
+    tramas = generar_trafico(args.mensajes, args.usuarios, args.protocolo)
+    originales = sum(len(datos) for datos in tramas)
+
+    print("=== BENCHMARK DE COMPRESIÓN ===")
+    print(f"{args.mensajes} mensajes, {originales / args.mensajes:.1f} bytes/mensaje sin comprimir, "
+          f"protocolo {args.protocolo}")
+    print(f"\n{'lote':>5} {'nivel':>6} {'dicc.':>6} {'bytes/msg':>10} {'ahorro':>8} "
+          f"{'ahorro arranque':>16} {'CPU µs/msg':>11}")
+    for lote in (1, 8, 64):
+        originales_arranque = sum(len(datos) for datos in tramas[:lote * ARRANQUE])
+        for nivel in (1, 6, 9):
+            for con_diccionario in (False, True):
+                comprimidos, arranque, cpu = medir(tramas, lote, nivel, DICCIONARIO if con_diccionario else b"",
+                                                   args.protocolo)
+                print(f"{lote:>5} {nivel:>6} {'sí' if con_diccionario else 'no':>6} "
+                      f"{comprimidos / args.mensajes:>10.1f} {1 - comprimidos / originales:>8.1%} "
+                      f"{1 - arranque / originales_arranque:>16.1%} {cpu / args.mensajes * 1e6:>11.2f}")
+    print("\nCada fila es el costo por destinatario: en una difusión a N clientes se multiplica por N")
+
+
+if __name__ == "__main__":
+    main()
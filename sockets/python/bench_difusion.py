@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark de la difusión del servidor de chat (modo hilos)
+Compara el envío original (codificar y send() por destinatario bajo el lock)
+con la difusión actual (codificar una vez, colas por cliente y escrituras
+vectorizadas). Usa conexiones TCP por loopback, como el servidor real
+"""
+
+import argparse
+import datetime
+import selectors
+import socket
+import threading
+import time
+
+import servidor_chat
+from salas_chat import SALA_POR_DEFECTO
+
+
+def difundir_legado(sockets_servidor, mensaje, lock):
+    """Difusión tal como era originalmente: un encode y un send por destinatario"""
+    mensaje_con_newline = mensaje + "\n"
+    with lock:
+        for sock in sockets_servidor:
+            sock.sendall(mensaje_con_newline.encode('utf-8'))
+
+
+def drenar(sockets_cliente, bytes_esperados, listo):
+    """Lee de todos los sockets de los clientes hasta recibir todo lo esperado"""
+    selector = selectors.DefaultSelector()
+    for sock in sockets_cliente:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+    recibidos = 0
+    while recibidos < bytes_esperados:
+        for clave, _ in selector.select(timeout=1):
+            try:
+                recibidos += len(clave.fileobj.recv(1 << 20))
+            except BlockingIOError:
+                pass
+    selector.close()
+    listo.set()
+
+
+def pares_tcp(cantidad):
+    """Crea pares (extremo servidor, extremo cliente) conectados por loopback"""
+    escucha = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    escucha.bind(("127.0.0.1", 0))
+    escucha.listen(cantidad)
+    pares = []
+    for _ in range(cantidad):
+        cliente = socket.create_connection(escucha.getsockname())
+        servidor, _ = escucha.accept()
+        pares.append((servidor, cliente))
+    escucha.close()
+    return pares
+
+
+def medir(nombre, clientes, mensajes, difundir, contar_escrituras):
+    pares = pares_tcp(clientes)
+    servidor = [a for a, _ in pares]
+    clientes_sock = [b for _, b in pares]
+
+    timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+    textos = [f"[{timestamp}] usuario_{i % 50}: mensaje de prueba número {i}" for i in range(mensajes)]
+    bytes_esperados = clientes * sum(len((t + "\n").encode('utf-8')) for t in textos)
+
+    listo = threading.Event()
+    lector = threading.Thread(target=drenar, args=(clientes_sock, bytes_esperados, listo), daemon=True)
+    lector.start()
+
+    contexto = difundir.preparar(servidor)
+    inicio = time.perf_counter()
+    cpu_inicio = time.process_time()
+    for texto in textos:
+        difundir(contexto, texto)
+    listo.wait()
+    duracion = time.perf_counter() - inicio
+    cpu = time.process_time() - cpu_inicio
+    escrituras = contar_escrituras(contexto)
+    difundir.terminar(contexto)
+
+    for a, b in pares:
+        a.close()
+        b.close()
+
+    entregados = clientes * mensajes
+    print(f"\n--- {nombre} ---")
+    print(f"Mensajes entregados: {entregados} en {duracion:.2f} s")
+    print(f"Mensajes entregados/seg: {entregados / duracion:,.0f}")
+    print(f"CPU por mensaje entregado: {cpu / entregados * 1e6:.2f} µs")
+    print(f"Escrituras al socket: {escrituras} ({escrituras / duracion:,.0f}/seg)")
+    return entregados / duracion
+
+
+class Legado:
+    """Difusión original"""
+
+    def preparar(self, sockets_servidor):
+        return {"sockets": sockets_servidor, "lock": threading.Lock()}
+
+    def __call__(self, contexto, texto):
+        difundir_legado(contexto["sockets"], texto, contexto["lock"])
+
+    def terminar(self, contexto):
+        pass
+
+
+class Actual:
+    """Difusión de servidor_chat con colas, codificación única y coalescencia"""
+
+    def __init__(self):
+        self.escrituras = 0
+        self._original = servidor_chat.enviar_vectorizado
+
+        def contar(sock, buffers):
+            self.escrituras += 1
+            self._original(sock, buffers)
+        servidor_chat.enviar_vectorizado = contar
+
+    def preparar(self, sockets_servidor):
+        servicio = servidor_chat.servicio
+        clientes = []
+        for i, sock in enumerate(sockets_servidor):
+            cliente = servidor_chat.ClienteChat(sock, ("local", i))
+            cliente.nombre = f"bench_{i}"
+            cliente.sala, _ = servicio.salas.entrar(SALA_POR_DEFECTO, cliente)
+            clientes.append(cliente)
+        return clientes
+
+    def __call__(self, contexto, texto):
+        servidor_chat.servicio.difundir_chat(contexto[0].sala, "bench", [texto])
+
+    def terminar(self, contexto):
+        for cliente in contexto:
+            servidor_chat.servicio.salas.salir(cliente.sala, cliente)
+            cliente.cola.cerrar()
+        servidor_chat.enviar_vectorizado = self._original
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de difusión del chat")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--mensajes", type=int, default=2000)
+    parser.add_argument("--ventana", type=float, default=2.0, help="ventana de coalescencia en ms")
+    args = parser.parse_args()
+
+    servidor_chat.CAPACIDAD_COLA = args.mensajes  # sin descartes durante la medición
+    servidor_chat.VENTANA_COALESCENCIA = args.ventana / 1000
+    servidor_chat.iniciar_servicio()
+
+    print("=== BENCHMARK DE DIFUSIÓN ===")
+    print(f"{args.clientes} clientes, {args.mensajes} mensajes, ventana {args.ventana} ms")
+
+    legado = Legado()
+    antes = medir("Antes (encode + send por destinatario)", args.clientes, args.mensajes,
+                  legado, lambda contexto: args.clientes * args.mensajes)
+    actual = Actual()
+    despues = medir("Después (encode único + writev coalescido)", args.clientes, args.mensajes,
+                    actual, lambda contexto: actual.escrituras)
+
+    print(f"\nMejora en mensajes entregados/seg: x{despues / antes:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bitácora persistente de los mensajes de chat
+Cada mensaje numerado se agrega al final del segmento activo (un archivo de
+tamaño acotado; al llenarse se abre el siguiente). Quien difunde solo encola
+el registro: un hilo escritor junta todo lo pendiente, lo escribe de una vez
+y hace un único fsync por lote (group commit), así el disco no pone techo al
+ritmo de mensajes. Para leer, cada segmento se mapea en memoria (mmap) y se
+recorren sus registros sin cargar el archivo. Al arrancar se descarta la
+cola incompleta que haya dejado una caída a mitad de escritura, y los
+segmentos más viejos se borran según la retención (tamaño total y antigüedad).
+Si el disco falla, el lote se reintenta con esperas crecientes: nunca se
+descarta, para no dejar huecos en el historial
+"""
+
+import atexit
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+
+from metricas_chat import metricas
+from registro_asincrono import registro
+
+TAMANO_SEGMENTO = 8 * 1024 * 1024  # bytes a partir de los cuales se abre un segmento nuevo
+RETENCION_BYTES = 256 * 1024 * 1024  # tamaño total máximo de la bitácora (0 = sin límite)
+RETENCION_SEGUNDOS = 0  # antigüedad máxima de un segmento cerrado (0 = sin límite)
+LIMITE_CONSULTA = 1000  # mensajes como máximo por consulta de historial
+ESPERA_REINTENTO = 0.1  # segundos antes de reintentar una escritura fallida; se duplica en cada fallo
+ESPERA_REINTENTO_MAXIMA = 5.0
+SUFIJO = ".seg"
+
+# crc32, longitud del cuerpo, secuencia, longitud del nombre de la sala; el
+# cuerpo es la sala seguida del texto (UTF-8). El crc cubre todo lo que sigue
+_CABECERA = struct.Struct("<IIQH")
+
+try:
+    _sincronizar = os.fdatasync
+except AttributeError:
+    _sincronizar = os.fsync
+
+
+def codificar_registro(sala, secuencia, texto):
+    sala = sala.encode("utf-8")
+    cuerpo = sala + texto.encode("utf-8")
+    resto = _CABECERA.pack(0, len(cuerpo), secuencia, len(sala))[4:] + cuerpo
+    return struct.pack("<I", zlib.crc32(resto)) + resto
+
+
+def leer_registros(datos):
+    """
+    Genera (fin, sala, secuencia, texto) por cada registro de 'datos' (bytes o
+    mmap); se detiene en el primero incompleto o dañado
+    """
+    posicion = 0
+    total = len(datos)
+    while posicion + _CABECERA.size <= total:
+        crc, longitud, secuencia, longitud_sala = _CABECERA.unpack_from(datos, posicion)
+        inicio = posicion + _CABECERA.size
+        fin = inicio + longitud
+        if fin > total or longitud_sala > longitud or zlib.crc32(datos[posicion + 4:fin]) != crc:
+            return
+        cuerpo = datos[inicio:fin]
+        yield fin, cuerpo[:longitud_sala].decode("utf-8"), secuencia, cuerpo[longitud_sala:].decode("utf-8")
+        posicion = fin
+
+
+class BitacoraChat:
+    """
+    Segmentos NNNNNNNNNN.seg en un directorio. En modo solo_lectura (trabajadores
+    del modo multiproceso) se consulta lo que escribe otro proceso
+    """
+
+    def __init__(self, directorio, tamano_segmento=TAMANO_SEGMENTO, retencion_bytes=RETENCION_BYTES,
+                 retencion_segundos=RETENCION_SEGUNDOS, solo_lectura=False):
+        self.directorio = directorio
+        self.tamano_segmento = tamano_segmento
+        self.retencion_bytes = retencion_bytes
+        self.retencion_segundos = retencion_segundos
+        self.solo_lectura = solo_lectura
+        # Segmento cerrado -> {sala: [primera, última secuencia]}; evita recorrer
+        # los segmentos que no tienen nada de la sala consultada. Lo modifica el
+        # hilo escritor mientras consultan otros: siempre con _lock_indices
+        self._indices = {}
+        self._lock_indices = threading.Lock()
+        self._cerrando = threading.Event()
+        self._cola = queue.SimpleQueue()
+        self._descriptor = None
+        self._segmento = 0
+        self._tamano = 0
+        self._indice_activo = {}
+        self._hilo = None
+        if solo_lectura:
+            return
+        os.makedirs(directorio, exist_ok=True)
+        self._recuperar()
+        self._aplicar_retencion()
+        self._hilo = threading.Thread(target=self._escribir_continuamente, daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    # --- Escritura ---
+
+    def agregar(self, sala, primera, textos):
+        """Encola mensajes consecutivos desde la secuencia 'primera'; no espera al disco"""
+        self._cola.put((sala, primera, textos))
+
+    def cerrar(self):
+        """Escribe y sincroniza lo pendiente; lo llama atexit"""
+        if self._hilo is None:
+            return
+        self._cerrando.set()
+        self._cola.put(None)
+        self._hilo.join()
+        self._hilo = None
+        os.close(self._descriptor)
+
+    def _ruta(self, numero):
+        return os.path.join(self.directorio, f"{numero:010d}{SUFIJO}")
+
+    def _segmentos(self):
+        """Números de los segmentos existentes, del más viejo al más nuevo"""
+        try:
+            nombres = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return []
+        return sorted(int(nombre[:-len(SUFIJO)]) for nombre in nombres
+                      if nombre.endswith(SUFIJO) and nombre[:-len(SUFIJO)].isdigit())
+
+    def _recuperar(self):
+        """Reabre el último segmento y corta lo que haya quedado a medio escribir"""
+        segmentos = self._segmentos()
+        if not segmentos:
+            self._abrir_segmento(1)
+            return
+        self._segmento = segmentos[-1]
+        indice, valido, _ = self._recorrer_segmento(self._segmento)
+        self._descriptor = os.open(self._ruta(self._segmento), os.O_WRONLY | os.O_APPEND)
+        tamano = os.fstat(self._descriptor).st_size
+        if valido < tamano:
+            registro.aviso("Bitácora: se descartan %d bytes incompletos al final de %s",
+                           tamano - valido, self._ruta(self._segmento))
+            os.ftruncate(self._descriptor, valido)
+            _sincronizar(self._descriptor)
+        self._tamano = valido
+        self._indice_activo = indice
+
+    def _abrir_segmento(self, numero):
+        """Pasa al segmento 'numero'; si falla, el activo sigue intacto y se puede reintentar"""
+        descriptor = os.open(self._ruta(numero), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # La entrada del directorio también tiene que llegar al disco
+            descriptor_directorio = os.open(self.directorio, os.O_RDONLY)
+            try:
+                os.fsync(descriptor_directorio)
+            finally:
+                os.close(descriptor_directorio)
+        except OSError:
+            os.close(descriptor)
+            raise
+        if self._descriptor is not None:
+            os.close(self._descriptor)
+            with self._lock_indices:
+                self._indices[self._segmento] = self._indice_activo
+        self._segmento = numero
+        self._descriptor = descriptor
+        self._tamano = 0
+        self._indice_activo = {}
+
+    def _escribir_continuamente(self):
+        while True:
+            lote = [self._cola.get()]
+            while True:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+            terminar = None in lote
+            pendientes = [entrada for entrada in lote if entrada is not None]
+            try:
+                self._escribir_lote(pendientes)
+            except OSError as e:
+                # Solo al cerrar: mientras tanto _reintentar insiste sin límite
+                registro.error("No se pudo escribir la bitácora al cerrar; se pierden %d mensajes: %s",
+                               sum(len(textos) for _, _, textos in pendientes), e)
+            if terminar:
+                return
+
+    def _escribir_lote(self, lote):
+        """Una escritura y un fsync para todo lo que se juntó mientras se sincronizaba el lote anterior"""
+        registros = []
+        tamano = self._tamano
+        for sala, primera, textos in lote:
+            for desplazamiento, texto in enumerate(textos):
+                datos = codificar_registro(sala, primera + desplazamiento, texto)
+                registros.append(datos)
+                tamano += len(datos)
+                rango = self._indice_activo.setdefault(sala, [primera + desplazamiento, 0])
+                rango[1] = primera + desplazamiento
+                if tamano >= self.tamano_segmento:
+                    # El segmento se llenó en medio del lote: se cierra y se sigue en el próximo
+                    self._confirmar(registros)
+                    self._reintentar(self._abrir_segmento, self._segmento + 1)
+                    self._aplicar_retencion()
+                    registros, tamano = [], 0
+        self._confirmar(registros)
+
+    def _confirmar(self, registros):
+        if not registros:
+            return
+        self._reintentar(self._escribir_sincronizado, b"".join(registros))
+        metricas.incrementar("chat_bitacora_registros_total", len(registros))
+
+    def _escribir_sincronizado(self, datos):
+        """
+        Escribe y sincroniza 'datos' al final del segmento. Un intento fallido
+        puede haber dejado un registro a medias, que ocultaría a los siguientes:
+        antes se corta el archivo en lo último confirmado
+        """
+        if os.fstat(self._descriptor).st_size != self._tamano:
+            os.ftruncate(self._descriptor, self._tamano)
+        inicio = time.perf_counter()
+        pendiente = memoryview(datos)
+        while pendiente:
+            pendiente = pendiente[os.write(self._descriptor, pendiente):]
+        _sincronizar(self._descriptor)
+        self._tamano += len(datos)
+        metricas.observar("chat_bitacora_commit_segundos", time.perf_counter() - inicio)
+
+    def _reintentar(self, operacion, *args):
+        """Repite la operación hasta que el disco la acepte; al cerrar deja de insistir y el error sube"""
+        espera = ESPERA_REINTENTO
+        while True:
+            try:
+                return operacion(*args)
+            except OSError as e:
+                metricas.incrementar("chat_bitacora_errores_total")
+                registro.error("No se pudo escribir la bitácora; se reintenta en %.1f s: %s", espera, e)
+                if self._cerrando.wait(espera):
+                    raise
+                espera = min(espera * 2, ESPERA_REINTENTO_MAXIMA)
+
+    def _aplicar_retencion(self):
+        """Borra segmentos cerrados, del más viejo al más nuevo, mientras se exceda la retención"""
+        segmentos = self._segmentos()
+        estados = {}
+        for numero in segmentos:
+            try:
+                estados[numero] = os.stat(self._ruta(numero))
+            except FileNotFoundError:
+                pass
+        total = sum(estado.st_size for estado in estados.values())
+        ahora = time.time()
+        for numero in segmentos[:-1]:  # el activo nunca se borra
+            estado = estados.get(numero)
+            if estado is None:
+                continue
+            excede_tamano = self.retencion_bytes and total > self.retencion_bytes
+            vencido = self.retencion_segundos and ahora - estado.st_mtime > self.retencion_segundos
+            if not (excede_tamano or vencido):
+                break
+            try:
+                os.remove(self._ruta(numero))
+            except OSError as e:
+                # No borrar no pone en riesgo los mensajes: se vuelve a intentar en el próximo segmento
+                registro.error("Bitácora: no se pudo borrar %s: %s", self._ruta(numero), e)
+                break
+            with self._lock_indices:
+                self._indices.pop(numero, None)
+            total -= estado.st_size
+            metricas.incrementar("chat_bitacora_segmentos_borrados_total")
+
+    # --- Lectura ---
+
+    def _mapear(self, numero):
+        """El segmento mapeado en memoria (None si está vacío o ya se borró)"""
+        try:
+            with open(self._ruta(numero), "rb") as archivo:
+                return mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _recorrer_segmento(self, numero, sala=None, desde=0, hasta=None):
+        """
+        Devuelve ({sala: [primera, última]}, bytes válidos, textos de 'sala' con
+        desde < secuencia < hasta) del segmento
+        """
+        indice, valido, textos = {}, 0, []
+        mapa = self._mapear(numero)
+        if mapa is None:
+            return indice, valido, textos
+        try:
+            for valido, sala_registro, secuencia, texto in leer_registros(mapa):
+                rango = indice.setdefault(sala_registro, [secuencia, secuencia])
+                rango[1] = secuencia
+                if sala_registro == sala and secuencia > desde and (hasta is None or secuencia < hasta):
+                    textos.append(texto)
+        finally:
+            mapa.close()
+        return indice, valido, textos
+
+    def _indice_guardado(self, numero):
+        with self._lock_indices:
+            return self._indices.get(numero)
+
+    def _guardar_indice(self, numero, indice):
+        with self._lock_indices:
+            self._indices.setdefault(numero, indice)
+
+    def _indice(self, numero, cerrado):
+        indice = self._indice_guardado(numero)
+        if indice is None:
+            indice, _, _ = self._recorrer_segmento(numero)
+            if cerrado:
+                self._guardar_indice(numero, indice)
+        return indice
+
+    def recorrer(self):
+        """Genera (sala, secuencia, texto) de todos los registros, del más viejo al más nuevo"""
+        segmentos = self._segmentos()
+        for numero in segmentos:
+            mapa = self._mapear(numero)
+            if mapa is None:
+                continue
+            indice = {}
+            try:
+                for _, sala, secuencia, texto in leer_registros(mapa):
+                    rango = indice.setdefault(sala, [secuencia, secuencia])
+                    rango[1] = secuencia
+                    yield sala, secuencia, texto
+            finally:
+                mapa.close()
+            if numero != segmentos[-1]:
+                self._guardar_indice(numero, indice)
+
+    def ultimas_secuencias(self):
+        """{sala: última secuencia registrada}; los segmentos cerrados salen de su índice"""
+        ultimas = {}
+        segmentos = self._segmentos()
+        for numero in segmentos:
+            for sala, (_, ultima) in self._indice(numero, numero != segmentos[-1]).items():
+                ultimas[sala] = max(ultimas.get(sala, 0), ultima)
+        return ultimas
+
+    def consultar(self, sala, desde, hasta=None, limite=LIMITE_CONSULTA):
+        """
+        Textos de la sala con desde < secuencia < hasta, en orden; si son más de
+        'limite', los más recientes. Recorre del segmento más nuevo hacia atrás
+        """
+        porciones = []
+        cantidad = 0
+        segmentos = self._segmentos()
+        for numero in reversed(segmentos):
+            cerrado = numero != segmentos[-1]
+            guardado = self._indice_guardado(numero) if cerrado else None
+            if guardado is not None:
+                rango = guardado.get(sala)
+                if rango is None or (hasta is not None and rango[0] >= hasta):
+                    continue
+                if rango[1] <= desde:
+                    break  # las secuencias crecen: lo anterior es todavía más viejo
+            indice, _, textos = self._recorrer_segmento(numero, sala, desde, hasta)
+            if cerrado:
+                self._guardar_indice(numero, indice)
+            porciones.append(textos)
+            cantidad += len(textos)
+            rango = indice.get(sala)
+            if (limite and cantidad >= limite) or (rango is not None and rango[0] <= desde + 1):
+                break
+        textos = [texto for porcion in reversed(porciones) for texto in porcion]
+        return textos[-limite:] if limite else textos
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bus local para el servidor de chat multiproceso
+Varios procesos trabajadores aceptan en el mismo puerto (SO_REUSEPORT) y se
+conectan por un socket Unix a un proceso central. El central recibe los
+eventos de todos (difusiones y altas/bajas de usuarios), los ordena y los
+reenvía a todos los trabajadores, incluido el de origen, así cada sala ve
+los mensajes en el mismo orden sin importar en qué proceso esté cada usuario.
+Los mensajes privados van solo al trabajador que atiende al destinatario.
+Como el central numera los mensajes de chat, es también quien los escribe en
+la bitácora; los trabajadores solo la leen
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+
+from historial_chat import formatear_chat
+from protocolo_chat import Reensamblador, TramaInvalida, codificar, codificar_lote, LONGITUD
+
+INTENTOS_CONEXION = 50
+ESPERA_ENTRE_INTENTOS = 0.1
+# Los eventos llevan mensajes de clientes ya entramados (cada uno hasta dos lecturas
+# de 64 KB) más el JSON alrededor: el bus admite tramas mucho mayores que los clientes
+TAMANO_MAXIMO_EVENTO = 16 * 1024 * 1024
+USUARIOS_POR_DIRECTORIO = 1000  # usuarios por evento del estado inicial
+# Bytes pendientes de enviar a un trabajador a partir de los cuales el central lo
+# desconecta: uno que no lee no puede hacer crecer la memoria del central sin límite
+LIMITE_BUFFER_TRABAJADOR = 4 * TAMANO_MAXIMO_EVENTO
+
+
+def bus_perdido():
+    """Sin el central el trabajador quedaría aislado y aceptando conexiones: termina"""
+    print("Conexión con el bus central perdida; el trabajador termina", flush=True)
+    os._exit(1)
+
+
+def volcar_evento(evento):
+    # Sin ensure_ascii: un texto no ASCII escapado como \uXXXX ocupa hasta 6 veces más
+    return json.dumps(evento, separators=(",", ":"), ensure_ascii=False)
+
+
+def entregar_evento(al_recibir_evento, trama):
+    """Un evento que no se puede procesar se descarta sin cortar el enlace con el central"""
+    try:
+        al_recibir_evento(json.loads(trama))
+    except Exception as e:
+        print(f"Bus: evento descartado: {e!r}", flush=True)
+
+
+def codificar_evento(evento):
+    """
+    Un evento del bus es un objeto JSON en una trama con prefijo de longitud
+    Lanza TramaInvalida si supera TAMANO_MAXIMO_EVENTO: así falla solo el
+    cliente que lo originó y no el enlace del trabajador con el central
+    """
+    datos = codificar(volcar_evento(evento), LONGITUD)
+    if len(datos) - 4 > TAMANO_MAXIMO_EVENTO:
+        raise TramaInvalida(f"Evento de {len(datos) - 4} bytes supera el máximo del bus")
+    return datos
+
+
+def eventos_directorio(usuarios):
+    """El estado inicial en trozos: el primero reemplaza el directorio, los demás se suman"""
+    nombres = list(usuarios)
+    for inicio in range(0, max(len(nombres), 1), USUARIOS_POR_DIRECTORIO):
+        trozo = {nombre: usuarios[nombre] for nombre in nombres[inicio:inicio + USUARIOS_POR_DIRECTORIO]}
+        yield {"tipo": "directorio", "usuarios": trozo, "inicio": inicio == 0}
+
+
+class DirectorioGlobal:
+    """Usuarios de todos los procesos y la sala en la que está cada uno"""
+
+    def __init__(self):
+        self._sala_de = {}
+        self._por_sala = {}
+        self._lock = threading.Lock()
+
+    def mover(self, nombre, sala):
+        """Registra al usuario en la sala (None = desconectado); es idempotente"""
+        with self._lock:
+            anterior = self._sala_de.pop(nombre, None)
+            if anterior is not None:
+                miembros = self._por_sala[anterior]
+                miembros.pop(nombre, None)
+                if not miembros:
+                    del self._por_sala[anterior]
+            if sala is not None:
+                self._sala_de[nombre] = sala
+                self._por_sala.setdefault(sala, {})[nombre] = True
+
+    def reemplazar(self, usuarios, inicio=True):
+        """Carga un trozo del estado inicial; el primero (inicio) descarta lo anterior"""
+        if inicio:
+            with self._lock:
+                self._sala_de = {}
+                self._por_sala = {}
+        for nombre, sala in usuarios.items():
+            self.mover(nombre, sala)
+
+    def usuarios(self, sala):
+        with self._lock:
+            return list(self._por_sala.get(sala, ()))
+
+    def contar(self, sala):
+        with self._lock:
+            return len(self._por_sala.get(sala, ()))
+
+    def salas(self):
+        """Devuelve [(nombre de la sala, miembros)] ordenado por nombre"""
+        with self._lock:
+            return sorted((sala, len(miembros)) for sala, miembros in self._por_sala.items())
+
+    def copia(self):
+        with self._lock:
+            return dict(self._sala_de)
+
+    def __contains__(self, nombre):
+        return nombre in self._sala_de
+
+
+class CentralBus:
+    """Proceso central: ordena los eventos de los trabajadores y los reenvía a todos"""
+
+    def __init__(self, socket_escucha, bitacora=None):
+        self.socket_escucha = socket_escucha
+        self.directorio = DirectorioGlobal()
+        self.trabajadores = set()
+        self.propietario = {}  # nombre de usuario -> writer del trabajador que lo atiende
+        self.bitacora = bitacora
+        # sala -> última secuencia de chat asignada; con bitácora sigue donde quedó
+        self.secuencias = bitacora.ultimas_secuencias() if bitacora is not None else {}
+
+    async def servir(self):
+        servidor = await asyncio.start_unix_server(self.atender_trabajador, sock=self.socket_escucha)
+        async with servidor:
+            await servidor.serve_forever()
+
+    async def atender_trabajador(self, reader, writer):
+        self.trabajadores.add(writer)
+        # Estado inicial para el trabajador que se acaba de conectar
+        for evento in eventos_directorio(self.directorio.copia()):
+            self.escribir(writer, codificar_evento(evento))
+        reensamblador = Reensamblador(LONGITUD, TAMANO_MAXIMO_EVENTO)
+        try:
+            while True:
+                datos = await reader.read(64 * 1024)
+                if not datos:
+                    break
+                tramas = []
+                for trama in reensamblador.alimentar(datos):
+                    evento = json.loads(trama)
+                    if evento.get("tipo") == "privado":
+                        # Lo anterior sale primero para no alterar el orden de los eventos
+                        self.reenviar_tramas(tramas)
+                        tramas = []
+                        self.enviar_privado(writer, evento, trama)
+                    else:
+                        tramas.append(self.ordenar_evento(writer, evento, trama))
+                # Todas las tramas de la lectura se reenvían con una escritura por trabajador
+                self.reenviar_tramas(tramas)
+        except (ConnectionError, ValueError, TramaInvalida) as e:
+            print(f"Bus: error con un trabajador: {e}")
+        finally:
+            self.trabajadores.discard(writer)
+            self.retirar_usuarios_de(writer)
+            writer.close()
+
+    def ordenar_evento(self, writer, evento, trama):
+        """Registra el evento y devuelve la trama a reenviar (numerada si es de chat)"""
+        if evento.get("tipo") == "chat":
+            primera = self.secuencias.get(evento["sala"], 0) + 1
+            self.secuencias[evento["sala"]] = primera + len(evento["textos"]) - 1
+            evento["primera"] = primera
+            if self.bitacora is not None:
+                self.bitacora.agregar(evento["sala"], primera, [
+                    formatear_chat(evento["hora"], primera + i, evento["nombre"], texto)
+                    for i, texto in enumerate(evento["textos"])
+                ])
+            return volcar_evento(evento)
+        self.registrar_evento(writer, evento)
+        return trama
+
+    def enviar_privado(self, writer, evento, trama):
+        """Entrega un mensaje privado solo al trabajador del destinatario"""
+        dueno = self.propietario.get(evento["destino"])
+        if dueno is not None:
+            self.escribir(dueno, codificar(trama, LONGITUD))
+        else:
+            # Se desconectó mientras el mensaje viajaba: se avisa al trabajador de origen
+            self.escribir(writer, codificar_evento(dict(evento, tipo="privado_fallido")))
+
+    def registrar_evento(self, writer, evento):
+        if evento.get("tipo") != "usuario":
+            return
+        nombre, sala = evento["nombre"], evento["sala"]
+        self.directorio.mover(nombre, sala)
+        if sala is None:
+            self.propietario.pop(nombre, None)
+        else:
+            self.propietario[nombre] = writer
+
+    def retirar_usuarios_de(self, writer):
+        """Un trabajador terminó: sus usuarios ya no están conectados"""
+        huerfanos = [nombre for nombre, dueno in self.propietario.items() if dueno is writer]
+        eventos = []
+        for nombre in huerfanos:
+            evento = {"tipo": "usuario", "nombre": nombre, "sala": None}
+            self.registrar_evento(writer, evento)
+            eventos.append(volcar_evento(evento))
+        if eventos:
+            self.reenviar(codificar_lote(eventos, LONGITUD))
+
+    def reenviar_tramas(self, tramas):
+        if tramas:
+            self.reenviar(codificar_lote(tramas, LONGITUD))
+
+    def reenviar(self, datos):
+        for trabajador in list(self.trabajadores):
+            self.escribir(trabajador, datos)
+
+    def escribir(self, trabajador, datos):
+        """
+        Encola datos para un trabajador sin esperarlo. Si acumula más de
+        LIMITE_BUFFER_TRABAJADOR sin leer se le corta la conexión: descartar
+        eventos rompería el orden común, y sin bus el trabajador termina
+        """
+        if trabajador.is_closing():
+            return
+        trabajador.write(datos)
+        if trabajador.transport.get_write_buffer_size() > LIMITE_BUFFER_TRABAJADOR:
+            print("Bus: un trabajador no lee sus eventos; se lo desconecta", flush=True)
+            self.trabajadores.discard(trabajador)
+            # abort() descarta lo pendiente; atender_trabajador retira a sus usuarios
+            trabajador.transport.abort()
+
+
+def crear_socket_bus(ruta):
+    """Socket Unix de escucha del central; se crea antes de lanzar a los trabajadores"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(ruta)
+    sock.listen(socket.SOMAXCONN)
+    return sock
+
+
+class ConexionBus:
+    """Conexión de un trabajador con hilos al bus central"""
+
+    def __init__(self, ruta, al_recibir_evento):
+        self.al_recibir_evento = al_recibir_evento
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        for intento in range(INTENTOS_CONEXION):
+            try:
+                self.socket.connect(ruta)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if intento == INTENTOS_CONEXION - 1:
+                    raise
+                time.sleep(ESPERA_ENTRE_INTENTOS)
+        self._lock_envio = threading.Lock()
+
+    def escuchar(self):
+        """Empieza a entregar los eventos del central a al_recibir_evento"""
+        threading.Thread(target=self._leer, daemon=True).start()
+
+    def publicar(self, evento):
+        datos = codificar_evento(evento)
+        with self._lock_envio:
+            self.socket.sendall(datos)
+
+    def _leer(self):
+        reensamblador = Reensamblador(LONGITUD, TAMANO_MAXIMO_EVENTO)
+        try:
+            while True:
+                datos = self.socket.recv(64 * 1024)
+                if not datos:
+                    break
+                for trama in reensamblador.alimentar(datos):
+                    entregar_evento(self.al_recibir_evento, trama)
+        except (OSError, TramaInvalida) as e:
+            print(f"Bus: error leyendo del central: {e}", flush=True)
+        bus_perdido()
+
+
+class ConexionBusAsync:
+    """Conexión de un trabajador asyncio al bus central"""
+
+    def __init__(self, ruta, al_recibir_evento):
+        self.ruta = ruta
+        self.al_recibir_evento = al_recibir_evento
+        self.reader = None
+        self.writer = None
+
+    async def conectar(self):
+        for intento in range(INTENTOS_CONEXION):
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.ruta)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if intento == INTENTOS_CONEXION - 1:
+                    raise
+                await asyncio.sleep(ESPERA_ENTRE_INTENTOS)
+
+    def escuchar(self):
+        """Empieza a entregar los eventos del central a al_recibir_evento"""
+        asyncio.ensure_future(self._leer())
+
+    def publicar(self, evento):
+        self.writer.write(codificar_evento(evento))
+
+    async def _leer(self):
+        reensamblador = Reensamblador(LONGITUD, TAMANO_MAXIMO_EVENTO)
+        try:
+            while True:
+                datos = await self.reader.read(64 * 1024)
+                if not datos:
+                    break
+                for trama in reensamblador.alimentar(datos):
+                    entregar_evento(self.al_recibir_evento, trama)
+        except (OSError, TramaInvalida) as e:
+            print(f"Bus: error leyendo del central: {e}", flush=True)
+        bus_perdido()
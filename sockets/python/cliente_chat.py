@@ -2,15 +2,74 @@
 # -*- coding: utf-8 -*-
 """
 Cliente de chat que se conecta al servidor y permite chatear con otros usuarios
+Con --modo async (o --guion) se usa el cliente asyncio de cliente_chat_async.py,
+que se reconecta solo y puede leer los mensajes de un archivo o tubería
 """
 
+import argparse
 import socket
 import threading
 
+from cliente_chat_async import iniciar_cliente_async
+from compresion_chat import DescompresionEntrada, ZLIB
+from protocolo_chat import (Reensamblador, codificar, codificar_preambulo, tamano_lectura,
+                            PATRON_SECUENCIA, PROTOCOLOS, CRUDO, LINEAS)
+
 HOST = 'localhost'
 PUERTO = 8082
 
+ultima_secuencia = None  # último mensaje de chat recibido, para reanudar
+
+# El hilo lector responde /pong mientras el principal envía lo que se escribe
+lock_envio = threading.Lock()
+
+def enviar(cliente_socket, texto, protocolo):
+    with lock_envio:
+        cliente_socket.sendall(codificar(texto, protocolo))
+
 def main():
+    parser = argparse.ArgumentParser(description="Cliente de chat")
+    parser.add_argument(
+        "--protocolo", choices=PROTOCOLOS, default=CRUDO,
+        help="entramado de mensajes; debe coincidir con el del servidor"
+    )
+    parser.add_argument(
+        "--reanudar", type=int, metavar="N",
+        help="al reconectar, recibir solo los mensajes posteriores al número N"
+    )
+    parser.add_argument(
+        "--comprimir", action="store_true",
+        help="pide al servidor que comprima con zlib todo lo que envía a este cliente"
+    )
+    parser.add_argument(
+        "--modo", choices=["hilos", "async"], default="hilos",
+        help="hilos: un hilo lector e input() (original); async: se reconecta solo y junta lo pegado"
+    )
+    parser.add_argument("--nombre", help="nombre de usuario (modo async); si falta, es la primera línea de la entrada")
+    parser.add_argument(
+        "--guion", metavar="ARCHIVO",
+        help="modo no interactivo: envía las líneas de ARCHIVO ('-' = stdin) y sale al terminar; implica --modo async"
+    )
+    parser.add_argument(
+        "--intervalo", type=float, default=0.0, metavar="SEG",
+        help="segundos entre mensajes del guion (0 = lo más rápido posible, juntando líneas); "
+             "con --protocolo crudo hay siempre una pausa mínima, mejor usar lineas o longitud"
+    )
+    parser.add_argument(
+        "--max-reintentos", type=int, metavar="N",
+        help="reconexiones seguidas antes de rendirse (modo async; por defecto, sin límite)"
+    )
+    args = parser.parse_args()
+    protocolo = args.protocolo
+    
+    if args.modo == "async" or args.guion is not None:
+        iniciar_cliente_async(
+            host=HOST, puerto=PUERTO, nombre=args.nombre, protocolo=protocolo, reanudar=args.reanudar,
+            guion=args.guion, intervalo=args.intervalo, max_reintentos=args.max_reintentos,
+            comprimir=args.comprimir
+        )
+        return
+    
     print("=== CLIENTE DE CHAT ===")
     print(f"Conectando al chat en {HOST}:{PUERTO}")
     
@@ -21,10 +80,20 @@ def main():
         
         print("Conectado al servidor de chat!")
         
+        # Antes del nombre: capacidades y, al reconectar, desde dónde reenviar el historial
+        preambulo = []
+        if args.comprimir:
+            preambulo.append(f"/capacidades {ZLIB}")
+        if args.reanudar is not None:
+            preambulo.append(f"/reanudar {args.reanudar}")
+        if preambulo:
+            with lock_envio:
+                cliente.sendall(codificar_preambulo(preambulo, protocolo))
+        
         # Crear hilo para leer mensajes del servidor
         hilo_lector = threading.Thread(
             target=leer_mensajes_servidor,
-            args=(cliente,),
+            args=(cliente, protocolo, args.comprimir),
             daemon=True
         )
         hilo_lector.start()
@@ -34,10 +103,10 @@ def main():
             mensaje = input()
             
             if mensaje.lower().strip() == "/salir":
-                cliente.send("/salir".encode('utf-8'))
+                enviar(cliente, "/salir", protocolo)
                 break
                 
-            cliente.send(mensaje.encode('utf-8'))
+            enviar(cliente, mensaje, protocolo)
             
     except ConnectionRefusedError:
         print("No se pudo conectar al servidor de chat.")
@@ -49,22 +118,45 @@ def main():
     finally:
         cliente.close()
         print("Desconectado del chat")
+        if ultima_secuencia is not None:
+            print(f"Último mensaje recibido: #{ultima_secuencia} (reconecta con --reanudar {ultima_secuencia})")
 
-def leer_mensajes_servidor(cliente_socket):
+def leer_mensajes_servidor(cliente_socket, protocolo=CRUDO, comprimir=False):
     """
     Hilo separado para leer mensajes del servidor continuamente
     """
+    global ultima_secuencia
+    reensamblador = Reensamblador(protocolo)
+    entrada = DescompresionEntrada(protocolo) if comprimir else None
+    # En modo líneas el reensamblador quita el '\n' final de cada mensaje
+    fin_linea = "\n" if protocolo == LINEAS else ""
     try:
         while True:
-            mensaje = cliente_socket.recv(1024)
-            if not mensaje:
+            datos = cliente_socket.recv(tamano_lectura(protocolo))
+            if not datos:
                 break
+            if entrada is not None:
+                datos = entrada.alimentar(datos)
                 
-            print(mensaje.decode('utf-8'), end='')
+            for mensaje in reensamblador.alimentar(datos):
+                mensaje = responder_latidos(cliente_socket, mensaje, protocolo)
+                if not mensaje:
+                    continue
+                print(mensaje, end=fin_linea, flush=True)
+                for secuencia in PATRON_SECUENCIA.findall(mensaje):
+                    ultima_secuencia = int(secuencia)
             
     except Exception as e:
         if not cliente_socket._closed:
             print(f"Error leyendo mensajes: {e}")
 
+def responder_latidos(cliente_socket, mensaje, protocolo):
+    """Contesta /pong a cada /ping del servidor y lo quita del texto a mostrar"""
+    lineas = mensaje.split("\n")
+    restantes = [linea for linea in lineas if linea.strip() != "/ping"]
+    for _ in range(len(lineas) - len(restantes)):
+        enviar(cliente_socket, "/pong", protocolo)
+    return "\n".join(restantes) if len(restantes) < len(lineas) else mensaje
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cliente de chat basado en asyncio
+Si la conexión se cae se reconecta solo, con espera exponencial y variación
+aleatoria para que un reinicio del servidor no reciba a todos los clientes
+en el mismo instante, y pide con /reanudar lo que se perdió. Las líneas que
+llegan juntas por stdin (un pegado) salen en una sola escritura. En modo
+guion lee los mensajes de un archivo o tubería, sin interacción: es lo que
+usan los bots y las pruebas de carga. Con comprimir=True pide zlib al servidor
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+
+from compresion_chat import DescompresionEntrada, ZLIB
+from protocolo_chat import (Reensamblador, codificar, codificar_lote, codificar_preambulo, tamano_lectura,
+                            PATRON_SECUENCIA, CRUDO, LINEAS)
+
+HOST = 'localhost'
+PUERTO = 8082
+ESPERA_INICIAL = 0.5  # segundos antes del primer reintento
+ESPERA_MAXIMA = 30.0  # tope de la espera exponencial
+SESION_ESTABLE = 10.0  # segundos conectado tras los que la espera vuelve a empezar
+TIEMPO_CIERRE = 2.0  # segundos esperando que el servidor cierre tras /salir
+PAUSA_CRUDO = 0.05  # pausa mínima entre escrituras en modo crudo, para que no lleguen en una misma lectura
+
+
+def informar(texto):
+    """Los avisos del cliente van a stderr; stdout queda para los mensajes del chat"""
+    print(texto, file=sys.stderr, flush=True)
+
+
+def espera_reconexion(intento, inicial=ESPERA_INICIAL, maxima=ESPERA_MAXIMA):
+    """Espera exponencial con variación completa: al azar entre 0 y min(maxima, inicial * 2^intento)"""
+    return random.uniform(0, min(maxima, inicial * 2 ** intento))
+
+
+class ClienteChatAsync:
+    """Sesión de chat que sobrevive a las desconexiones del servidor"""
+
+    def __init__(self, host=HOST, puerto=PUERTO, nombre=None, protocolo=CRUDO, reanudar=None,
+                 guion=None, intervalo=0.0, max_reintentos=None, comprimir=False):
+        self.host = host
+        self.puerto = puerto
+        self.nombre = nombre
+        self.protocolo = protocolo
+        self.ultima_secuencia = reanudar
+        self.guion = guion
+        self.intervalo = intervalo
+        self.max_reintentos = max_reintentos
+        self.comprimir = comprimir
+        self.lineas = None
+        # En modo crudo cada lectura del servidor es un mensaje: juntar líneas, o
+        # escribirlas seguidas, las fundiría en uno (y un /salir final no se vería)
+        self.juntar_lineas = protocolo != CRUDO and not intervalo
+        self.pausa = max(intervalo, PAUSA_CRUDO) if protocolo == CRUDO else intervalo
+
+    def iniciar_entrada(self):
+        """Un hilo lee stdin o el guion y pasa las líneas al bucle (None = fin de la entrada)"""
+        bucle = asyncio.get_running_loop()
+        self.lineas = asyncio.Queue()
+
+        def leer():
+            archivo = sys.stdin if self.guion in (None, "-") else open(self.guion, encoding="utf-8")
+            with archivo:
+                for linea in archivo:
+                    bucle.call_soon_threadsafe(self.lineas.put_nowait, linea.rstrip("\r\n"))
+            bucle.call_soon_threadsafe(self.lineas.put_nowait, None)
+
+        threading.Thread(target=leer, daemon=True).start()
+
+    async def ejecutar(self):
+        """Conecta y reconecta hasta que la entrada termina o se pide /salir"""
+        self.iniciar_entrada()
+        intento = 0
+        while True:
+            inicio = time.monotonic()
+            try:
+                if await self.sesion():
+                    return
+                informar("Conexión con el servidor perdida")
+            except OSError as e:
+                informar(f"No se pudo conectar a {self.host}:{self.puerto}: {e}")
+            if time.monotonic() - inicio >= SESION_ESTABLE:
+                intento = 0
+            if self.max_reintentos is not None and intento >= self.max_reintentos:
+                informar("Se agotaron los reintentos")
+                return
+            espera = espera_reconexion(intento)
+            intento += 1
+            informar(f"Reconectando en {espera:.1f} s (intento {intento})...")
+            await asyncio.sleep(espera)
+
+    async def sesion(self):
+        """Una conexión completa; devuelve True si terminó por pedido del usuario"""
+        reader, writer = await asyncio.open_connection(self.host, self.puerto)
+        try:
+            reensamblador = Reensamblador(self.protocolo)
+            pedido = await reader.read(tamano_lectura(self.protocolo))  # "Ingresa tu nombre: "
+            if self.nombre is None:
+                for mensaje in reensamblador.alimentar(pedido):
+                    print(mensaje, end="", flush=True)
+                self.nombre = await self.lineas.get()
+                if self.nombre is None:
+                    return True
+            informar(f"Conectado a {self.host}:{self.puerto} como '{self.nombre}'")
+            preambulo = []
+            if self.comprimir:
+                preambulo.append(f"/capacidades {ZLIB}")
+            if self.ultima_secuencia is not None:
+                # Antes del nombre, para que el servidor reenvíe solo lo que faltó
+                preambulo.append(f"/reanudar {self.ultima_secuencia}")
+            # El flujo comprimido (si el servidor acepta) empieza de cero en cada conexión
+            entrada = DescompresionEntrada(self.protocolo) if self.comprimir else None
+            writer.write(codificar_preambulo(preambulo + [self.nombre], self.protocolo))
+
+            # Hasta que el servidor contesta no se envía nada más: en modo crudo se
+            # pegaría al nombre en la misma lectura
+            registrado = asyncio.Event()
+            lectura = asyncio.ensure_future(self.leer(reader, writer, reensamblador, entrada, registrado))
+            escritura = asyncio.ensure_future(self.escribir(writer, registrado))
+            await asyncio.wait((lectura, escritura), return_when=asyncio.FIRST_COMPLETED)
+            if escritura.done() and not escritura.exception():
+                # Se envió /salir: se espera a que el servidor cierre para no perder lo último
+                try:
+                    await asyncio.wait_for(lectura, TIEMPO_CIERRE)
+                except asyncio.TimeoutError:
+                    pass
+                return True
+            escritura.cancel()
+            lectura.cancel()
+            return False
+        finally:
+            writer.close()
+
+    async def leer(self, reader, writer, reensamblador, entrada=None, registrado=None):
+        """Muestra lo que llega, contesta los /ping y recuerda la última secuencia"""
+        fin_linea = "\n" if self.protocolo == LINEAS else ""
+        while True:
+            try:
+                datos = await reader.read(tamano_lectura(self.protocolo))
+            except ConnectionError:
+                return
+            if not datos:
+                return
+            if registrado is not None:
+                registrado.set()
+            if entrada is not None:
+                datos = entrada.alimentar(datos)
+            for mensaje in reensamblador.alimentar(datos):
+                lineas = mensaje.split("\n")
+                restantes = [linea for linea in lineas if linea.strip() != "/ping"]
+                for _ in range(len(lineas) - len(restantes)):
+                    writer.write(codificar("/pong", self.protocolo))
+                if len(restantes) < len(lineas):
+                    mensaje = "\n".join(restantes)
+                    if not mensaje:
+                        continue
+                print(mensaje, end=fin_linea, flush=True)
+                for secuencia in PATRON_SECUENCIA.findall(mensaje):
+                    self.ultima_secuencia = int(secuencia)
+
+    async def escribir(self, writer, registrado=None):
+        """Envía las líneas de la entrada; las que ya esperan en la cola van en la misma escritura"""
+        if registrado is not None:
+            await registrado.wait()
+        while True:
+            lote = [await self.lineas.get()]
+            if self.juntar_lineas:
+                while not self.lineas.empty():
+                    lote.append(self.lineas.get_nowait())
+            mensajes = []
+            salir = False
+            for linea in lote:
+                if linea is None or linea.strip().lower() == "/salir":
+                    salir = True
+                    break
+                if linea.strip():
+                    mensajes.append(linea)
+            if salir:
+                mensajes.append("/salir")
+            if mensajes:
+                writer.write(codificar_lote(mensajes, self.protocolo))
+                await writer.drain()
+            if salir:
+                return
+            if self.pausa:
+                await asyncio.sleep(self.pausa)
+
+
+def iniciar_cliente_async(**opciones):
+    """Punto de entrada del modo asyncio"""
+    cliente = ClienteChatAsync(**opciones)
+    try:
+        asyncio.run(cliente.ejecutar())
+    except KeyboardInterrupt:
+        informar("\nDesconectando del chat...")
+    informar("Desconectado del chat")
+    if cliente.ultima_secuencia is not None:
+        informar(f"Último mensaje recibido: #{cliente.ultima_secuencia} "
+                 f"(reconecta con --reanudar {cliente.ultima_secuencia})")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Colas de salida acotadas, una por cliente del chat
+La difusión solo encola; un escritor dedicado vacía la cola hacia el socket,
+así un lector lento únicamente llena su propia cola y no frena a los demás
+"""
+
+import asyncio
+import collections
+import threading
+
+# Políticas de desbordamiento
+DESCARTAR_ANTIGUO = "descartar_antiguo"
+DESCARTAR_NUEVO = "descartar_nuevo"
+DESCONECTAR = "desconectar"
+POLITICAS = (DESCARTAR_ANTIGUO, DESCARTAR_NUEVO, DESCONECTAR)
+
+CAPACIDAD_POR_DEFECTO = 256
+
+
+class _ColaAcotada:
+    """Lógica común de capacidad y política de desbordamiento"""
+
+    def __init__(self, capacidad=CAPACIDAD_POR_DEFECTO, politica=DESCARTAR_ANTIGUO):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política '{politica}' no soportada")
+        self.capacidad = capacidad
+        self.politica = politica
+        self.descartados = 0
+        self.cerrada = False
+        self._datos = collections.deque()
+
+    @property
+    def profundidad(self):
+        """Mensajes pendientes de escribir en el socket"""
+        return len(self._datos)
+
+    def _agregar(self, buffers):
+        """
+        Encola una lista de buffers aplicando la política de desbordamiento
+        Devuelve False si el cliente debe desconectarse
+        """
+        if self.cerrada:
+            return False
+        libres = self.capacidad - len(self._datos)
+        if len(buffers) <= libres:
+            # Caso común: hay espacio y el lote entra de una vez
+            self._datos.extend(buffers)
+            return True
+
+        if self.politica == DESCONECTAR:
+            self.cerrada = True
+            self._datos.clear()
+            return False
+        exceso = len(buffers) - libres
+        self.descartados += exceso
+        if self.politica == DESCARTAR_NUEVO:
+            self._datos.extend(buffers[:max(libres, 0)])
+        else:
+            self._datos.extend(buffers)
+            for _ in range(exceso):
+                self._datos.popleft()
+        return True
+
+    def _extraer_todo(self):
+        lote = list(self._datos)
+        self._datos.clear()
+        return lote
+
+
+class ColaSalida(_ColaAcotada):
+    """Cola para el servidor con hilos: la llenan los difusores, la vacía el hilo escritor"""
+
+    def __init__(self, capacidad=CAPACIDAD_POR_DEFECTO, politica=DESCARTAR_ANTIGUO):
+        super().__init__(capacidad, politica)
+        self._condicion = threading.Condition(threading.Lock())
+
+    def poner(self, datos):
+        """Encola bytes; devuelve False si el cliente debe desconectarse"""
+        return self.poner_lote([datos])
+
+    def poner_lote(self, buffers):
+        """Encola varios buffers con una sola toma del lock"""
+        with self._condicion:
+            estaba_vacia = not self._datos
+            aceptado = self._agregar(buffers)
+            # Solo hace falta despertar al escritor si estaba esperando
+            if (estaba_vacia and self._datos) or self.cerrada:
+                self._condicion.notify()
+            return aceptado
+
+    def tomar_lote(self):
+        """Bloquea hasta tener datos y devuelve todos los pendientes (None si se cerró y vació)"""
+        with self._condicion:
+            while not self._datos and not self.cerrada:
+                self._condicion.wait()
+            if not self._datos:
+                return None
+            return self._extraer_todo()
+
+    def cerrar(self):
+        """Deja de aceptar datos; el escritor termina tras vaciar lo pendiente"""
+        with self._condicion:
+            self.cerrada = True
+            self._condicion.notify()
+
+
+class ColaSalidaAsync(_ColaAcotada):
+    """Cola para el servidor asyncio: se usa solo desde el hilo del bucle de eventos"""
+
+    def __init__(self, capacidad=CAPACIDAD_POR_DEFECTO, politica=DESCARTAR_ANTIGUO):
+        super().__init__(capacidad, politica)
+        self._hay_datos = asyncio.Event()
+
+    def poner(self, datos):
+        """Encola bytes; devuelve False si el cliente debe desconectarse"""
+        return self.poner_lote([datos])
+
+    def poner_lote(self, buffers):
+        """Encola varios buffers de una vez"""
+        aceptado = self._agregar(buffers)
+        if self._datos or self.cerrada:
+            self._hay_datos.set()
+        return aceptado
+
+    async def tomar_lote(self):
+        """Espera a tener datos y devuelve todos los pendientes (None si se cerró y vació)"""
+        while not self._datos and not self.cerrada:
+            self._hay_datos.clear()
+            await self._hay_datos.wait()
+        if not self._datos:
+            return None
+        return self._extraer_todo()
+
+    def cerrar(self):
+        """Deja de aceptar datos; el escritor termina tras vaciar lo pendiente"""
+        self.cerrada = True
+        self._hay_datos.set()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compresión zlib por conexión, negociada antes del nombre
+El cliente pide "/capacidades zlib"; si el servidor acepta responde con la
+misma línea sin comprimir y, desde ahí, todo lo que envía a ese cliente es un
+único flujo deflate. Cada lote de la cola se comprime con una sola llamada y
+se cierra con Z_SYNC_FLUSH, así el cliente puede mostrarlo en cuanto llega.
+El flujo arranca con un diccionario de frases frecuentes del chat, de modo que
+hasta los primeros mensajes se comprimen bien. Solo se comprime el sentido
+servidor -> cliente, que es donde la difusión multiplica los bytes
+"""
+
+import time
+import zlib
+
+from metricas_chat import metricas
+from protocolo_chat import codificar, CRUDO
+
+ZLIB = "zlib"
+NINGUNA = "ninguna"  # respuesta cuando no se acepta ninguna capacidad pedida
+CAPACIDADES = (ZLIB,)
+NIVEL_POR_DEFECTO = 1  # ver bench_compresion.py: los niveles altos cuestan mucha CPU por destinatario
+
+# Frases que se repiten en casi todos los mensajes del servidor; deflate busca
+# coincidencias aquí como si ya se hubieran enviado (lo más frecuente, al final)
+DICCIONARIO = (
+    " no está conectado\n"
+    "Uso: /msg <usuario> <texto>\n"
+    "Salas (): general ()\n"
+    "Usuarios conectados (): \n"
+    "--- mensajes anteriores en 'general' ---\n"
+    "*** abandonó el chat ( usuarios restantes) ***\n"
+    "*** se fue a la sala '' ***\n"
+    "*** se unió a la sala '' ( usuarios en la sala) ***\n"
+    "*** se unió al chat ( usuarios conectados) ***\n"
+    "(privado para ) (privado) \n"
+    "/ping\n"
+    "] : \n[ #"
+).encode("utf-8")
+
+
+def respuesta_capacidades(aceptada, protocolo=CRUDO):
+    """Línea sin comprimir con la que el servidor contesta; si acepta zlib, el flujo comprimido empieza después"""
+    return codificar(f"/capacidades {aceptada}\n", protocolo)
+
+
+class CompresionSalida:
+    """
+    Lado del servidor: los lotes de la cola de un cliente pasan sin cambios hasta
+    la confirmación (identificada por identidad del objeto bytes) y comprimidos
+    después. Solo la llama el escritor de ese cliente
+    """
+
+    def __init__(self, marca, nivel=NIVEL_POR_DEFECTO, diccionario=DICCIONARIO):
+        self.marca = marca
+        self.activa = False
+        self._compresor = zlib.compressobj(nivel, zlib.DEFLATED, zlib.MAX_WBITS, 9,
+                                           zlib.Z_DEFAULT_STRATEGY, diccionario)
+
+    def preparar(self, lote):
+        """Devuelve los buffers a escribir en el socket para este lote"""
+        if self.activa:
+            return [self.comprimir(lote)]
+        for posicion, datos in enumerate(lote):
+            if datos is self.marca:
+                self.activa = True
+                resto = lote[posicion + 1:]
+                return lote[:posicion + 1] + ([self.comprimir(resto)] if resto else [])
+        return lote
+
+    def comprimir(self, buffers):
+        inicio = time.perf_counter()
+        original = b"".join(buffers)
+        comprimido = self._compresor.compress(original) + self._compresor.flush(zlib.Z_SYNC_FLUSH)
+        metricas.observar("chat_compresion_segundos", time.perf_counter() - inicio)
+        metricas.incrementar("chat_compresion_bytes_originales_total", len(original))
+        metricas.incrementar("chat_compresion_bytes_comprimidos_total", len(comprimido))
+        return comprimido
+
+
+class DescompresionEntrada:
+    """
+    Lado del cliente que pidió zlib: entrega los bytes tal cual hasta ver la
+    respuesta del servidor (que se quita) y, si aceptó, los descomprime a partir de ahí
+    """
+
+    def __init__(self, protocolo=CRUDO, diccionario=DICCIONARIO):
+        self.diccionario = diccionario
+        self._aceptada = respuesta_capacidades(ZLIB, protocolo)
+        self._rechazada = respuesta_capacidades(NINGUNA, protocolo)
+        self.resuelta = False
+        self.activa = False
+        self._retenido = b""
+        self._descompresor = None
+
+    def alimentar(self, datos):
+        if self.activa:
+            return self._descompresor.decompress(datos)
+        if self.resuelta:
+            return datos
+        datos = self._retenido + datos
+        for marca in (self._aceptada, self._rechazada):
+            posicion = datos.find(marca)
+            if posicion >= 0:
+                break
+        else:
+            # Se retiene una cola por si la respuesta quedó partida entre dos lecturas
+            corte = max(0, len(datos) - max(len(self._aceptada), len(self._rechazada)) + 1)
+            self._retenido = datos[corte:]
+            return datos[:corte]
+        self._retenido = b""
+        self.resuelta = True
+        resto = datos[posicion + len(marca):]
+        if marca is self._aceptada:
+            self.activa = True
+            self._descompresor = zlib.decompressobj(zlib.MAX_WBITS, zdict=self.diccionario)
+            resto = self._descompresor.decompress(resto)
+        return datos[:posicion] + resto
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Difusión coalescida de mensajes del chat
+Cada mensaje se codifica una sola vez. Los mensajes publicados dentro de una
+ventana corta se juntan en un lote y cada destinatario recibe el lote completo
+con un único encolado, que su escritor envía con una sola escritura vectorizada
+"""
+
+import asyncio
+import threading
+import time
+
+from metricas_chat import metricas
+
+
+def repartir(lote, destinatarios):
+    """
+    Entrega un lote [(datos, excluir, mensajes), ...] a cada destinatario con un solo encolado
+    Los buffers se comparten; solo los remitentes reciben una lista filtrada
+    Devuelve los clientes cuya cola rechazó el lote
+    """
+    inicio = time.perf_counter()
+    buffers = [datos for datos, _, _ in lote]
+    mensajes_lote = sum(mensajes for _, _, mensajes in lote)
+    remitentes = {excluir for _, excluir, _ in lote if excluir is not None}
+    rechazados = []
+    entregados = 0
+
+    for cliente in destinatarios:
+        if cliente.nombre in remitentes:
+            propios = [(datos, mensajes) for datos, excluir, mensajes in lote if excluir != cliente.nombre]
+            if not propios:
+                continue
+            aceptado = cliente.enviar_lote([datos for datos, _ in propios])
+            cantidad = sum(mensajes for _, mensajes in propios)
+        else:
+            aceptado = cliente.enviar_lote(buffers)
+            cantidad = mensajes_lote
+        if aceptado:
+            entregados += cantidad
+        else:
+            rechazados.append(cliente)
+
+    # Una sola anotación por lote, en el fragmento de métricas de este hilo
+    metricas.incrementar("chat_mensajes_salida_total", entregados)
+    metricas.observar("chat_difusion_segundos", time.perf_counter() - inicio)
+    return rechazados
+
+
+class Difusor:
+    """Difusor para el servidor con hilos: un hilo reparte los lotes pendientes"""
+
+    def __init__(self, obtener_destinatarios, ventana=0.0, al_rechazar=None):
+        self.obtener_destinatarios = obtener_destinatarios
+        self.ventana = ventana
+        self.al_rechazar = al_rechazar
+        self._pendientes = []
+        self._detenido = False
+        self._condicion = threading.Condition(threading.Lock())
+        self._hilo = threading.Thread(target=self._repartir_continuamente, daemon=True)
+        self._hilo.start()
+
+    def publicar(self, datos, excluir=None, mensajes=1):
+        """Agrega bytes ya codificados (con 'mensajes' mensajes) al lote en curso"""
+        with self._condicion:
+            self._pendientes.append((datos, excluir, mensajes))
+            if len(self._pendientes) == 1:
+                self._condicion.notify()
+
+    def detener(self):
+        """Termina el hilo repartidor (por ejemplo, al eliminar una sala vacía)"""
+        with self._condicion:
+            self._detenido = True
+            self._condicion.notify()
+
+    def _repartir_continuamente(self):
+        while True:
+            with self._condicion:
+                while not self._pendientes and not self._detenido:
+                    self._condicion.wait()
+                if self._detenido:
+                    return
+            if self.ventana:
+                # Deja que se acumulen los mensajes de la ventana en el mismo lote
+                time.sleep(self.ventana)
+            with self._condicion:
+                lote, self._pendientes = self._pendientes, []
+            rechazados = repartir(lote, self.obtener_destinatarios())
+            if self.al_rechazar:
+                for cliente in rechazados:
+                    self.al_rechazar(cliente)
+
+
+class DifusorAsync:
+    """Difusor para el servidor asyncio: el reparto se programa en el bucle de eventos"""
+
+    def __init__(self, obtener_destinatarios, ventana=0.0, al_rechazar=None):
+        self.obtener_destinatarios = obtener_destinatarios
+        self.ventana = ventana
+        self.al_rechazar = al_rechazar
+        self._pendientes = []
+
+    def publicar(self, datos, excluir=None, mensajes=1):
+        """Agrega bytes ya codificados (con 'mensajes' mensajes) al lote en curso"""
+        self._pendientes.append((datos, excluir, mensajes))
+        if len(self._pendientes) == 1:
+            bucle = asyncio.get_running_loop()
+            if self.ventana:
+                bucle.call_later(self.ventana, self._repartir)
+            else:
+                bucle.call_soon(self._repartir)
+
+    def detener(self):
+        """Nada que detener: el reparto no tiene hilo propio"""
+
+    def _repartir(self):
+        lote, self._pendientes = self._pendientes, []
+        rechazados = repartir(lote, self.obtener_destinatarios())
+        if self.al_rechazar:
+            for cliente in rechazados:
+                self.al_rechazar(cliente)
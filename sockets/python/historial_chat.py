@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Historial acotado de mensajes por sala
+Un buffer circular de tamaño fijo guarda los últimos N mensajes ya codificados,
+cada uno con su número de secuencia. Al entrar a una sala (o al reanudar tras
+una reconexión) se envía lo guardado como un único bloque de bytes
+"""
+
+import collections
+import threading
+import time
+
+CAPACIDAD_POR_DEFECTO = 100
+RETENCION_HISTORIAL = 600.0  # segundos sin uso tras los que se descarta el historial de una sala vacía
+MAXIMO_HISTORIALES = 1000  # por encima, se descartan antes los de salas vacías menos usados
+INTERVALO_LIMPIEZA = 1.0  # segundos mínimos entre dos limpiezas
+
+
+def formatear_chat(hora, secuencia, nombre, texto):
+    """Texto de un mensaje de chat numerado, tal como se guarda y se envía"""
+    return f"[{hora} #{secuencia}] {nombre}: {texto}\n"
+
+
+class Historial:
+    """Buffer circular de (secuencia, bytes); la memoria no crece con el tráfico"""
+
+    def __init__(self, capacidad=CAPACIDAD_POR_DEFECTO):
+        self.capacidad = capacidad
+        self.ultima = 0  # secuencia del último mensaje guardado (0 = ninguno)
+        self.lock = threading.Lock()
+        self._secuencias = [0] * capacidad
+        self._datos = [None] * capacidad
+        self.ultimo_uso = time.monotonic()
+
+    def agregar(self, primera, mensajes):
+        """Guarda mensajes consecutivos desde la secuencia 'primera' (con el lock tomado)"""
+        for desplazamiento, datos in enumerate(mensajes):
+            secuencia = primera + desplazamiento
+            if self.capacidad:
+                posicion = secuencia % self.capacidad
+                self._secuencias[posicion] = secuencia
+                self._datos[posicion] = datos
+            self.ultima = max(self.ultima, secuencia)
+
+    def primera(self):
+        """Secuencia más vieja que puede seguir en el buffer"""
+        return max(self.ultima - self.capacidad + 1, 1)
+
+    def desde(self, secuencia=0):
+        """Bytes de los mensajes guardados posteriores a 'secuencia', en orden"""
+        with self.lock:
+            if not self.capacidad:
+                return []
+            if secuencia > self.ultima:
+                # El servidor se reinició y la numeración volvió a empezar
+                secuencia = 0
+            primera = max(secuencia + 1, self.primera())
+            return [
+                self._datos[s % self.capacidad]
+                for s in range(primera, self.ultima + 1)
+                if self._secuencias[s % self.capacidad] == s
+            ]
+
+
+class RegistroHistoriales:
+    """
+    Un historial por sala; sobrevive a que la sala quede vacía y se elimine,
+    pero no para siempre: el de una sala sin miembros ('en_uso' da False) se
+    descarta tras 'retencion' segundos sin uso, o antes si hay más de 'maximo'.
+    Así un /join a nombres siempre nuevos no hace crecer la memoria. De cada
+    sala descartada queda solo su última secuencia, para no repetir números
+    """
+
+    def __init__(self, capacidad=CAPACIDAD_POR_DEFECTO, en_uso=None, retencion=RETENCION_HISTORIAL,
+                 maximo=MAXIMO_HISTORIALES):
+        self.capacidad = capacidad
+        self.en_uso = en_uso or (lambda nombre_sala: False)
+        self.retencion = retencion
+        self.maximo = maximo
+        self._historiales = collections.OrderedDict()  # del menos al más recientemente usado
+        self._ultimas = {}  # sala descartada -> última secuencia
+        self._proxima_limpieza = time.monotonic() + INTERVALO_LIMPIEZA
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._historiales)
+
+    def obtener(self, nombre_sala):
+        ahora = time.monotonic()
+        with self._lock:
+            historial = self._historiales.get(nombre_sala)
+            if historial is None:
+                historial = Historial(self.capacidad)
+                historial.ultima = self._ultimas.pop(nombre_sala, 0)
+                self._historiales[nombre_sala] = historial
+            else:
+                self._historiales.move_to_end(nombre_sala)
+            historial.ultimo_uso = ahora
+            if ahora >= self._proxima_limpieza:
+                self._proxima_limpieza = ahora + INTERVALO_LIMPIEZA
+                self._limpiar(ahora)
+            return historial
+
+    def _limpiar(self, ahora):
+        """Descarta, del menos usado en adelante, los historiales vencidos o sobrantes de salas vacías"""
+        limite = ahora - self.retencion
+        sobrantes = len(self._historiales) - self.maximo
+        for nombre_sala, historial in list(self._historiales.items()):
+            if historial.ultimo_uso >= limite and sobrantes <= 0:
+                break
+            if self.en_uso(nombre_sala):
+                continue
+            del self._historiales[nombre_sala]
+            sobrantes -= 1
+            if historial.ultima:
+                self._ultimas[nombre_sala] = historial.ultima
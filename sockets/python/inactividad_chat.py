@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Detección de conexiones inactivas y latidos (/ping - /pong) del chat
+Un cliente que desaparece sin cerrar la conexión (corte de red, equipo
+apagado) deja un socket medio abierto que nadie reclama. Todos los clientes
+se vigilan con una sola rueda de temporizadores: programar y cancelar son
+O(1) y la rueda avanza una ranura por tic, sin un temporizador ni un hilo
+por cliente. Recibir datos solo actualiza una marca de tiempo en el cliente;
+la rueda la consulta al vencer y reprograma si hubo actividad. Viene
+desactivada: el cliente Java no responde /pong y un usuario callado se
+quedaría sin conexión; se activa con --inactividad y --intervalo-ping
+"""
+
+import math
+import os
+import sys
+import threading
+import time
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+
+from metricas_chat import metricas
+from protocolo_chat import codificar, CRUDO
+from registro_asincrono import registro
+
+TIEMPO_INACTIVIDAD = 0.0  # segundos sin recibir nada antes de cerrar la conexión (0 = nunca; p. ej. 90)
+INTERVALO_PING = 0.0  # segundos sin recibir nada antes de enviar /ping (0 = sin latidos; p. ej. 30)
+RESOLUCION = 1.0  # segundos por ranura de la rueda
+RANURAS = 512
+PING = "/ping"
+PONG = "/pong"
+
+
+class RuedaTemporizadores:
+    """
+    Rueda de temporizadores con hash: cada clave vive en la ranura de su tic de
+    vencimiento. Los vencimientos más lejanos que una vuelta completa se quedan
+    en su ranura hasta la vuelta que corresponda
+    """
+
+    def __init__(self, resolucion=RESOLUCION, ranuras=RANURAS):
+        self.resolucion = resolucion
+        self._ranuras = [{} for _ in range(ranuras)]  # clave -> tic de vencimiento
+        self._tics = {}  # clave -> tic de vencimiento (para cancelar en O(1))
+        self._tic = self._tic_de(time.monotonic())
+        self._lock = threading.Lock()
+
+    def _tic_de(self, instante):
+        return int(instante / self.resolucion)
+
+    def __len__(self):
+        return len(self._tics)
+
+    def programar(self, clave, vence):
+        """Programa (o reprograma) 'clave' para el instante monotónico 'vence'"""
+        with self._lock:
+            self._quitar(clave)
+            # Lo que ya venció sale en el próximo tic
+            tic = max(math.ceil(vence / self.resolucion), self._tic + 1)
+            self._ranuras[tic % len(self._ranuras)][clave] = tic
+            self._tics[clave] = tic
+
+    def cancelar(self, clave):
+        with self._lock:
+            self._quitar(clave)
+
+    def _quitar(self, clave):
+        tic = self._tics.pop(clave, None)
+        if tic is not None:
+            del self._ranuras[tic % len(self._ranuras)][clave]
+
+    def avanzar(self, ahora):
+        """Recorre las ranuras hasta 'ahora' y devuelve las claves vencidas (ya quitadas)"""
+        vencidas = []
+        with self._lock:
+            objetivo = self._tic_de(ahora)
+            # Tras una pausa larga basta con recorrer la rueda una vez
+            pasos = min(objetivo - self._tic, len(self._ranuras))
+            for paso in range(1, pasos + 1):
+                ranura = self._ranuras[(self._tic + paso) % len(self._ranuras)]
+                for clave, tic in list(ranura.items()):
+                    if tic <= objetivo:
+                        del ranura[clave]
+                        del self._tics[clave]
+                        vencidas.append(clave)
+            self._tic = max(self._tic, objetivo)
+        return vencidas
+
+
+class VigilanteInactividad:
+    """
+    Cierra las conexiones que no envían nada durante 'inactividad' segundos y,
+    antes de eso, envía /ping cada 'intervalo_ping' segundos de silencio para
+    que un cliente vivo pero callado responda /pong. Vale para ambos motores:
+    el cliente solo necesita ultima_actividad, enviar() y desconectar()
+    """
+
+    def __init__(self, inactividad=TIEMPO_INACTIVIDAD, intervalo_ping=INTERVALO_PING, protocolo=CRUDO):
+        self.inactividad = inactividad
+        self.intervalo_ping = intervalo_ping
+        self._ping = codificar(PING + "\n", protocolo)
+        plazos = [plazo for plazo in (inactividad, intervalo_ping) if plazo > 0]
+        # Con plazos cortos la rueda gira más fino para no cortar tarde
+        self.rueda = RuedaTemporizadores(min([RESOLUCION] + [plazo / 4 for plazo in plazos]))
+
+    @property
+    def activo(self):
+        return self.inactividad > 0 or self.intervalo_ping > 0
+
+    def vigilar(self, cliente):
+        """Empieza a vigilar una conexión recién aceptada"""
+        if self.activo:
+            cliente.ultima_actividad = time.monotonic()
+            self.rueda.programar(cliente, cliente.ultima_actividad + self._proximo_plazo(0.0))
+
+    def olvidar(self, cliente):
+        self.rueda.cancelar(cliente)
+
+    def _proximo_plazo(self, inactivo):
+        """Segundos desde la última actividad hasta la próxima revisión"""
+        plazos = []
+        if self.intervalo_ping > 0:
+            # Un /ping por cada intervalo completo de silencio
+            plazos.append((int(inactivo / self.intervalo_ping) + 1) * self.intervalo_ping)
+        if self.inactividad > 0:
+            plazos.append(self.inactividad)
+        return min(plazos)
+
+    def revisar(self, ahora=None):
+        """Atiende los temporizadores vencidos; se llama una vez por tic de la rueda"""
+        ahora = time.monotonic() if ahora is None else ahora
+        for cliente in self.rueda.avanzar(ahora):
+            inactivo = ahora - cliente.ultima_actividad
+            if 0 < self.inactividad <= inactivo:
+                metricas.incrementar("chat_desconexiones_inactividad_total")
+                registro.aviso("Cliente '%s' %s desconectado tras %.0f s sin actividad",
+                               cliente.nombre or "(sin nombre)", cliente.direccion, inactivo)
+                cliente.desconectar()
+                continue
+            # Antes de registrarse el cliente no sabría qué hacer con un /ping
+            if self.intervalo_ping > 0 and inactivo >= self.intervalo_ping and cliente.nombre is not None:
+                metricas.incrementar("chat_pings_enviados_total")
+                cliente.enviar(self._ping)
+            self.rueda.programar(cliente, cliente.ultima_actividad + self._proximo_plazo(inactivo))
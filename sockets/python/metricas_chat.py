@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas del servidor de chat en formato de texto de Prometheus
+Cada hilo acumula sus contadores e histogramas en un fragmento propio, así
+contar un mensaje no toma ningún lock; los fragmentos se suman solo cuando
+alguien consulta el endpoint HTTP (ver comun/python/contadores_hilo.py)
+"""
+
+import bisect
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+
+from contadores_hilo import FragmentosPorHilo
+
+# Límites superiores (segundos) de los histogramas de tiempos
+LIMITES_TIEMPO = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class _Fragmento:
+    """Contadores e histogramas de un solo hilo; solo ese hilo los modifica"""
+
+    def __init__(self):
+        self.contadores = {}
+        self.histogramas = {}
+
+
+class Metricas:
+    """Registro de métricas: contadores e histogramas por hilo y medidores calculados al leer"""
+
+    def __init__(self, limites=LIMITES_TIEMPO):
+        self.limites = limites
+        self.ayudas = {}
+        self.tipos = {}
+        self._fragmentos = FragmentosPorHilo(_Fragmento, self._sumar)
+        self._medidores = {}
+
+    def describir(self, nombre, tipo, ayuda):
+        self.tipos[nombre] = tipo
+        self.ayudas[nombre] = ayuda
+
+    def incrementar(self, nombre, cantidad=1, etiquetas=()):
+        """Suma al contador en el fragmento del hilo actual (sin locks)"""
+        contadores = self._fragmentos.propio().contadores
+        clave = (nombre, etiquetas)
+        contadores[clave] = contadores.get(clave, 0) + cantidad
+
+    def observar(self, nombre, valor, etiquetas=()):
+        """Registra un valor en el histograma del hilo actual (sin locks)"""
+        histogramas = self._fragmentos.propio().histogramas
+        clave = (nombre, etiquetas)
+        histograma = histogramas.get(clave)
+        if histograma is None:
+            # [cuentas por intervalo (la última es +Inf), suma, cantidad]
+            histograma = histogramas[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+        histograma[0][bisect.bisect_left(self.limites, valor)] += 1
+        histograma[1] += valor
+        histograma[2] += 1
+
+    def registrar_medidor(self, nombre, ayuda, funcion):
+        """funcion() devuelve un número o una lista de (etiquetas, valor); se evalúa al leer"""
+        self.describir(nombre, "gauge", ayuda)
+        self._medidores[nombre] = funcion
+
+    def _sumar(self, destino, origen):
+        for clave, valor in list(origen.contadores.items()):
+            destino.contadores[clave] = destino.contadores.get(clave, 0) + valor
+        for clave, (cuentas, suma, cantidad) in list(origen.histogramas.items()):
+            total = destino.histogramas.get(clave)
+            if total is None:
+                total = destino.histogramas[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            total[0] = [a + b for a, b in zip(total[0], cuentas)]
+            total[1] += suma
+            total[2] += cantidad
+
+    def consolidar(self):
+        """Suma todos los fragmentos; los de hilos terminados se pliegan y se descartan"""
+        return self._fragmentos.consolidar()
+
+    def exponer(self):
+        """Texto en formato de exposición de Prometheus"""
+        total = self.consolidar()
+        lineas = []
+        por_nombre = {}
+        for (nombre, etiquetas), valor in total.contadores.items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+        for nombre, funcion in self._medidores.items():
+            valor = funcion()
+            por_nombre[nombre] = valor if isinstance(valor, list) else [((), valor)]
+        for nombre in sorted(por_nombre):
+            self._encabezado(lineas, nombre)
+            for etiquetas, valor in sorted(por_nombre[nombre]):
+                lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor}")
+
+        histogramas = {}
+        for (nombre, etiquetas), datos in total.histogramas.items():
+            histogramas.setdefault(nombre, []).append((etiquetas, datos))
+        for nombre in sorted(histogramas):
+            self._encabezado(lineas, nombre)
+            for etiquetas, (cuentas, suma, cantidad) in sorted(histogramas[nombre]):
+                acumulado = 0
+                for limite, cuenta in zip(self.limites + ("+Inf",), cuentas):
+                    acumulado += cuenta
+                    con_limite = etiquetas + (("le", str(limite)),)
+                    lineas.append(f"{nombre}_bucket{_formatear_etiquetas(con_limite)} {acumulado}")
+                lineas.append(f"{nombre}_sum{_formatear_etiquetas(etiquetas)} {suma}")
+                lineas.append(f"{nombre}_count{_formatear_etiquetas(etiquetas)} {cantidad}")
+        return "\n".join(lineas) + "\n"
+
+    def _encabezado(self, lineas, nombre):
+        if nombre in self.ayudas:
+            lineas.append(f"# HELP {nombre} {self.ayudas[nombre]}")
+            lineas.append(f"# TYPE {nombre} {self.tipos[nombre]}")
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatear_etiquetas(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in etiquetas) + "}"
+
+
+class LockMedido:
+    """Lock que registra cuánto se esperó para tomarlo (histograma chat_espera_lock_segundos)"""
+
+    def __init__(self, nombre):
+        self._lock = threading.Lock()
+        self._etiquetas = (("lock", nombre),)
+
+    def __enter__(self):
+        if self._lock.acquire(blocking=False):
+            # Sin contención: no se mide nada más que el intento
+            metricas.observar("chat_espera_lock_segundos", 0.0, self._etiquetas)
+            return self
+        inicio = time.perf_counter()
+        self._lock.acquire()
+        metricas.observar("chat_espera_lock_segundos", time.perf_counter() - inicio, self._etiquetas)
+        return self
+
+    def __exit__(self, *excepcion):
+        self._lock.release()
+
+
+# Registro único del proceso; los módulos del servidor anotan aquí
+metricas = Metricas()
+metricas.describir("chat_mensajes_entrada_total", "counter", "Mensajes de chat recibidos de los clientes")
+metricas.describir("chat_mensajes_salida_total", "counter", "Mensajes encolados hacia los clientes (por destinatario)")
+metricas.describir("chat_mensajes_privados_total", "counter", "Mensajes privados (/msg) aceptados")
+metricas.describir("chat_bytes_entrada_total", "counter", "Bytes leídos de los sockets de los clientes")
+metricas.describir("chat_bytes_salida_total", "counter", "Bytes escritos en los sockets de los clientes")
+metricas.describir("chat_desconexiones_envio_total", "counter",
+                   "Clientes desconectados por fallas de envío (cola llena o error del socket)")
+metricas.describir("chat_desconexiones_inactividad_total", "counter",
+                   "Conexiones cerradas por no recibir nada (ni /pong) dentro del plazo de inactividad")
+metricas.describir("chat_pings_enviados_total", "counter", "Latidos /ping enviados a clientes en silencio")
+metricas.describir("chat_compresion_bytes_originales_total", "counter",
+                   "Bytes hacia clientes con zlib antes de comprimir")
+metricas.describir("chat_compresion_bytes_comprimidos_total", "counter",
+                   "Bytes hacia clientes con zlib después de comprimir")
+metricas.describir("chat_compresion_segundos", "histogram", "Tiempo de comprimir un lote para un cliente")
+metricas.describir("chat_bitacora_registros_total", "counter", "Mensajes de chat escritos en la bitácora")
+metricas.describir("chat_bitacora_commit_segundos", "histogram",
+                   "Tiempo de escribir y sincronizar (fsync) un lote de la bitácora")
+metricas.describir("chat_bitacora_segmentos_borrados_total", "counter",
+                   "Segmentos de la bitácora borrados por la política de retención")
+metricas.describir("chat_difusion_segundos", "histogram", "Tiempo de repartir un lote a todos los miembros de una sala")
+metricas.describir("chat_espera_lock_segundos", "histogram", "Espera para tomar los locks del registro de clientes")
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        cuerpo = metricas.exponer().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, format, *args):
+        pass  # una consulta cada pocos segundos no necesita log
+
+
+def iniciar_servidor_metricas(host, puerto):
+    """Atiende GET /metrics en un hilo aparte; sirve para ambos motores"""
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    print(f"Métricas disponibles en http://{host}:{puerto}/metrics")
+    return servidor
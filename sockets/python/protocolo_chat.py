@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Entramado de mensajes del protocolo de chat
+TCP es un flujo de bytes: un recv() puede traer varios mensajes juntos o
+solo un pedazo de uno. Los modos entramados delimitan cada mensaje y
+reensamblan el flujo para recuperar los mensajes completos
+"""
+
+import re
+import struct
+
+# Modos de entramado
+CRUDO = "crudo"        # cada recv() se toma como un mensaje (protocolo original)
+LINEAS = "lineas"      # cada mensaje termina en '\n'
+LONGITUD = "longitud"  # cada mensaje va precedido de su longitud (4 bytes, big-endian)
+PROTOCOLOS = (CRUDO, LINEAS, LONGITUD)
+
+# Los mensajes de chat llevan su número de secuencia: "[HH:MM:SS #n] nombre: texto"
+PATRON_SECUENCIA = re.compile(r"\[\d\d:\d\d:\d\d #(\d+)\]")
+
+TAMANO_MAXIMO_TRAMA = 64 * 1024
+_CABECERA = struct.Struct("!I")
+
+
+class TramaInvalida(Exception):
+    """El flujo recibido no respeta el entramado (por ejemplo, trama demasiado grande)"""
+
+
+def codificar(texto, protocolo=CRUDO):
+    """Convierte un mensaje de texto en los bytes de una trama"""
+    if protocolo == LINEAS:
+        if not texto.endswith("\n"):
+            texto += "\n"
+        return texto.encode('utf-8')
+    if protocolo == LONGITUD:
+        datos = texto.encode('utf-8')
+        return _CABECERA.pack(len(datos)) + datos
+    return texto.encode('utf-8')
+
+
+def codificar_lote(textos, protocolo=CRUDO):
+    """Concatena varias tramas en un solo buffer para enviarlas de una vez"""
+    return b"".join(codificar(texto, protocolo) for texto in textos)
+
+
+def codificar_preambulo(textos, protocolo=CRUDO):
+    """
+    Comandos previos al nombre (/capacidades, /reanudar) en una sola escritura
+    En modo crudo una lectura es un mensaje, así que van separados por '\n'
+    """
+    if protocolo == CRUDO:
+        return codificar("\n".join(textos), protocolo)
+    return codificar_lote(textos, protocolo)
+
+
+def tamano_lectura(protocolo):
+    """Bytes a pedir en cada recv(); los modos entramados leen en bloques grandes"""
+    return 1024 if protocolo == CRUDO else 64 * 1024
+
+
+class Reensamblador:
+    """Acumula bytes recibidos y devuelve todos los mensajes completos que contienen"""
+
+    def __init__(self, protocolo=CRUDO, tamano_maximo=TAMANO_MAXIMO_TRAMA):
+        if protocolo not in PROTOCOLOS:
+            raise ValueError(f"Protocolo '{protocolo}' no soportado")
+        self.protocolo = protocolo
+        self.tamano_maximo = tamano_maximo
+        self._buffer = bytearray()
+
+    def alimentar(self, datos):
+        """Agrega bytes leídos del socket; devuelve la lista de mensajes completos"""
+        if self.protocolo == CRUDO:
+            return [datos.decode('utf-8')]
+
+        self._buffer += datos
+        if self.protocolo == LINEAS:
+            return self._extraer_lineas()
+        return self._extraer_con_longitud()
+
+    def _extraer_lineas(self):
+        fin = self._buffer.rfind(b"\n")
+        if fin < 0:
+            if len(self._buffer) > self.tamano_maximo:
+                raise TramaInvalida(f"Línea de más de {self.tamano_maximo} bytes")
+            return []
+        lineas = bytes(self._buffer[:fin]).split(b"\n")
+        del self._buffer[:fin + 1]
+        return [linea.decode('utf-8').rstrip("\r") for linea in lineas]
+
+    def _extraer_con_longitud(self):
+        mensajes = []
+        vista = memoryview(self._buffer)
+        inicio = 0
+        try:
+            while len(vista) - inicio >= _CABECERA.size:
+                (longitud,) = _CABECERA.unpack_from(vista, inicio)
+                if longitud > self.tamano_maximo:
+                    raise TramaInvalida(f"Trama de {longitud} bytes supera el máximo")
+                fin = inicio + _CABECERA.size + longitud
+                if fin > len(vista):
+                    break
+                mensajes.append(str(vista[inicio + _CABECERA.size:fin], 'utf-8'))
+                inicio = fin
+        finally:
+            vista.release()
+        # Un solo recorte del buffer por lectura, no uno por mensaje
+        del self._buffer[:inicio]
+        return mensajes
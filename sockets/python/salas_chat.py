@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Salas de chat y lógica del protocolo compartida por los motores de hilos y asyncio
+Cada sala tiene su propio registro de miembros, su lock y su difusor, de modo
+que el tráfico de una sala nunca compite por el lock de otra
+"""
+
+import collections
+import datetime
+import os
+import sys
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+
+from bus_chat import DirectorioGlobal
+from compresion_chat import respuesta_capacidades, ZLIB, NINGUNA, NIVEL_POR_DEFECTO as NIVEL_COMPRESION
+from historial_chat import RegistroHistoriales, formatear_chat, CAPACIDAD_POR_DEFECTO as CAPACIDAD_HISTORIAL
+from metricas_chat import LockMedido, metricas
+from protocolo_chat import codificar, codificar_lote, CRUDO
+from registro_asincrono import registro
+
+SALA_POR_DEFECTO = "general"
+LONGITUD_MAXIMA_SALA = 32
+COMANDOS = ("/salir", "/usuarios", "/salas", "/join", "/msg", "/reanudar", "/ping", "/pong")
+PREAMBULO = ("/capacidades", "/reanudar")  # comandos que pueden ir antes del nombre
+
+
+def leer_secuencia(argumento):
+    """Número de secuencia de /reanudar (0 = todo el historial)"""
+    try:
+        return max(int(argumento), 0)
+    except ValueError:
+        return 0
+
+
+def separar_preambulo(mensajes, preambulo):
+    """
+    Antes del nombre el cliente puede enviar /capacidades <lista> y /reanudar <n>;
+    los quita de 'mensajes' y los anota en 'preambulo' (comando -> argumento)
+    Devuelve True si la lectura solo traía preámbulo y todavía falta el nombre
+    """
+    if not mensajes:
+        return False
+    # En modo crudo el preámbulo y el nombre pueden llegar en una sola lectura
+    if "\n" in mensajes[0].strip():
+        mensajes[0:1] = mensajes[0].strip().split("\n")
+    separado = False
+    while mensajes and mensajes[0].strip().partition(" ")[0].lower() in PREAMBULO:
+        comando, _, argumento = mensajes.pop(0).strip().partition(" ")
+        preambulo[comando.lower()] = argumento.strip()
+        separado = True
+    return separado and not mensajes
+
+
+class Sala:
+    """Sala de chat: miembros (nombre -> cliente) protegidos por un lock propio"""
+
+    def __init__(self, nombre, crear_difusor):
+        self.nombre = nombre
+        self.miembros = {}
+        self.lock = LockMedido("sala")
+        self.difusor = crear_difusor(self.obtener_miembros)
+
+    def agregar(self, cliente):
+        with self.lock:
+            self.miembros[cliente.nombre] = cliente
+            return len(self.miembros)
+
+    def quitar(self, cliente):
+        """Quita al cliente (solo si sigue siendo esa conexión); devuelve cuántos quedan"""
+        with self.lock:
+            if self.miembros.get(cliente.nombre) is cliente:
+                del self.miembros[cliente.nombre]
+            return len(self.miembros)
+
+    def obtener_miembros(self):
+        """Copia de los miembros tomada bajo el lock de la sala"""
+        with self.lock:
+            return list(self.miembros.values())
+
+    def nombres(self):
+        with self.lock:
+            return list(self.miembros.keys())
+
+    def __len__(self):
+        return len(self.miembros)
+
+
+class RegistroSalas:
+    """
+    Salas existentes; su lock solo se toma al crear o eliminar una sala,
+    nunca al difundir ni al listar usuarios
+    """
+
+    def __init__(self, crear_difusor):
+        self.crear_difusor = crear_difusor
+        self._salas = {}
+        self._lock = LockMedido("registro")
+        self.obtener(SALA_POR_DEFECTO)
+
+    def obtener(self, nombre_sala):
+        """Devuelve la sala, creándola si no existe"""
+        with self._lock:
+            return self._obtener_o_crear(nombre_sala)
+
+    def _obtener_o_crear(self, nombre_sala):
+        sala = self._salas.get(nombre_sala)
+        if sala is None:
+            sala = Sala(nombre_sala, self.crear_difusor)
+            self._salas[nombre_sala] = sala
+        return sala
+
+    def buscar(self, nombre_sala):
+        """Devuelve la sala si existe en este proceso (sin crearla)"""
+        with self._lock:
+            return self._salas.get(nombre_sala)
+
+    def entrar(self, nombre_sala, cliente):
+        """Agrega al cliente a la sala; devuelve (sala, miembros en la sala)"""
+        # Bajo el lock del registro para que la sala no se elimine entre medio
+        with self._lock:
+            sala = self._obtener_o_crear(nombre_sala)
+            return sala, sala.agregar(cliente)
+
+    def salir(self, sala, cliente):
+        """Quita al cliente de la sala; elimina las salas que quedan vacías"""
+        restantes = sala.quitar(cliente)
+        if restantes == 0 and sala.nombre != SALA_POR_DEFECTO:
+            with self._lock:
+                if len(sala) == 0 and self._salas.get(sala.nombre) is sala:
+                    del self._salas[sala.nombre]
+                    sala.difusor.detener()
+        return restantes
+
+    def listar(self):
+        """Devuelve [(nombre de la sala, miembros)] ordenado por nombre"""
+        with self._lock:
+            salas = list(self._salas.values())
+        return sorted((sala.nombre, len(sala)) for sala in salas)
+
+    def todas(self):
+        with self._lock:
+            return list(self._salas.values())
+
+
+class ServicioChat:
+    """
+    Protocolo del chat independiente de la E/S: registro de usuarios, comandos
+    y avisos. Los motores solo leen del socket y entregan bytes a cliente.enviar
+    Con un bus (modo multiproceso) las difusiones y los usuarios son globales
+    """
+
+    def __init__(self, crear_difusor, protocolo=CRUDO, capacidad_historial=CAPACIDAD_HISTORIAL,
+                 nivel_compresion=NIVEL_COMPRESION):
+        self.protocolo = protocolo
+        self.nivel_compresion = nivel_compresion  # 0 = no se ofrece zlib
+        self.salas = RegistroSalas(crear_difusor)
+        self.historiales = RegistroHistoriales(capacidad_historial, en_uso=self.sala_en_uso)
+        # Índice nombre -> cliente de este proceso: /msg no recorre ninguna sala
+        self.usuarios = {}
+        self._lock_usuarios = LockMedido("usuarios")
+        self.bus = None
+        self.directorio = None
+        self.bitacora = None
+
+    def registrar_metricas(self):
+        """Medidores que se calculan al consultar el endpoint de métricas"""
+        metricas.registrar_medidor(
+            "chat_clientes_conectados", "Clientes conectados a este proceso",
+            lambda: sum(len(sala) for sala in self.salas.todas())
+        )
+        metricas.registrar_medidor("chat_salas", "Salas con miembros en este proceso", lambda: len(self.salas.todas()))
+        metricas.registrar_medidor("chat_historiales", "Historiales de sala en memoria", lambda: len(self.historiales))
+        metricas.registrar_medidor(
+            "chat_cola_salida_mensajes", "Mensajes pendientes en la cola de salida de cada cliente",
+            lambda: [((("cliente", nombre),), pendientes)
+                     for nombre, (pendientes, _) in self.profundidad_colas().items()]
+        )
+
+    def conectar_bus(self, bus):
+        """Comparte difusiones y usuarios con los demás procesos a través del bus"""
+        self.directorio = DirectorioGlobal()
+        self.bus = bus
+
+    def restaurar(self, bitacora):
+        """
+        Reconstruye el historial de las salas desde la bitácora y la usa de ahí en
+        adelante: escribe los mensajes nuevos (salvo en solo lectura) y atiende los
+        /reanudar que piden más de lo que guarda el buffer. Devuelve los mensajes leídos
+        """
+        self.bitacora = bitacora
+        capacidad = max(self.historiales.capacidad, 1)  # con 0 igual hace falta la última secuencia
+        recientes = {}
+        leidos = 0
+        for nombre_sala, secuencia, texto in bitacora.recorrer():
+            mensajes = recientes.get(nombre_sala)
+            if mensajes is None:
+                mensajes = recientes[nombre_sala] = collections.deque(maxlen=capacidad)
+            mensajes.append((secuencia, texto))
+            leidos += 1
+        for nombre_sala, mensajes in recientes.items():
+            historial = self.historiales.obtener(nombre_sala)
+            with historial.lock:
+                for secuencia, texto in mensajes:
+                    historial.agregar(secuencia, [codificar(texto, self.protocolo)])
+        return leidos
+
+    def enviar_texto(self, cliente, texto):
+        cliente.enviar(codificar(texto, self.protocolo))
+
+    def difundir(self, sala, mensajes, excluir=None):
+        """Publica el lote en la sala; con bus, lo entrega el central a todos los procesos"""
+        if self.bus is None:
+            self.entregar(sala, mensajes, excluir)
+        else:
+            self.bus.publicar({"tipo": "difusion", "sala": sala.nombre, "mensajes": mensajes, "excluir": excluir})
+
+    def entregar(self, sala, mensajes, excluir=None):
+        """Codifica el lote una sola vez y lo publica en el difusor de la sala"""
+        datos = codificar_lote([mensaje + "\n" for mensaje in mensajes], self.protocolo)
+        sala.difusor.publicar(datos, excluir, len(mensajes))
+
+    def difundir_chat(self, sala, nombre, textos):
+        """Difunde mensajes de chat; se numeran y se guardan en el historial de la sala"""
+        metricas.incrementar("chat_mensajes_entrada_total", len(textos))
+        hora = datetime.datetime.now().strftime("%H:%M:%S")
+        if self.bus is None:
+            self.entregar_chat(sala.nombre, nombre, hora, textos)
+        else:
+            # El central asigna la secuencia para que sea la misma en todos los procesos.
+            # Un evento por mensaje: un lote grande no llega junto al límite de trama del bus
+            for texto in textos:
+                self.bus.publicar({"tipo": "chat", "sala": sala.nombre, "nombre": nombre, "hora": hora,
+                                   "textos": [texto]})
+
+    def entregar_chat(self, nombre_sala, nombre, hora, textos, primera=None):
+        """Codifica cada mensaje una vez, lo guarda en el historial y lo publica en la sala"""
+        historial = self.historiales.obtener(nombre_sala)
+        # Bajo el lock del historial para que el orden de entrega sea el de las secuencias
+        with historial.lock:
+            if primera is None:
+                primera = historial.ultima + 1
+            lineas = [formatear_chat(hora, primera + i, nombre, texto) for i, texto in enumerate(textos)]
+            mensajes = [codificar(linea, self.protocolo) for linea in lineas]
+            historial.agregar(primera, mensajes)
+            if self.bitacora is not None and not self.bitacora.solo_lectura:
+                self.bitacora.agregar(nombre_sala, primera, lineas)
+            sala = self.salas.buscar(nombre_sala)
+            if sala is not None:
+                sala.difusor.publicar(b"".join(mensajes), nombre, len(mensajes))
+
+    def reproducir(self, cliente, nombre_sala, desde=0):
+        """Envía el historial posterior a 'desde' como un solo bloque; devuelve cuántos mensajes"""
+        historial = self.historiales.obtener(nombre_sala)
+        mensajes = historial.desde(desde)
+        if desde and self.bitacora is not None and desde + 1 < historial.primera():
+            # Lo que ya salió del buffer se lee de la bitácora
+            anteriores = self.bitacora.consultar(nombre_sala, desde, historial.primera())
+            mensajes = [codificar(texto, self.protocolo) for texto in anteriores] + mensajes
+        if mensajes:
+            encabezado = codificar(f"--- {len(mensajes)} mensajes anteriores en '{nombre_sala}' ---\n", self.protocolo)
+            cliente.enviar(encabezado + b"".join(mensajes))
+        return len(mensajes)
+
+    def aplicar_evento(self, evento):
+        """Aplica un evento reenviado por el bus central"""
+        tipo = evento["tipo"]
+        if tipo == "chat":
+            # Todos los procesos guardan el historial, tengan o no miembros en la sala
+            self.entregar_chat(evento["sala"], evento["nombre"], evento["hora"], evento["textos"], evento["primera"])
+        elif tipo == "difusion":
+            # Solo interesa si la sala tiene miembros en este proceso
+            sala = self.salas.buscar(evento["sala"])
+            if sala is not None:
+                self.entregar(sala, evento["mensajes"], evento["excluir"])
+        elif tipo == "privado":
+            self.entregar_privado(evento["origen"], evento["destino"], evento["hora"], evento["texto"])
+        elif tipo == "privado_fallido":
+            remitente = self.usuarios.get(evento["origen"])
+            if remitente is not None:
+                self.enviar_texto(remitente, f"Usuario '{evento['destino']}' no está conectado\n")
+        elif tipo == "usuario":
+            self.directorio.mover(evento["nombre"], evento["sala"])
+        elif tipo == "directorio":
+            self.directorio.reemplazar(evento["usuarios"], evento.get("inicio", True))
+
+    def sala_en_uso(self, nombre_sala):
+        """Si la sala tiene miembros (con bus, en cualquier proceso); la sala por defecto siempre"""
+        if nombre_sala == SALA_POR_DEFECTO:
+            return True
+        if self.bus is None:
+            return self.salas.buscar(nombre_sala) is not None
+        return self.directorio.contar(nombre_sala) > 0
+
+    def anunciar_usuario(self, nombre, sala):
+        """Con bus, actualiza el directorio global (sala None = desconectado)"""
+        if self.bus is None:
+            return
+        # Se aplica ya en este proceso; el eco del central lo confirma
+        self.directorio.mover(nombre, sala)
+        self.bus.publicar({"tipo": "usuario", "nombre": nombre, "sala": sala})
+
+    def contar(self, sala, locales):
+        """Miembros de la sala: los de este proceso o, con bus, los de todos"""
+        if self.bus is None:
+            return locales
+        return self.directorio.contar(sala.nombre)
+
+    def listar_usuarios(self, sala):
+        if self.bus is None:
+            return sala.nombres()
+        return self.directorio.usuarios(sala.nombre)
+
+    def listar_salas(self):
+        if self.bus is None:
+            return self.salas.listar()
+        salas = self.directorio.salas()
+        if SALA_POR_DEFECTO not in (nombre for nombre, _ in salas):
+            salas = sorted(salas + [(SALA_POR_DEFECTO, 0)])
+        return salas
+
+    def atender_preambulo(self, cliente, preambulo):
+        """Responde a /capacidades y devuelve desde qué secuencia reenviar el historial"""
+        if "/capacidades" in preambulo:
+            if ZLIB in preambulo["/capacidades"].lower().split() and self.nivel_compresion:
+                # Lo que se encole después de la respuesta le llega comprimido
+                cliente.activar_compresion(respuesta_capacidades(ZLIB, self.protocolo), self.nivel_compresion)
+            else:
+                cliente.enviar(respuesta_capacidades(NINGUNA, self.protocolo))
+        return leer_secuencia(preambulo.get("/reanudar", "0"))
+
+    def reservar_nombre(self, cliente, nombre):
+        """
+        Anota al cliente en el índice de nombres; si el nombre ya está en uso (en
+        este proceso o, con bus, en cualquier otro) le agrega un sufijo: ana_2, ana_3...
+        Devuelve el nombre asignado
+        """
+        # Sin espacios, para que se lo pueda nombrar en /msg
+        nombre = "_".join(nombre.split())
+        with self._lock_usuarios:
+            candidato, sufijo = nombre, 1
+            while candidato in self.usuarios or (self.directorio is not None and candidato in self.directorio):
+                sufijo += 1
+                candidato = f"{nombre}_{sufijo}"
+            self.usuarios[candidato] = cliente
+        return candidato
+
+    def liberar_nombre(self, cliente):
+        with self._lock_usuarios:
+            if self.usuarios.get(cliente.nombre) is cliente:
+                del self.usuarios[cliente.nombre]
+
+    def registrar(self, cliente, nombre_cliente, desde=0):
+        """
+        Da de alta al usuario en la sala por defecto, le envía la bienvenida y el historial
+        Devuelve el nombre asignado (puede diferir del pedido si ya estaba en uso)
+        """
+        nombre_pedido = nombre_cliente
+        nombre_cliente = self.reservar_nombre(cliente, nombre_cliente)
+        cliente.nombre = nombre_cliente
+        sala, numero_clientes = self.salas.entrar(SALA_POR_DEFECTO, cliente)
+        cliente.sala = sala
+        self.anunciar_usuario(nombre_cliente, sala.nombre)
+        numero_clientes = self.contar(sala, numero_clientes)
+
+        registro.info("Usuario '%s' conectado desde %s", nombre_cliente, cliente.direccion)
+
+        # Notificar a la sala que se unió un nuevo usuario
+        mensaje_union = f"*** {nombre_cliente} se unió al chat ({numero_clientes} usuarios conectados) ***"
+        self.difundir(sala, [mensaje_union], excluir=nombre_cliente)
+
+        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+        aviso_nombre = ""
+        if nombre_cliente != nombre_pedido:
+            aviso_nombre = f"El nombre '{nombre_pedido}' no estaba disponible: te llamas '{nombre_cliente}'\n"
+        bienvenida = (
+            f"\n=== BIENVENIDO AL CHAT ===\n"
+            f"Hora: {timestamp}\n"
+            f"{aviso_nombre}"
+            f"Sala: {sala.nombre}\n"
+            f"Usuarios conectados: {numero_clientes}\n"
+            f"Comandos: /usuarios, /salas, /join <sala>, /msg <usuario> <texto>, /reanudar <n>, /salir\n"
+            f"==========================\n"
+        )
+        self.enviar_texto(cliente, bienvenida)
+        self.reproducir(cliente, sala.nombre, desde)
+        return nombre_cliente
+
+    def retirar(self, cliente):
+        """Da de baja al usuario y avisa a su sala"""
+        sala = cliente.sala
+        if sala is None:
+            return
+        cliente.sala = None
+        self.liberar_nombre(cliente)
+        restantes = self.salas.salir(sala, cliente)
+        self.anunciar_usuario(cliente.nombre, None)
+        restantes = self.contar(sala, restantes)
+        if restantes:
+            mensaje_salida = f"*** {cliente.nombre} abandonó el chat ({restantes} usuarios restantes) ***"
+            self.difundir(sala, [mensaje_salida])
+        registro.info("Usuario '%s' desconectado", cliente.nombre)
+
+    def cambiar_sala(self, cliente, nombre_sala):
+        """Atiende /join: mueve al usuario de su sala actual a otra"""
+        if not nombre_sala or " " in nombre_sala or len(nombre_sala) > LONGITUD_MAXIMA_SALA:
+            self.enviar_texto(cliente, f"Uso: /join <sala> (sin espacios, máximo {LONGITUD_MAXIMA_SALA} caracteres)\n")
+            return
+        anterior = cliente.sala
+        if anterior.nombre == nombre_sala:
+            self.enviar_texto(cliente, f"Ya estás en la sala '{nombre_sala}'\n")
+            return
+
+        restantes = self.salas.salir(anterior, cliente)
+        sala, numero = self.salas.entrar(nombre_sala, cliente)
+        cliente.sala = sala
+        self.anunciar_usuario(cliente.nombre, nombre_sala)
+        if self.contar(anterior, restantes):
+            self.difundir(anterior, [f"*** {cliente.nombre} se fue a la sala '{nombre_sala}' ***"])
+        numero = self.contar(sala, numero)
+        self.difundir(
+            sala, [f"*** {cliente.nombre} se unió a la sala '{nombre_sala}' ({numero} usuarios en la sala) ***"],
+            excluir=cliente.nombre
+        )
+        self.enviar_texto(cliente, f"Ahora estás en la sala '{nombre_sala}' ({numero} usuarios)\n")
+        self.reproducir(cliente, nombre_sala)
+
+    def enviar_privado(self, cliente, argumento):
+        """Atiende /msg: el texto va solo al destinatario, buscado por nombre en el índice"""
+        destino, _, texto = argumento.strip().partition(" ")
+        texto = texto.strip()
+        if not destino or not texto:
+            self.enviar_texto(cliente, "Uso: /msg <usuario> <texto>\n")
+            return
+        hora = datetime.datetime.now().strftime("%H:%M:%S")
+        if not self.entregar_privado(cliente.nombre, destino, hora, texto):
+            if self.bus is None or destino not in self.directorio:
+                self.enviar_texto(cliente, f"Usuario '{destino}' no está conectado\n")
+                return
+            # Lo atiende otro proceso: el central lo entrega solo a ese trabajador
+            self.bus.publicar({"tipo": "privado", "origen": cliente.nombre, "destino": destino,
+                               "hora": hora, "texto": texto})
+        metricas.incrementar("chat_mensajes_privados_total")
+        self.enviar_texto(cliente, f"[{hora}] (privado para {destino}) {texto}\n")
+
+    def entregar_privado(self, origen, destino, hora, texto):
+        """Encola el mensaje en el destinatario si está en este proceso; devuelve si lo encontró"""
+        destinatario = self.usuarios.get(destino)
+        if destinatario is None:
+            return False
+        destinatario.enviar(codificar(f"[{hora}] (privado) {origen}: {texto}\n", self.protocolo))
+        return True
+
+    def procesar_mensajes(self, cliente, mensajes):
+        """
+        Atiende los mensajes de una lectura; los de chat se difunden juntos como un lote
+        Devuelve False si el usuario pidió salir
+        """
+        lote = []
+
+        for mensaje in mensajes:
+            mensaje = mensaje.strip()
+            comando, _, argumento = mensaje.partition(" ")
+            comando = comando.lower()
+
+            # Lo que no es un comando conocido se difunde como texto, igual que antes
+            if comando not in COMANDOS:
+                registro.info_muestreado("%s: %s", cliente.nombre, mensaje)  # Log en el servidor
+                lote.append(mensaje)
+                continue
+
+            # Los comandos pueden cambiar la sala: primero se difunde lo acumulado
+            if lote:
+                self.difundir_chat(cliente.sala, cliente.nombre, lote)
+                lote = []
+
+            if comando == "/salir":
+                return False
+            elif comando == "/usuarios":
+                lista_usuarios = self.listar_usuarios(cliente.sala)
+                respuesta = f"Usuarios conectados ({len(lista_usuarios)}): {', '.join(lista_usuarios)}\n"
+                self.enviar_texto(cliente, respuesta)
+            elif comando == "/salas":
+                salas = self.listar_salas()
+                detalle = ", ".join(f"{nombre} ({miembros})" for nombre, miembros in salas)
+                self.enviar_texto(cliente, f"Salas ({len(salas)}): {detalle}\n")
+            elif comando == "/join":
+                self.cambiar_sala(cliente, argumento.strip())
+            elif comando == "/msg":
+                self.enviar_privado(cliente, argumento)
+            elif comando == "/ping":
+                # Latido iniciado por el cliente
+                self.enviar_texto(cliente, "/pong\n")
+            elif comando == "/pong":
+                pass  # respuesta a nuestro /ping: basta con que haya llegado algo
+            elif comando == "/reanudar":
+                desde = leer_secuencia(argumento.strip())
+                if not self.reproducir(cliente, cliente.sala.nombre, desde):
+                    self.enviar_texto(cliente, f"No hay mensajes posteriores a #{desde} en el historial\n")
+
+        if lote:
+            self.difundir_chat(cliente.sala, cliente.nombre, lote)
+        return True
+
+    def profundidad_colas(self):
+        """Devuelve {nombre: (mensajes pendientes, mensajes descartados)} por cliente"""
+        profundidades = {}
+        for sala in self.salas.todas():
+            for cliente in sala.obtener_miembros():
+                profundidades[cliente.nombre] = (cliente.cola.profundidad, cliente.cola.descartados)
+        return profundidades
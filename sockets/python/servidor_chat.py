@@ -2,23 +2,264 @@
 # -*- coding: utf-8 -*-
 """
 Servidor de chat multi-usuario que permite comunicación entre clientes
-Cada cliente se maneja en un hilo separado y los mensajes se difunden a todos
+Cada cliente se maneja en un hilo separado y los mensajes se difunden a su sala
+Cada cliente tiene además una cola de salida acotada vaciada por su propio hilo escritor
+Con --modo async se usa el motor asyncio de servidor_chat_async.py
+Con --procesos N varios procesos aceptan en el mismo puerto y comparten un bus
+Con --bitacora DIR los mensajes de chat se guardan en disco y sobreviven a un reinicio
 """
 
+import argparse
+import asyncio
+import multiprocessing
+import os
+import shutil
+import signal
 import socket
+import sys
+import tempfile
 import threading
-import datetime
+import time
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+
+from bitacora_chat import BitacoraChat, RETENCION_BYTES, RETENCION_SEGUNDOS
+from bus_chat import CentralBus, ConexionBus, crear_socket_bus
+from compresion_chat import CompresionSalida, NIVEL_POR_DEFECTO as NIVEL_COMPRESION
+from cola_salida import ColaSalida, POLITICAS, DESCARTAR_ANTIGUO, CAPACIDAD_POR_DEFECTO
+from difusion import Difusor
+from historial_chat import CAPACIDAD_POR_DEFECTO as CAPACIDAD_HISTORIAL
+from inactividad_chat import VigilanteInactividad, TIEMPO_INACTIVIDAD, INTERVALO_PING
+from metricas_chat import metricas, iniciar_servidor_metricas
+from protocolo_chat import Reensamblador, TramaInvalida, codificar, tamano_lectura, PROTOCOLOS, CRUDO
+from registro_asincrono import registro, NIVELES
+from salas_chat import ServicioChat, separar_preambulo
+from servidor_chat_async import iniciar_servidor_async
 
 HOST = 'localhost'
 PUERTO = 8082
 
-# Diccionario thread-safe para almacenar clientes conectados
-clientes_conectados = {}
-lock = threading.Lock()
+# Salas y usuarios conectados; cada sala tiene su propio registro y lock
+servicio = None
+
+# Rueda de temporizadores que cierra conexiones inactivas y envía /ping
+vigilante = None
+
+# Cola de salida por cliente (se ajustan desde la línea de comandos)
+CAPACIDAD_COLA = CAPACIDAD_POR_DEFECTO
+POLITICA_COLA = DESCARTAR_ANTIGUO
+TIEMPO_VACIADO = 2.0  # segundos para vaciar la cola al desconectar
+INTERVALO_REPORTE_COLAS = 10  # segundos entre reportes de clientes lentos
+
+# Mensajes de chat que guarda cada sala para quien entra o reanuda
+HISTORIAL = CAPACIDAD_HISTORIAL
+
+# Plazos de inactividad y latidos (segundos; 0 = desactivado)
+INACTIVIDAD = TIEMPO_INACTIVIDAD
+PING = INTERVALO_PING
+
+# Nivel de zlib para los clientes que piden compresión (0 = no se ofrece)
+NIVEL_ZLIB = NIVEL_COMPRESION
+
+# Entramado de mensajes (crudo = un recv() por mensaje, como el protocolo original)
+PROTOCOLO = CRUDO
+
+# Segundos durante los que se juntan difusiones en un mismo lote
+VENTANA_COALESCENCIA = 0.0
+try:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
 
 def main():
+    parser = argparse.ArgumentParser(description="Servidor de chat multi-usuario")
+    parser.add_argument(
+        "--modo", choices=["hilos", "async"], default="hilos",
+        help="hilos: un hilo por cliente (original); async: bucle de eventos asyncio"
+    )
+    parser.add_argument(
+        "--capacidad-cola", type=int, default=CAPACIDAD_POR_DEFECTO,
+        help="mensajes pendientes máximos por cliente antes de aplicar la política"
+    )
+    parser.add_argument(
+        "--politica-cola", choices=POLITICAS, default=DESCARTAR_ANTIGUO,
+        help="qué hacer cuando la cola de un cliente lento se llena"
+    )
+    parser.add_argument(
+        "--protocolo", choices=PROTOCOLOS, default=CRUDO,
+        help="entramado de mensajes; el cliente debe usar el mismo"
+    )
+    parser.add_argument(
+        "--nivel-compresion", type=int, choices=range(10), default=NIVEL_COMPRESION, metavar="0-9",
+        help="nivel de zlib para los clientes que piden compresión (0 = no se ofrece)"
+    )
+    parser.add_argument(
+        "--ventana-coalescencia", type=float, default=0.0, metavar="MS",
+        help="milisegundos durante los que se juntan difusiones en un solo envío por cliente"
+    )
+    parser.add_argument(
+        "--historial", type=int, default=CAPACIDAD_HISTORIAL, metavar="N",
+        help="últimos mensajes que guarda cada sala y se reenvían al entrar (0 = sin historial)"
+    )
+    parser.add_argument(
+        "--bitacora", metavar="DIR",
+        help="guarda los mensajes de chat en segmentos dentro de DIR y reconstruye el historial al arrancar"
+    )
+    parser.add_argument(
+        "--retencion-mb", type=float, default=RETENCION_BYTES / 2**20, metavar="MB",
+        help="tamaño máximo de la bitácora; se borran los segmentos más viejos (0 = sin límite)"
+    )
+    parser.add_argument(
+        "--retencion-horas", type=float, default=RETENCION_SEGUNDOS / 3600, metavar="H",
+        help="antigüedad máxima de un segmento cerrado de la bitácora (0 = sin límite)"
+    )
+    parser.add_argument(
+        "--inactividad", type=float, default=TIEMPO_INACTIVIDAD, metavar="SEG",
+        help="cierra las conexiones que no envían nada en SEG segundos (0 = nunca)"
+    )
+    parser.add_argument(
+        "--intervalo-ping", type=float, default=INTERVALO_PING, metavar="SEG",
+        help="envía /ping a los clientes tras SEG segundos de silencio (0 = sin latidos)"
+    )
+    parser.add_argument(
+        "--puerto-metricas", type=int, metavar="PUERTO",
+        help="sirve métricas en texto de Prometheus en http://localhost:PUERTO/metrics "
+             "(con --procesos, cada trabajador usa PUERTO + su índice)"
+    )
+    parser.add_argument(
+        "--nivel-log", choices=NIVELES, default="info",
+        help="nivel mínimo de los registros del servidor"
+    )
+    parser.add_argument(
+        "--muestreo-log", type=int, default=1, metavar="N",
+        help="registrar solo 1 de cada N mensajes de chat"
+    )
+    parser.add_argument(
+        "--procesos", type=int, default=1,
+        help="procesos trabajadores que aceptan en el puerto (SO_REUSEPORT); 1 = un solo proceso"
+    )
+    args = parser.parse_args()
+    config_registro = {"nivel": NIVELES[args.nivel_log], "muestreo": args.muestreo_log}
+    registro.configurar(**config_registro)
+    opciones = {
+        "capacidad_cola": args.capacidad_cola,
+        "politica_cola": args.politica_cola,
+        "protocolo": args.protocolo,
+        "nivel_compresion": args.nivel_compresion,
+        "ventana_coalescencia": args.ventana_coalescencia / 1000,
+        "capacidad_historial": max(args.historial, 0),
+        "bitacora": args.bitacora,
+        "retencion_bitacora": int(max(args.retencion_mb, 0) * 2**20),
+        "antiguedad_bitacora": max(args.retencion_horas, 0) * 3600,
+        "inactividad": max(args.inactividad, 0.0),
+        "intervalo_ping": max(args.intervalo_ping, 0.0),
+        "puerto_metricas": args.puerto_metricas,
+    }
+    
+    if args.procesos > 1:
+        iniciar_multiproceso(args.procesos, args.modo, opciones, config_registro)
+    else:
+        iniciar_motor(args.modo, opciones)
+
+def iniciar_motor(modo, opciones, ruta_bus=None):
+    """Arranca el motor elegido en este proceso"""
+    if modo == "async":
+        iniciar_servidor_async(HOST, PUERTO, ruta_bus=ruta_bus, **opciones)
+    else:
+        iniciar_servidor_hilos(ruta_bus=ruta_bus, **opciones)
+
+def trabajador(indice, modo, opciones, ruta_bus, config_registro):
+    """Proceso trabajador del modo multiproceso"""
+    registro.configurar(**config_registro)
+    print(f"Trabajador {indice} (pid {os.getpid()}) iniciado")
+    if opciones["puerto_metricas"]:
+        opciones = dict(opciones, puerto_metricas=opciones["puerto_metricas"] + indice)
+    iniciar_motor(modo, opciones, ruta_bus)
+
+def iniciar_multiproceso(procesos, modo, opciones, config_registro):
+    """
+    Lanza varios trabajadores que aceptan en el mismo puerto (SO_REUSEPORT);
+    este proceso queda como bus central que ordena y reenvía los eventos
+    """
+    if not hasattr(socket, "SO_REUSEPORT") or not hasattr(socket, "AF_UNIX"):
+        print("El modo multiproceso requiere SO_REUSEPORT y sockets Unix; se usa un solo proceso")
+        iniciar_motor(modo, opciones)
+        return
+    
+    print(f"=== SERVIDOR DE CHAT ({procesos} PROCESOS) ===")
+    directorio_bus = tempfile.mkdtemp(prefix="chat_bus_")
+    ruta_bus = os.path.join(directorio_bus, "bus.sock")
+    socket_bus = crear_socket_bus(ruta_bus)
+    
+    # El central numera los mensajes: es el único que escribe en la bitácora
+    bitacora = None
+    if opciones["bitacora"]:
+        bitacora = BitacoraChat(opciones["bitacora"], retencion_bytes=opciones["retencion_bitacora"],
+                                retencion_segundos=opciones["antiguedad_bitacora"])
+        print(f"Bitácora: {opciones['bitacora']}")
+    
+    # spawn: los trabajadores no heredan hilos ni estado del proceso central
+    contexto = multiprocessing.get_context("spawn")
+    trabajadores = [
+        contexto.Process(target=trabajador, args=(indice, modo, opciones, ruta_bus, config_registro), daemon=True)
+        for indice in range(procesos)
+    ]
+    for proceso in trabajadores:
+        proceso.start()
+    
+    # SIGTERM detiene el servidor igual que Ctrl+C, terminando a los trabajadores
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(CentralBus(socket_bus, bitacora).servir())
+    except KeyboardInterrupt:
+        print("\nBus central interrumpido")
+    finally:
+        for proceso in trabajadores:
+            proceso.terminate()
+            proceso.join()
+        shutil.rmtree(directorio_bus, ignore_errors=True)
+        print("Servidor de chat cerrado")
+
+def iniciar_servidor_hilos(capacidad_cola=CAPACIDAD_POR_DEFECTO, politica_cola=DESCARTAR_ANTIGUO,
+                           protocolo=CRUDO, nivel_compresion=NIVEL_COMPRESION, ventana_coalescencia=0.0,
+                           capacidad_historial=CAPACIDAD_HISTORIAL, bitacora=None, retencion_bitacora=RETENCION_BYTES,
+                           antiguedad_bitacora=RETENCION_SEGUNDOS, inactividad=TIEMPO_INACTIVIDAD,
+                           intervalo_ping=INTERVALO_PING, puerto_metricas=None, ruta_bus=None):
+    """Modo original: cada cliente se atiende en su propio hilo"""
+    global CAPACIDAD_COLA, POLITICA_COLA, PROTOCOLO, NIVEL_ZLIB, VENTANA_COALESCENCIA, HISTORIAL, INACTIVIDAD, PING
+    CAPACIDAD_COLA = capacidad_cola
+    POLITICA_COLA = politica_cola
+    PROTOCOLO = protocolo
+    NIVEL_ZLIB = nivel_compresion
+    VENTANA_COALESCENCIA = ventana_coalescencia
+    HISTORIAL = capacidad_historial
+    INACTIVIDAD = inactividad
+    PING = intervalo_ping
+    iniciar_servicio()
+    if bitacora:
+        # Un trabajador del modo multiproceso solo lee: escribe el central
+        recuperados = servicio.restaurar(BitacoraChat(
+            bitacora, retencion_bytes=retencion_bitacora, retencion_segundos=antiguedad_bitacora,
+            solo_lectura=bool(ruta_bus)
+        ))
+    if ruta_bus:
+        # Trabajador del modo multiproceso: difusiones y usuarios pasan por el bus
+        bus = ConexionBus(ruta_bus, servicio.aplicar_evento)
+        servicio.conectar_bus(bus)
+        bus.escuchar()
+    if puerto_metricas:
+        servicio.registrar_metricas()
+        iniciar_servidor_metricas(HOST, puerto_metricas)
+    
     print("=== SERVIDOR DE CHAT ===")
     print(f"Iniciando servidor de chat en {HOST}:{PUERTO}")
+    print(f"Cola de salida por cliente: {CAPACIDAD_COLA} mensajes (política: {POLITICA_COLA})")
+    print(f"Entramado de mensajes: {PROTOCOLO}")
+    print(f"Compresión zlib a pedido del cliente: {f'nivel {NIVEL_ZLIB}' if NIVEL_ZLIB else 'desactivada'}")
+    print(f"Inactividad: /ping tras {PING:g} s, cierre tras {INACTIVIDAD:g} s (0 = desactivado)")
+    if bitacora:
+        print(f"Bitácora: {bitacora} ({recuperados} mensajes recuperados)")
     
     # Crear socket del servidor
     servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -26,8 +267,15 @@ def main():
     try:
         # Permitir reutilizar la dirección
         servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if ruta_bus:
+            # Todos los trabajadores escuchan en el mismo puerto; el núcleo reparte las conexiones
+            servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         servidor.bind((HOST, PUERTO))
-        servidor.listen(10)
+        servidor.listen(socket.SOMAXCONN)
+        
+        threading.Thread(target=vigilar_colas, daemon=True).start()
+        if vigilante.activo:
+            threading.Thread(target=vigilar_inactividad, daemon=True).start()
         
         print("Servidor de chat iniciado. Esperando usuarios...")
         
@@ -51,100 +299,183 @@ def main():
         servidor.close()
         print("Servidor de chat cerrado")
 
+class ClienteChat:
+    """Conexión de un usuario: socket, cola de salida acotada e hilo escritor propio"""
+    
+    def __init__(self, cliente_socket, direccion_cliente):
+        self.socket = cliente_socket
+        self.direccion = direccion_cliente
+        self.nombre = None
+        self.sala = None
+        self.cola = ColaSalida(CAPACIDAD_COLA, POLITICA_COLA)
+        self.ultima_actividad = time.monotonic()  # la actualiza el hilo lector
+        self.compresion = None  # CompresionSalida si el cliente negoció zlib
+        self.hilo_escritor = threading.Thread(target=self._escribir, daemon=True)
+        self.hilo_escritor.start()
+    
+    def enviar(self, datos):
+        """Encola bytes para este cliente sin bloquear a quien llama"""
+        return self.enviar_lote([datos])
+    
+    def enviar_lote(self, buffers):
+        """Encola varios buffers con un solo acceso a la cola"""
+        ya_cerrada = self.cola.cerrada
+        if self.cola.poner_lote(buffers):
+            return True
+        if not ya_cerrada:
+            metricas.incrementar("chat_desconexiones_envio_total", etiquetas=(("motivo", "cola_llena"),))
+        self.desconectar()
+        return False
+    
+    def _escribir(self):
+        """Hilo escritor: vacía la cola hacia el socket, un lote por escritura"""
+        try:
+            while True:
+                lote = self.cola.tomar_lote()
+                if lote is None:
+                    break
+                if self.compresion is not None:
+                    lote = self.compresion.preparar(lote)
+                enviar_vectorizado(self.socket, lote)
+                metricas.incrementar("chat_bytes_salida_total", sum(len(datos) for datos in lote))
+        except OSError:
+            metricas.incrementar("chat_desconexiones_envio_total", etiquetas=(("motivo", "error_socket"),))
+            self.desconectar()
+    
+    def activar_compresion(self, respuesta, nivel):
+        """Encola la respuesta a /capacidades; lo que venga después sale comprimido con zlib"""
+        self.compresion = CompresionSalida(respuesta, nivel)
+        self.enviar(respuesta)
+    
+    def desconectar(self):
+        """Corta la conexión; despierta al hilo lector bloqueado en recv"""
+        self.cola.cerrar()
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    
+    def cerrar(self):
+        """Cierre ordenado: da un margen al escritor para vaciar lo pendiente"""
+        self.cola.cerrar()
+        self.hilo_escritor.join(timeout=TIEMPO_VACIADO)
+        self.desconectar()
+        self.socket.close()
+
+def enviar_vectorizado(sock, buffers):
+    """
+    Escribe varios buffers con una sola llamada sendmsg (writev) sin copiarlos
+    Reintenta lo que quede tras un envío parcial
+    """
+    if not hasattr(sock, "sendmsg"):  # Windows
+        sock.sendall(b"".join(buffers))
+        return
+    
+    pendientes = [memoryview(b) for b in buffers]
+    inicio = 0
+    while inicio < len(pendientes):
+        enviados = sock.sendmsg(pendientes[inicio:inicio + IOV_MAX])
+        while enviados:
+            tamano = len(pendientes[inicio])
+            if enviados >= tamano:
+                enviados -= tamano
+                inicio += 1
+            else:
+                pendientes[inicio] = pendientes[inicio][enviados:]
+                enviados = 0
+
 def manejar_cliente_chat(cliente_socket, direccion_cliente):
     """
     Maneja un cliente del chat en un hilo separado
+    El protocolo (salas, comandos, avisos) lo resuelve el ServicioChat compartido
     """
+    cliente = ClienteChat(cliente_socket, direccion_cliente)
+    reensamblador = Reensamblador(PROTOCOLO)
     nombre_cliente = None
+    vigilante.vigilar(cliente)
     
     try:
-        # Pedir nombre del usuario
-        cliente_socket.send("Ingresa tu nombre: ".encode('utf-8'))
-        nombre_cliente = cliente_socket.recv(1024).decode('utf-8').strip()
+        # Pedir nombre del usuario (la misma lectura puede traer ya mensajes de chat)
+        cliente.enviar(codificar("Ingresa tu nombre: ", PROTOCOLO))
+        mensajes = recibir_mensajes(cliente, reensamblador)
+        # Antes del nombre puede negociar capacidades y, si se reconecta, pedir solo lo que se perdió
+        preambulo = {}
+        while separar_preambulo(mensajes, preambulo):
+            mensajes = recibir_mensajes(cliente, reensamblador)
+        if not mensajes:
+            return  # se fue (o se lo cerró por inactividad) antes de dar su nombre
+        desde = servicio.atender_preambulo(cliente, preambulo)
+        nombre_cliente = mensajes.pop(0).strip()
         
         if not nombre_cliente:
             nombre_cliente = f"Usuario_{direccion_cliente[1]}"
         
-        # Agregar cliente al diccionario (thread-safe)
-        with lock:
-            clientes_conectados[nombre_cliente] = cliente_socket
-            numero_clientes = len(clientes_conectados)
-        
-        print(f"Usuario '{nombre_cliente}' conectado desde {direccion_cliente}")
-        
-        # Notificar a todos que se unió un nuevo usuario
-        mensaje_union = f"*** {nombre_cliente} se unió al chat ({numero_clientes} usuarios conectados) ***"
-        difundir_mensaje(mensaje_union, excluir=nombre_cliente)
-        
-        # Enviar mensaje de bienvenida al nuevo usuario
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        bienvenida = (
-            f"\n=== BIENVENIDO AL CHAT ===\n"
-            f"Hora: {timestamp}\n"
-            f"Usuarios conectados: {numero_clientes}\n"
-            f"Comandos: /usuarios, /salir\n"
-            f"==========================\n"
-        )
-        cliente_socket.send(bienvenida.encode('utf-8'))
+        # Alta en la sala por defecto, aviso a la sala, bienvenida e historial
+        nombre_cliente = servicio.registrar(cliente, nombre_cliente, desde)
         
-        # Bucle principal del chat
+        # Bucle principal del chat: cada lectura puede traer varios mensajes
         while True:
-            datos = cliente_socket.recv(1024)
-            if not datos:
+            if not mensajes:
+                mensajes = recibir_mensajes(cliente, reensamblador)
+            if not mensajes or not servicio.procesar_mensajes(cliente, mensajes):
                 break
+            mensajes = []
                 
-            mensaje = datos.decode('utf-8').strip()
-            
-            if mensaje.lower() == "/salir":
-                break
-            elif mensaje.lower() == "/usuarios":
-                with lock:
-                    lista_usuarios = list(clientes_conectados.keys())
-                respuesta = f"Usuarios conectados ({len(lista_usuarios)}): {', '.join(lista_usuarios)}\n"
-                cliente_socket.send(respuesta.encode('utf-8'))
-            else:
-                # Difundir mensaje a todos los usuarios
-                timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-                mensaje_completo = f"[{timestamp}] {nombre_cliente}: {mensaje}"
-                print(mensaje_completo)  # Log en el servidor
-                difundir_mensaje(mensaje_completo, excluir=nombre_cliente)
-                
+    except TramaInvalida as e:
+        registro.aviso("Trama inválida de '%s': %s", nombre_cliente, e)
     except Exception as e:
-        print(f"Error con usuario '{nombre_cliente}': {e}")
+        registro.error("Error con usuario '%s': %s", nombre_cliente, e)
     finally:
-        # Remover cliente del diccionario
-        if nombre_cliente:
-            with lock:
-                clientes_conectados.pop(nombre_cliente, None)
-                numero_clientes = len(clientes_conectados)
-            
-            # Notificar a todos que el usuario se desconectó
-            mensaje_salida = f"*** {nombre_cliente} abandonó el chat ({numero_clientes} usuarios restantes) ***"
-            difundir_mensaje(mensaje_salida)
-            print(f"Usuario '{nombre_cliente}' desconectado")
-        
-        cliente_socket.close()
+        # Baja de su sala (solo si sigue siendo esta conexión) y aviso a la sala
+        vigilante.olvidar(cliente)
+        servicio.retirar(cliente)
+        cliente.cerrar()
 
-def difundir_mensaje(mensaje, excluir=None):
-    """
-    Envía un mensaje a todos los clientes conectados
-    """
-    mensaje_con_newline = mensaje + "\n"
-    clientes_desconectados = []
-    
-    with lock:
-        for nombre, socket_cliente in clientes_conectados.items():
-            if nombre != excluir:  # No enviar al remitente
-                try:
-                    socket_cliente.send(mensaje_con_newline.encode('utf-8'))
-                except:
-                    # Cliente desconectado, marcarlo para eliminación
-                    clientes_desconectados.append(nombre)
-        
-        # Eliminar clientes desconectados
-        for nombre in clientes_desconectados:
-            clientes_conectados.pop(nombre, None)
-            print(f"Cliente {nombre} eliminado (conexión perdida)")
+def recibir_mensajes(cliente, reensamblador):
+    """Lee del socket hasta tener al menos un mensaje completo ([] si se cerró)"""
+    while True:
+        datos = cliente.socket.recv(tamano_lectura(PROTOCOLO))
+        if not datos:
+            return []
+        # Cualquier dato (también un /pong) prueba que la conexión sigue viva
+        cliente.ultima_actividad = time.monotonic()
+        metricas.incrementar("chat_bytes_entrada_total", len(datos))
+        mensajes = reensamblador.alimentar(datos)
+        if mensajes:
+            return mensajes
+
+def cliente_rechazado(cliente):
+    # Política "desconectar": el hilo lector lo dará de baja de su sala
+    registro.aviso("Cliente %s desconectado (cola de salida llena)", cliente.nombre)
+
+def crear_difusor(obtener_miembros):
+    """Cada sala tiene su propio difusor (y su hilo repartidor)"""
+    return Difusor(obtener_miembros, VENTANA_COALESCENCIA, cliente_rechazado)
+
+def iniciar_servicio():
+    """Crea el servicio de chat y el vigilante de inactividad con la configuración actual"""
+    global servicio, vigilante
+    servicio = ServicioChat(crear_difusor, PROTOCOLO, HISTORIAL, NIVEL_ZLIB)
+    vigilante = VigilanteInactividad(INACTIVIDAD, PING, PROTOCOLO)
+
+def vigilar_colas():
+    """Hilo que reporta periódicamente a los clientes que se están quedando atrás"""
+    while True:
+        time.sleep(INTERVALO_REPORTE_COLAS)
+        rezagados = [
+            (nombre, pendientes, descartados)
+            for nombre, (pendientes, descartados) in servicio.profundidad_colas().items()
+            if pendientes >= CAPACIDAD_COLA // 2 or descartados
+        ]
+        for nombre, pendientes, descartados in rezagados:
+            registro.aviso("Cliente lento '%s': %d/%d en cola, %d descartados",
+                           nombre, pendientes, CAPACIDAD_COLA, descartados)
+
+def vigilar_inactividad():
+    """Hilo único que hace girar la rueda: un tic por ranura, sin importar cuántos clientes haya"""
+    while True:
+        time.sleep(vigilante.rueda.resolucion)
+        vigilante.revisar()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor de chat basado en asyncio (un solo hilo, bucle de eventos)
+Mantiene el mismo protocolo que servidor_chat.py pero sin un hilo por cliente,
+lo que permite sostener decenas de miles de conexiones en un solo proceso
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import time
+
+# Módulos compartidos por todos los servidores (comun/python)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "comun", "python"))
+
+from bitacora_chat import BitacoraChat, RETENCION_BYTES, RETENCION_SEGUNDOS
+from bus_chat import ConexionBusAsync
+from compresion_chat import CompresionSalida, NIVEL_POR_DEFECTO as NIVEL_COMPRESION
+from cola_salida import ColaSalidaAsync, DESCARTAR_ANTIGUO, CAPACIDAD_POR_DEFECTO
+from difusion import DifusorAsync
+from historial_chat import CAPACIDAD_POR_DEFECTO as CAPACIDAD_HISTORIAL
+from inactividad_chat import VigilanteInactividad, TIEMPO_INACTIVIDAD, INTERVALO_PING
+from metricas_chat import metricas, iniciar_servidor_metricas
+from protocolo_chat import Reensamblador, TramaInvalida, codificar, tamano_lectura, CRUDO
+from registro_asincrono import registro
+from salas_chat import ServicioChat, separar_preambulo
+
+try:
+    import resource
+except ImportError:  # Windows no tiene el módulo resource
+    resource = None
+
+HOST = 'localhost'
+PUERTO = 8082
+TIEMPO_VACIADO = 2.0  # segundos para vaciar la cola al desconectar
+INTERVALO_REPORTE_COLAS = 10  # segundos entre reportes de clientes lentos
+
+
+class ClienteAsync:
+    """Conexión de un usuario: cola de salida acotada y tarea escritora propia"""
+
+    def __init__(self, reader, writer, direccion, capacidad_cola, politica_cola):
+        self.reader = reader
+        self.writer = writer
+        self.direccion = direccion
+        self.nombre = None
+        self.sala = None
+        self.cola = ColaSalidaAsync(capacidad_cola, politica_cola)
+        self.ultima_actividad = time.monotonic()
+        self.compresion = None  # CompresionSalida si el cliente negoció zlib
+        self.tarea_escritora = asyncio.ensure_future(self._escribir())
+
+    def enviar(self, datos):
+        """Encola bytes para este cliente sin bloquear el bucle"""
+        return self.enviar_lote([datos])
+
+    def enviar_lote(self, buffers):
+        """Encola varios buffers con un solo acceso a la cola"""
+        ya_cerrada = self.cola.cerrada
+        if self.cola.poner_lote(buffers):
+            return True
+        if not ya_cerrada:
+            metricas.incrementar("chat_desconexiones_envio_total", etiquetas=(("motivo", "cola_llena"),))
+        self.desconectar()
+        return False
+
+    async def _escribir(self):
+        """Tarea escritora: vacía la cola y espera a que el socket drene"""
+        try:
+            while True:
+                lote = await self.cola.tomar_lote()
+                if lote is None:
+                    break
+                if self.compresion is not None:
+                    lote = self.compresion.preparar(lote)
+                self.writer.writelines(lote)
+                metricas.incrementar("chat_bytes_salida_total", sum(len(datos) for datos in lote))
+                await self.writer.drain()
+        except ConnectionError:
+            metricas.incrementar("chat_desconexiones_envio_total", etiquetas=(("motivo", "error_socket"),))
+            self.desconectar()
+
+    def activar_compresion(self, respuesta, nivel):
+        """Encola la respuesta a /capacidades; lo que venga después sale comprimido con zlib"""
+        self.compresion = CompresionSalida(respuesta, nivel)
+        self.enviar(respuesta)
+
+    def desconectar(self):
+        """Corta la conexión; la lectura pendiente recibe fin de flujo"""
+        self.cola.cerrar()
+        self.writer.transport.abort()
+
+    async def cerrar(self):
+        """Cierre ordenado: da un margen al escritor para vaciar lo pendiente"""
+        self.cola.cerrar()
+        try:
+            await asyncio.wait_for(self.tarea_escritora, TIEMPO_VACIADO)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.writer.transport.abort()
+        self.writer.close()
+
+
+class ServidorChatAsync:
+    """Servidor de chat que atiende a todos los clientes en un bucle de eventos"""
+
+    def __init__(self, host=HOST, puerto=PUERTO,
+                 capacidad_cola=CAPACIDAD_POR_DEFECTO, politica_cola=DESCARTAR_ANTIGUO,
+                 protocolo=CRUDO, nivel_compresion=NIVEL_COMPRESION, ventana_coalescencia=0.0,
+                 capacidad_historial=CAPACIDAD_HISTORIAL, bitacora=None, retencion_bitacora=RETENCION_BYTES,
+                 antiguedad_bitacora=RETENCION_SEGUNDOS, inactividad=TIEMPO_INACTIVIDAD,
+                 intervalo_ping=INTERVALO_PING, puerto_metricas=None, ruta_bus=None):
+        self.host = host
+        self.puerto = puerto
+        self.capacidad_cola = capacidad_cola
+        self.politica_cola = politica_cola
+        self.protocolo = protocolo
+        self.ventana_coalescencia = ventana_coalescencia
+        self.puerto_metricas = puerto_metricas
+        # Con ruta_bus el proceso es un trabajador del modo multiproceso
+        self.ruta_bus = ruta_bus
+        # Los locks de las salas nunca se disputan: todo ocurre en el hilo del bucle
+        self.servicio = ServicioChat(self.crear_difusor, protocolo, capacidad_historial, nivel_compresion)
+        if bitacora:
+            # Un trabajador del modo multiproceso solo lee: escribe el central
+            recuperados = self.servicio.restaurar(BitacoraChat(
+                bitacora, retencion_bytes=retencion_bitacora, retencion_segundos=antiguedad_bitacora,
+                solo_lectura=bool(ruta_bus)
+            ))
+            print(f"Bitácora: {bitacora} ({recuperados} mensajes recuperados)")
+        # Una sola rueda de temporizadores para todas las conexiones
+        self.vigilante = VigilanteInactividad(inactividad, intervalo_ping, protocolo)
+
+    def crear_difusor(self, obtener_miembros):
+        """Cada sala tiene su propio difusor, programado en el bucle de eventos"""
+        return DifusorAsync(obtener_miembros, self.ventana_coalescencia, self.cliente_rechazado)
+
+    async def iniciar(self):
+        """Abre el socket de escucha y atiende clientes indefinidamente"""
+        ajustar_limite_descriptores()
+        if self.ruta_bus:
+            bus = ConexionBusAsync(self.ruta_bus, self.servicio.aplicar_evento)
+            await bus.conectar()
+            self.servicio.conectar_bus(bus)
+            bus.escuchar()
+        if self.puerto_metricas:
+            self.servicio.registrar_metricas()
+            iniciar_servidor_metricas(self.host, self.puerto_metricas)
+        servidor = await asyncio.start_server(
+            self.manejar_cliente_chat,
+            self.host,
+            self.puerto,
+            reuse_address=True,
+            reuse_port=bool(self.ruta_bus),
+            backlog=socket.SOMAXCONN
+        )
+        asyncio.ensure_future(self.vigilar_colas())
+        if self.vigilante.activo:
+            asyncio.ensure_future(self.vigilar_inactividad())
+        print(f"Inactividad: /ping tras {self.vigilante.intervalo_ping:g} s, "
+              f"cierre tras {self.vigilante.inactividad:g} s (0 = desactivado)")
+        print("Servidor de chat (asyncio) iniciado. Esperando usuarios...")
+        async with servidor:
+            await servidor.serve_forever()
+
+    async def manejar_cliente_chat(self, reader, writer):
+        """
+        Maneja un cliente del chat como corrutina (equivalente a manejar_cliente_chat)
+        """
+        direccion_cliente = writer.get_extra_info('peername')
+        cliente = ClienteAsync(
+            reader, writer, direccion_cliente, self.capacidad_cola, self.politica_cola
+        )
+        reensamblador = Reensamblador(self.protocolo)
+        nombre_cliente = None
+        self.vigilante.vigilar(cliente)
+
+        try:
+            # Pedir nombre del usuario (la misma lectura puede traer ya mensajes de chat)
+            cliente.enviar(codificar("Ingresa tu nombre: ", self.protocolo))
+            mensajes = await self.recibir_mensajes(cliente, reensamblador)
+            # Antes del nombre puede negociar capacidades y, si se reconecta, pedir solo lo que se perdió
+            preambulo = {}
+            while separar_preambulo(mensajes, preambulo):
+                mensajes = await self.recibir_mensajes(cliente, reensamblador)
+            if not mensajes:
+                return  # se fue (o se lo cerró por inactividad) antes de dar su nombre
+            desde = self.servicio.atender_preambulo(cliente, preambulo)
+            nombre_cliente = mensajes.pop(0).strip()
+
+            if not nombre_cliente:
+                nombre_cliente = f"Usuario_{direccion_cliente[1]}"
+
+            # Alta en la sala por defecto, aviso a la sala, bienvenida e historial
+            nombre_cliente = self.servicio.registrar(cliente, nombre_cliente, desde)
+
+            # Bucle principal del chat: cada lectura puede traer varios mensajes
+            while True:
+                if not mensajes:
+                    mensajes = await self.recibir_mensajes(cliente, reensamblador)
+                if not mensajes or not self.servicio.procesar_mensajes(cliente, mensajes):
+                    break
+                mensajes = []
+
+        except TramaInvalida as e:
+            registro.aviso("Trama inválida de '%s': %s", nombre_cliente, e)
+        except (ConnectionError, UnicodeDecodeError) as e:
+            registro.error("Error con usuario '%s': %s", nombre_cliente, e)
+        finally:
+            self.vigilante.olvidar(cliente)
+            self.servicio.retirar(cliente)
+            await cliente.cerrar()
+
+    async def recibir_mensajes(self, cliente, reensamblador):
+        """Lee hasta tener al menos un mensaje completo ([] si se cerró)"""
+        while True:
+            datos = await cliente.reader.read(tamano_lectura(self.protocolo))
+            if not datos:
+                return []
+            # Cualquier dato (también un /pong) prueba que la conexión sigue viva
+            cliente.ultima_actividad = time.monotonic()
+            metricas.incrementar("chat_bytes_entrada_total", len(datos))
+            mensajes = reensamblador.alimentar(datos)
+            if mensajes:
+                return mensajes
+
+    def cliente_rechazado(self, cliente):
+        # Política "desconectar": su corrutina lo dará de baja de su sala
+        registro.aviso("Cliente %s desconectado (cola de salida llena)", cliente.nombre)
+
+    async def vigilar_colas(self):
+        """Reporta periódicamente a los clientes que se están quedando atrás"""
+        while True:
+            await asyncio.sleep(INTERVALO_REPORTE_COLAS)
+            for nombre, (pendientes, descartados) in self.servicio.profundidad_colas().items():
+                if pendientes >= self.capacidad_cola // 2 or descartados:
+                    registro.aviso("Cliente lento '%s': %d/%d en cola, %d descartados",
+                                   nombre, pendientes, self.capacidad_cola, descartados)
+
+    async def vigilar_inactividad(self):
+        """Hace girar la rueda de temporizadores: un tic por ranura para todas las conexiones"""
+        while True:
+            await asyncio.sleep(self.vigilante.rueda.resolucion)
+            self.vigilante.revisar()
+
+
+def ajustar_limite_descriptores():
+    """Eleva el límite de archivos abiertos al máximo permitido (un socket por cliente)"""
+    if resource is None:
+        return
+    suave, duro = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if duro == resource.RLIM_INFINITY or suave < duro:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (duro, duro))
+        except (ValueError, OSError):
+            return
+        print(f"Límite de descriptores elevado de {suave} a {duro}")
+
+
+def iniciar_servidor_async(host=HOST, puerto=PUERTO, **opciones):
+    """Punto de entrada del modo asyncio"""
+    print("=== SERVIDOR DE CHAT (ASYNCIO) ===")
+    print(f"Iniciando servidor de chat en {host}:{puerto}")
+
+    servidor = ServidorChatAsync(host, puerto, **opciones)
+    try:
+        asyncio.run(servidor.iniciar())
+    except KeyboardInterrupt:
+        print("\nServidor de chat interrumpido")
+    except Exception as e:
+        print(f"Error del servidor: {e}")
+    finally:
+        print("Servidor de chat cerrado")
+
+
+if __name__ == "__main__":
+    iniciar_servidor_async()